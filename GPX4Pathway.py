@@ -1,11 +1,8 @@
-from pylab import *
 from pysb.core import * # brings in all of the Python classes needed to define a PySB model
 from pysb.bng import *
-from pysb.integrate import *
 from pysb.macros import equilibrate, catalyze
-import matplotlib.pyplot as plt
 import numpy as np
-from pysb.simulator import ScipyOdeSimulator # Simulating an ODE with SciPy
+from model_factory import ModelFactory
 
 # instantiate a model
 Model()
@@ -112,30 +109,33 @@ Observable('Liperox_rad_unbound_obs', Liperox(b2GPX4=None, state='rad') ** Cyto)
 Observable('Liperox_red_unbound_obs', Liperox(b2GPX4=None, state='red') ** Cyto)
 Observable('GPX4_GSH_Liperox_bound_obs', GSH(b1GPX4=1, state='ox') ** Cyto % GPX4(b1GSH=1, b2Liperox=2, state='a') ** Cyto % Liperox(b2GPX4=2, state='red') ** Cyto)
 
-generate_equations(model)
-generate_network(model)
-print(model.species)
-
-tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
-result = ScipyOdeSimulator(model, tspan=tspan).run() # run solver of model
-
-plt.figure()
-plt.plot(tspan, result.observables['Liperox_red_unbound_obs'][:], lw = 1.5, label = 'Liperox_red_unbound_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of Lipid alcohol produced [# of molecules]', fontsize=14)
-plt.title('Lipid alcohol molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-plt.figure()
-plt.plot(tspan, result.observables['Liperox_rad_unbound_obs'][:], lw = 1.5, label = 'Liperox_rad_unbound_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of Liperoxides produced [# of molecules]', fontsize=14)
-plt.title('Liperoxide molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-
-
+# the network is generated and the ODEs compiled on first use, not on import; the network is stiff,
+# so its default simulator is the sparse-LU BDF path
+get_model = ModelFactory(model, stiff=True)
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    get_model(equations=True)
+    print(model.species)
+
+    tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
+    result = get_model.simulator(tspan).run() # run solver of model
+
+    plt.figure()
+    plt.plot(tspan, result.observables['Liperox_red_unbound_obs'][:], lw = 1.5, label = 'Liperox_red_unbound_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of Lipid alcohol produced [# of molecules]', fontsize=14)
+    plt.title('Lipid alcohol molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+    plt.figure()
+    plt.plot(tspan, result.observables['Liperox_rad_unbound_obs'][:], lw = 1.5, label = 'Liperox_rad_unbound_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of Liperoxides produced [# of molecules]', fontsize=14)
+    plt.title('Liperoxide molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
@@ -1,11 +1,8 @@
-from pylab import *
 from pysb.core import * # brings in all of the Python classes needed to define a PySB model
 from pysb.bng import *
-from pysb.integrate import *
 from pysb.macros import equilibrate, catalyze
-import matplotlib.pyplot as plt
 import numpy as np
-from pysb.simulator import ScipyOdeSimulator # Simulating an ODE with SciPy
+from model_factory import ModelFactory
 
 # instantiate a model
 Model()
@@ -182,46 +179,52 @@ Observable('FFA_rad_obs', FFA(b1=None, state="rad") ** PM)
 Observable('GPX4_GSH_Lipid_alcohol_complex_obs', GSH(b1GPX4=1, state='ox') ** PM % GPX4(b1GSH=1, b2PUFA_PL=2, state='a') ** PM % PUFA_PL(b2GPX4=2, state='lipid_alcohol') ** PM)
 Observable('PUFA_PL_lipid_alcohol_obs', PUFA_PL(b2GPX4=None, state="lipid_alcohol") ** PM)
 
-generate_equations(model, verbose=True)
-generate_network(model)
-# print(model.species)
-
-tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
-result = ScipyOdeSimulator(model, tspan=tspan).run() # run solver of model
-
-plt.figure()
-plt.plot(tspan, result.observables['PUFA_PL_lipid_alcohol_obs'][:], lw = 1.5, label = 'Lipid alcohol molecules') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of Lipid alcohol produced [# of molecules]', fontsize=14)
-plt.title('Lipid alcohol molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-plt.figure()
-plt.plot(tspan, result.observables['STEAP3_obs'][:], lw = 1.5, label = 'STEAP3_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of STEAP3_obs produced [# of molecules]', fontsize=14)
-plt.title('STEAP3_obs molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-
-plt.figure()
-plt.plot(tspan, result.observables['PUFA_PL_liperox_obs'][:], lw = 1.5, label = 'PUFA_PL_liperox_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of Liperox produced [# of molecules]', fontsize=14)
-plt.title('PUFA_PL_liperox_obs')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-plt.figure()
-plt.plot(tspan, result.observables['GPX4_unbound_inactive_obs'][:], lw = 1.5, label = 'GPX4_unbound_inactive_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of GPX4 unbound inactive produced [# of molecules]', fontsize=14)
-plt.title('GPX4_unbound_inactive_obs')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
+# the network is generated and the ODEs compiled on first use, not on import; the network is stiff,
+# so its default simulator is the sparse-LU BDF path
+get_model = ModelFactory(model, stiff=True)
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    generate_equations(model, verbose=True)
+    # print(model.species)
+
+    tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
+    result = get_model.simulator(tspan).run() # run solver of model
+
+    plt.figure()
+    plt.plot(tspan, result.observables['PUFA_PL_lipid_alcohol_obs'][:], lw = 1.5, label = 'Lipid alcohol molecules') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of Lipid alcohol produced [# of molecules]', fontsize=14)
+    plt.title('Lipid alcohol molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+    plt.figure()
+    plt.plot(tspan, result.observables['STEAP3_obs'][:], lw = 1.5, label = 'STEAP3_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of STEAP3_obs produced [# of molecules]', fontsize=14)
+    plt.title('STEAP3_obs molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+
+    plt.figure()
+    plt.plot(tspan, result.observables['PUFA_PL_liperox_obs'][:], lw = 1.5, label = 'PUFA_PL_liperox_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of Liperox produced [# of molecules]', fontsize=14)
+    plt.title('PUFA_PL_liperox_obs')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+    plt.figure()
+    plt.plot(tspan, result.observables['GPX4_unbound_inactive_obs'][:], lw = 1.5, label = 'GPX4_unbound_inactive_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of GPX4 unbound inactive produced [# of molecules]', fontsize=14)
+    plt.title('GPX4_unbound_inactive_obs')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
@@ -1,8 +1,14 @@
-from lolabrotation1.ferroptosis import model
+from lolabrotation1.ferroptosis import get_model
 from opt2q.noise import NoiseModel
+from parameter_template import ParameterTemplate
+from multicore_simulator import MulticoreSimulator, core_group
+
+model = get_model(equations=True)  # network comes from the on-disk cache when available
 
 sample_size = 10
 # size of my heterogeneous cell population
+n_evaluators = 4
+# processes evaluating the likelihood at once; each simulates its cells on its own share of the cores
 
 # ------- Data -------
 script_dir = os.path.dirname(__file__)
@@ -46,8 +52,19 @@ NoiseModel.default_sample_size = sample_size
 noise = NoiseModel(param_mean=param_m, param_covariance=param_cov)
 parameters = noise.run()
 
+# The likelihood writes x straight into this template's mean and covariance arrays, and draws the cells from them,
+# instead of building new DataFrames for the noise model on every evaluation. The cells come from fixed scrambled
+# Sobol points in antithetic pairs, so the likelihood changes smoothly with x rather than with every new draw
+template = ParameterTemplate(['kc0', 'kc2', 'kf3', 'kc3', 'kf4', 'kr7', 'L_0'], experimental_conditions,
+                             apply_noise=['kc0', 'kc2', 'kc3'], fixed={'L_0': cell_viability['Dose (uM)'].values},
+                             log10_means=['kc0', 'kc2', 'kf3', 'kc3', 'kf4', 'kr7'], cv=['kc2', 'kc3'],
+                             correlations=[('kc2', 'kc3')], sample_size=sample_size, seed=0, sampling='sobol',
+                             antithetic=True)
+
 # ------- Simulate dynamics -------
-sim = Simulator(model=model, param_values=parameters, solver='cupsoda')
+sim = Simulator(model=model, param_values=parameters, solver='scipyode')
+# integrate the cell population on the CPU cores, in place of the cupsoda GPU solver
+sim.sim = MulticoreSimulator(model, param_values=parameters)
 results = sim.run(np.linspace(0, 3600*5, 100))
 
 # ------- Measurement model -------
@@ -78,16 +95,9 @@ fk.process.set_params(**measurement_model_params_)
 # -------- likelihood function -----------
 @objective_function(noise_model=noise, simulator=sim, measurement_model=fk, return_results=False, evals=0)
 def likelihood_fn(x):
-    kc0_ = 10 ** x[0]                           # :  [(-7,  -3),    float  kc0
-    kc2_ = 10 ** x[1]                           # :   (-5,   1),    float  kc2
-    kf3_ = 10 ** x[2]                           # :   (-11, -6),    float  kf3
-    kc3_ = 10 ** x[3]                           # :   (-5,   1),    float  kc3
-    kf4_ = 10 ** x[4]                           # :   (-10, -4),    float  kf4
-    kr7_ = 10 ** x[5]                           # :   (-8,   4),    float  kr7
-
-    kc2_cv_ = x[6]                              # :   (0, 1),       float  kc2_cv
-    kc3_cv_ = x[7]                              # :   (0, 1),       float  kc3_cv
-    kc2_kc3_cor_ = x[8]                         # :   (-1, 1)       float  kc2_kc3_cor
+    # x[0:6]: log10 kc0 (-7, -3), kc2 (-5, 1), kf3 (-11, -6), kc3 (-5, 1), kf4 (-10, -4), kr7 (-8, 4)
+    # x[6:9]: kc2_cv (0, 1), kc3_cv (0, 1), kc2_kc3_cor (-1, 1)
+    template.update(x)
 
     viability_coef = np.array([[x[9],          # :  (-100, 100),   float
                                 x[10],         # :  (-100, 100),   float
@@ -96,41 +106,15 @@ def likelihood_fn(x):
                                 x[13]]])       # :  (-100, 100),   float
     viability_intercept = np.array([x[14]])    # :  (-10, 10)]     float
 
-    # Each process selects one of the 4 gpu
-    process_id = current_process().ident % 4
-
-    k_val = pd.DataFrame([['kc0', kc0_, True],
-                          ['kc2', kc2_, True],  # co-vary with kc3
-                          ['kf3', kf3_, False],
-                          ['kc3', kc3_, True],
-                          ['kf4', kf4_, False],
-                          ['kr7', kr7_, False]],
-                         columns=['param', 'value', 'apply_noise']) \
-        .iloc[np.repeat(range(6), len_ec)]  # Repeat for each of the experimental treatments
-
-    lig = pd.DataFrame(cell_viability['Dose (uM)'].values, columns=['value'])
-    lig['param'] = 'L_0'
-    lig['apply_noise'] = False
-
-    param_mean = pd.concat([k_val, lig], sort=False, ignore_index=True)
-    param_mean['Dose (uM)'] = np.tile(cell_viability['Dose (uM)'].values, 7)
-
-    kc2_var_, kc3_var_, kc2_kc3_cov_ = ((kc2_ * kc2_cv_) ** 2, (kc3_ * kc3_cv_) ** 2, kc2_ * kc2_cv_ * kc3_ * kc3_cv_ * kc2_kc3_cor_)
-    param_covariance = pd.DataFrame([['kc2', 'kc2', kc2_var_],
-                                     ['kc3', 'kc3', kc3_var_],
-                                     ['kc2', 'kc3', kc2_kc3_cov_]],  # Covariance between 'kf3' and kf4'
-                                    columns=['param_i', 'param_j', 'value'])
-
     measurement_model_params = {'classifier__coefficients__viability__coef_': viability_coef,
                                 'classifier__coefficients__viability__intercept_': viability_intercept}
 
-    likelihood_fn.noise_model.update_values(param_mean=param_mean,
-                                            param_covariance=param_covariance)
-
-    simulator_parameters = likelihood_fn.noise_model.run()
-    likelihood_fn.simulator.param_values = simulator_parameters
+    # the cells, drawn in place into template.frame, which is laid out as the noise model's run() output
+    template.sample()
+    likelihood_fn.simulator.param_values = template.frame
 
-    likelihood_fn.simulator.sim.gpu = [process_id]
+    # Each process simulates on its own group of cores
+    likelihood_fn.simulator.sim.cores = core_group(n_evaluators)
     sim_results = likelihood_fn.simulator.run(np.linspace(0, 5000, 100))
 
     likelihood_fn.measurement_model.update_simulation_result(sim_results)
@@ -0,0 +1,271 @@
+"""Choose an integrator and tolerances for a model by probing it.
+
+The model scripts all run ``ScipyOdeSimulator`` with its default settings,
+whether the model is the small necroptosis chain or the stiff ferroptosis
+network. :func:`autotune` instead:
+
+1. simulates a few representative parameter sets with a tight-tolerance
+   reference (the sparse BDF integrator at ``rtol = atol = 1e-10``)
+2. estimates stiffness from the Jacobian eigenvalues along the reference
+   trajectories, and drops the explicit candidates (``dopri5``) when the
+   stiffness ratio is above ``stiff_ratio``: their step is bounded by the
+   fastest time scale, so they would crawl, or fail, where the implicit
+   ones take long steps
+3. runs every remaining candidate at successively tighter tolerances until
+   its observables match the reference to within ``target``, built exactly
+   as :func:`simulator_options` will build the chosen one
+4. picks the candidate that does so fastest per parameter set
+
+The choice is cached in a JSON file, keyed by the model's network, the output
+times, the target and the parameter region (the decade of each parameter of
+the probe sets' geometric mean), so later runs on that region reuse it.
+:meth:`model_factory.ModelFactory.tuned_simulator` builds the chosen
+simulator.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from batched_simulator import BatchedOdeSimulator
+from network_cache import cache_dir, model_hash
+
+EXPLICIT_INTEGRATORS = ('dopri5',)
+SCIPY_INTEGRATORS = ('vode', 'lsoda') + EXPLICIT_INTEGRATORS
+INTEGRATORS = SCIPY_INTEGRATORS + ('rosenbrock', 'bdf', 'radau')
+RTOLS = (1e-3, 1e-4, 1e-5, 1e-6, 1e-7, 1e-8)
+REFERENCE_TOLERANCE = 1e-10
+
+
+def cache_path():
+    """JSON file holding the tuned configurations, next to the network cache"""
+    return os.environ.get('AUTOTUNE_CACHE', os.path.join(os.path.dirname(cache_dir().rstrip(os.sep)),
+                                                         'autotune.json'))
+
+
+def probe_sets(model, param_values=None, n_probe=8, seed=0):
+    """Representative parameter sets: a sample of ``param_values``, or the model's with rates perturbed"""
+    rng = np.random.default_rng(seed)
+    if param_values is not None:
+        param_values = np.atleast_2d(np.asarray(param_values, dtype=float))
+        if len(param_values) <= n_probe:
+            return param_values
+        return param_values[np.sort(rng.choice(len(param_values), n_probe, replace=False))]
+    values = np.array([p.value for p in model.parameters])
+    rates = model.parameters_rules()
+    mask = np.array([p in rates for p in model.parameters])
+    sets = np.repeat(values[np.newaxis], n_probe, axis=0)
+    # the first set is the model's own
+    sets[1:, mask] *= 10 ** rng.normal(0, 0.25, (n_probe - 1, mask.sum()))
+    return sets
+
+
+def region_key(param_values):
+    """Decade of each parameter of the sets' geometric mean"""
+    with np.errstate(divide='ignore'):
+        logs = np.log10(np.abs(np.asarray(param_values, dtype=float)))
+    center = np.where(np.isfinite(logs), logs, -99).mean(axis=0)
+    return hashlib.sha1(np.floor(center).astype(np.int64).tobytes()).hexdigest()[:12]
+
+
+def stiffness(network, param_values, trajectories, n_samples=5):
+    """Jacobian eigenvalue time scales along (n_sets, n_times, n_species) trajectories
+
+    Returns
+    -------
+    dict
+        ``fastest``: largest decay rate |Re(lambda)| seen; ``ratio``: median
+        over sets and sampled times of fastest over slowest non-zero decay
+        rate; ``fast_steps``: fastest time scales across the output span,
+        about the steps an explicit method would need
+    """
+    k = network.rate_constants(param_values)
+    n_sets, n_t = trajectories.shape[:2]
+    fastest, ratios = 0.0, []
+    for j in np.unique(np.linspace(0, n_t - 1, n_samples).astype(int)):
+        y = trajectories[:, j]
+        good = np.all(np.isfinite(y), axis=1)
+        if not good.any():
+            continue
+        rates = np.abs(np.linalg.eigvals(network.jacobian(k[good], y[good])).real)
+        top = rates.max(axis=1)
+        fastest = max(fastest, top.max())
+        for row, high in zip(rates, top):
+            low = row[row > 1e-12 * max(high, 1e-300)]
+            if low.size:
+                ratios.append(high / low.min())
+    return {'fastest': float(fastest), 'ratio': float(np.median(ratios)) if ratios else 1.0}
+
+
+def _simulator(model, tspan, candidate):
+    simulator_class, options = simulator_options(candidate)
+    return simulator_class(model, tspan=tspan, **options)
+
+
+def _observables(result, n_sets):
+    names = [obs.name for obs in result._model.observables]
+    records = result.observables if n_sets > 1 else [result.observables]
+    return np.array([[record[name] for name in names] for record in records], dtype=float)
+
+
+def relative_error(observables, reference):
+    """Largest deviation from the reference, relative to each observable's range over the probe sets
+
+    Observables that stay below a millionth of the largest one are held to
+    that millionth instead of their own range.
+    """
+    scale = np.nanmax(np.abs(reference), axis=(0, 2), keepdims=True)
+    scale = np.maximum(scale, 1e-6 * max(np.nanmax(scale), 1e-300))
+    error = np.abs(observables - reference) / scale
+    return float(np.inf) if np.isnan(error).any() else float(error.max())
+
+
+def autotune(model, tspan, param_values=None, target=1e-3, integrators=INTEGRATORS, rtols=RTOLS,
+             stiff_ratio=1e3, n_probe=8, seed=0, cache=True, verbose=False):
+    """Integrator and tolerances that simulate ``model`` within ``target`` fastest
+
+    Parameters
+    ----------
+    model : pysb.Model
+    tspan : np.ndarray
+        Output times
+    param_values : np.ndarray, optional
+        Parameter sets the simulator will run; a sample of them is probed.
+        By default the model's parameters, with rates perturbed.
+    target : float
+        Largest error allowed in any observable, relative to its range
+    integrators : sequence of str
+        Candidates: ``'vode'`` (ScipyOdeSimulator's default), ``'lsoda'``
+        and the explicit ``'dopri5'`` run by ScipyOdeSimulator, and the
+        BatchedOdeSimulator integrators ``'rosenbrock'``, ``'bdf'`` and
+        ``'radau'``
+    rtols : sequence of float
+        Relative tolerances tried, loosest first, each with ``atol = rtol``
+    stiff_ratio : float
+        Stiffness ratio above which the explicit candidates are skipped
+    n_probe : int
+        Parameter sets probed
+    cache : bool
+        Reuse, and store, the result in :func:`cache_path`
+
+    Returns
+    -------
+    dict
+        ``integrator``, ``rtol``, ``atol``, ``error`` (relative to the
+        reference), ``seconds_per_set`` (its expected cost), ``stiffness``
+        (see :func:`stiffness`) and every ``candidates`` result, skipped
+        ones with the reason in ``skipped``
+    """
+    tspan = np.asarray(tspan, dtype=float)
+    sets = probe_sets(model, param_values, n_probe, seed)
+    key = '%s-%s-%g-%g-%d-%g-%g-%s' % (model.name, model_hash(model)[:16], tspan[0], tspan[-1], len(tspan),
+                                       target, stiff_ratio, region_key(sets))
+    if cache:
+        tuned = _load_cache().get(key)
+        if tuned is not None and set(tuned['tried']) >= set(integrators):
+            if verbose:
+                print(report(tuned))
+            return tuned
+
+    reference_simulator = BatchedOdeSimulator(model, tspan=tspan, integrator='bdf', rtol=REFERENCE_TOLERANCE,
+                                              atol=REFERENCE_TOLERANCE)
+    start = time.perf_counter()
+    reference_result = reference_simulator.run(param_values=sets)
+    reference_seconds = time.perf_counter() - start
+    reference = _observables(reference_result, len(sets))
+    stiff = stiffness(reference_simulator.network, sets, reference_result.species_array)
+    stiff['fast_steps'] = stiff['fastest'] * (tspan[-1] - tspan[0])
+
+    candidates = []
+    for integrator in integrators:
+        if integrator in EXPLICIT_INTEGRATORS and stiff['ratio'] > stiff_ratio:
+            candidates.append({'integrator': integrator, 'seconds_per_set': np.inf, 'error': np.inf,
+                               'skipped': 'stiffness ratio %.3g above %g' % (stiff['ratio'], stiff_ratio)})
+            if verbose:
+                print('  %-10s skipped: %s' % (integrator, candidates[-1]['skipped']))
+            continue
+        for rtol in rtols:
+            atol = rtol
+            candidate = {'integrator': integrator, 'rtol': rtol, 'atol': atol}
+            try:
+                simulator = _simulator(model, tspan, candidate)
+                simulator.run(param_values=sets[:1])  # compile and warm up outside the timing
+                start = time.perf_counter()
+                result = simulator.run(param_values=sets)
+                candidate['seconds_per_set'] = (time.perf_counter() - start) / len(sets)
+                candidate['error'] = relative_error(_observables(result, len(sets)), reference)
+            except Exception as error:  # a failed integration just disqualifies the candidate
+                candidate.update(seconds_per_set=np.inf, error=np.inf, failure=repr(error))
+            candidates.append(candidate)
+            if verbose:
+                print('  %-10s rtol %-6g error %-10.3g %.4f s per set' % (
+                    integrator, rtol, candidate['error'], candidate['seconds_per_set']))
+            # tighter tolerances only cost more
+            if candidate['error'] <= target:
+                break
+
+    passing = [c for c in candidates if c['error'] <= target]
+    if passing:
+        best = min(passing, key=lambda c: c['seconds_per_set'])
+    else:
+        # nothing met the target: the reference settings always do
+        best = {'integrator': 'bdf', 'rtol': REFERENCE_TOLERANCE, 'atol': REFERENCE_TOLERANCE, 'error': 0.0,
+                'seconds_per_set': reference_seconds / len(sets)}
+    tuned = dict(best, model=model.name, target=target, n_probe=len(sets), stiffness=stiff,
+                 candidates=candidates, tried=list(integrators))
+    if cache:
+        _store_cache(key, tuned)
+    if verbose:
+        print(report(tuned))
+    return tuned
+
+
+def report(tuned):
+    """One-paragraph summary of an :func:`autotune` result"""
+    stiff = tuned['stiffness']
+    return ('%s: %s, rtol %g, atol %g; error %.2g of the range (target %g), about %.4f s per parameter set.\n'
+            'Stiffness: fastest decay rate %.3g (%.3g time scales over the output span), median stiffness ratio '
+            '%.3g.' % (tuned['model'], tuned['integrator'], tuned['rtol'], tuned['atol'], tuned['error'],
+                       tuned['target'], tuned['seconds_per_set'], stiff['fastest'], stiff['fast_steps'],
+                       stiff['ratio']))
+
+
+def simulator_options(tuned):
+    """Simulator class and keyword arguments of an :func:`autotune` result"""
+    if tuned['integrator'] in SCIPY_INTEGRATORS:
+        from pysb.simulator import ScipyOdeSimulator
+        return ScipyOdeSimulator, {'integrator': tuned['integrator'],
+                                   'integrator_options': {'rtol': tuned['rtol'], 'atol': tuned['atol']}}
+    return BatchedOdeSimulator, {'integrator': tuned['integrator'], 'rtol': tuned['rtol'], 'atol': tuned['atol']}
+
+
+def _load_cache():
+    try:
+        with open(cache_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_cache(key, tuned):
+    path = cache_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    entries = _load_cache()
+    entries[key] = tuned
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(entries, f, indent=1)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    import importlib
+
+    tspan = np.linspace(0, 1440, 1441)
+    for name in ('necroptosis', 'GPX4Pathway', 'IronPathway', 'lolabrotation1.ferroptosis'):
+        print(name)
+        autotune(importlib.import_module(name).get_model(equations=True), tspan, verbose=True)
@@ -0,0 +1,149 @@
+"""Archive of the optima found by a multi-start campaign.
+
+Most restarts of a calibration campaign converge to one of a few parameter
+basins. A :class:`BasinArchive` records each optimum found, merging optima
+that lie within ``radius`` of each other (in the log10 parameter space the
+swarms search) into one basin. The campaign's parent process adds every
+finished restart to it and saves it next to the results; the workers reload
+it as it changes and use it in two ways:
+
+* :class:`BasinStop` ends a restart whose swarm best has stayed inside a
+  known basin, without beating it, for ``patience`` iterations. The swarm
+  would only rediscover that basin.
+* :meth:`BasinArchive.sample_unexplored` places the initial particles of
+  later restarts outside the known basins, so the evaluations stopped
+  restarts leave over go to regions no restart has converged in yet.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+
+class BasinArchive(object):
+    """Known basins, their best position and cost, and how often each was found
+
+    Parameters
+    ----------
+    radius : float
+        Optima closer than this (Euclidean distance) belong to one basin
+    path : str, optional
+        ``.npz`` file the archive is saved to and reloaded from
+    """
+
+    def __init__(self, radius, path=None):
+        self.radius = radius
+        self.path = path
+        self.positions = None
+        self.costs = np.empty(0)
+        self.counts = np.empty(0, dtype=int)
+        self.saved_evaluations = 0
+        """Evaluations not spent because restarts stopped in known basins"""
+        self._mtime = None
+        if path is not None and os.path.exists(path):
+            self.reload()
+
+    def __len__(self):
+        return len(self.costs)
+
+    def find(self, position):
+        """Index of the basin ``position`` lies in, or None"""
+        if not len(self):
+            return None
+        distances = np.linalg.norm(self.positions - position, axis=1)
+        i = np.argmin(distances)
+        return i if distances[i] <= self.radius else None
+
+    def add(self, position, cost, saved_evaluations=0):
+        """Record an optimum; returns the index of its basin"""
+        position = np.asarray(position, dtype=float)
+        self.saved_evaluations += saved_evaluations
+        i = self.find(position)
+        if i is None:
+            self.positions = position[np.newaxis] if self.positions is None else np.vstack([self.positions, position])
+            self.costs = np.append(self.costs, cost)
+            self.counts = np.append(self.counts, 1)
+            return len(self) - 1
+        self.counts[i] += 1
+        if cost < self.costs[i]:
+            self.positions[i], self.costs[i] = position, cost
+        return i
+
+    def sample_unexplored(self, lower, upper, n, rng, max_tries=100):
+        """``n`` uniform positions within the bounds and outside every known basin
+
+        Positions still inside a basin after ``max_tries`` draws are kept.
+        """
+        positions = rng.uniform(lower, upper, (n, len(lower)))
+        for _ in range(max_tries):
+            inside = np.array([self.find(p) is not None for p in positions], dtype=bool)
+            if not inside.any():
+                break
+            positions[inside] = rng.uniform(lower, upper, (inside.sum(), len(lower)))
+        return positions
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, radius=self.radius, costs=self.costs, counts=self.counts,
+                     saved_evaluations=self.saved_evaluations,
+                     positions=np.empty((0, 0)) if self.positions is None else self.positions)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def reload(self):
+        """Load the archive from its file if it changed since last loaded"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with np.load(self.path) as data:
+            self.costs, self.counts = data['costs'], data['counts']
+            self.positions = data['positions'] if len(self.costs) else None
+            self.saved_evaluations = int(data['saved_evaluations'])
+        self._mtime = mtime
+
+    def report(self):
+        """Basins by cost: one line each with cost, times found and position"""
+        lines = ['%d basins, %d restarts, %d evaluations saved by stopping in known basins'
+                 % (len(self), self.counts.sum(), self.saved_evaluations)]
+        for i in np.argsort(self.costs):
+            lines.append('%10.4f  %5d  %s' % (self.costs[i], self.counts[i],
+                                             np.array2string(self.positions[i], precision=3)))
+        return '\n'.join(lines)
+
+
+class BasinStop(object):
+    """``stop`` callback for :meth:`ParallelPSO.run` ending restarts in known basins
+
+    Parameters
+    ----------
+    archive : BasinArchive
+        Reloaded from its file every iteration, if it has one
+    patience : int
+        Iterations the swarm best has to stay in a basin, no better than
+        the basin's best cost, before the restart is stopped
+    """
+
+    def __init__(self, archive, patience=10):
+        self.archive = archive
+        self.patience = patience
+        self.basin = None
+        self._inside = 0
+
+    def __call__(self, optimizer):
+        if self.archive.path is not None:
+            self.archive.reload()
+        basin = None if optimizer.best is None else self.archive.find(optimizer.best)
+        if basin is None or optimizer.best_fitness < self.archive.costs[basin]:
+            self._inside = 0
+            return False
+        self._inside = self._inside + 1 if basin == self.basin else 1
+        self.basin = basin
+        return self._inside >= self.patience
+
+    def __repr__(self):
+        return 'BasinStop(radius=%g, patience=%d)' % (self.archive.radius, self.patience)
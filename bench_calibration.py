@@ -0,0 +1,318 @@
+"""Time-to-target benchmarks of the necroptosis calibration.
+
+Runs the calibration of pso_necroptosis (the MLKLp cost against the
+x100/y100 data) with several optimizer configurations, each for the same
+seeds. Every call of the cost function is traced, so each run gives its best
+cost against wall-clock time and against the number of cost evaluations.
+From those, :func:`summarize` reports for each configuration and cost
+threshold:
+
+* the share of seeds that reached the threshold
+* the median and quartile time, and evaluation count, they needed
+* the final best costs
+
+Replicates run in parallel, one per worker process. Each worker builds its
+simulator before it is timed. Runs can be capped by evaluations or seconds
+(``max_evaluations``, ``max_seconds``), so that optimizers with different
+generation sizes are compared on equal budgets::
+
+    python bench_calibration.py --configs pso-25 pso-50 de --seeds 8 --max-evaluations 2500 \\
+        --output calibration.json --plot calibration.png
+"""
+import argparse
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from parallel_pso import evaluation_pool
+
+
+class BudgetExhausted(Exception):
+    """Raised by :class:`TracedCost` to end a run at its evaluation or time budget"""
+
+
+class TracedCost(object):
+    """Batched cost function that records the best cost after every call
+
+    Parameters
+    ----------
+    cost_function : callable
+        (n, n_dims) positions to n costs
+    max_evaluations : int, optional
+        Evaluations after which the run is ended
+    max_seconds : float, optional
+        Seconds after which the run is ended
+
+    Attributes
+    ----------
+    seconds, evaluations, best : list
+        After each call: time since the first call started, evaluations so
+        far, best cost so far
+    """
+
+    def __init__(self, cost_function, max_evaluations=None, max_seconds=None):
+        self.cost_function = cost_function
+        self.max_evaluations = max_evaluations
+        self.max_seconds = max_seconds
+        self.seconds, self.evaluations, self.best = [], [], []
+        self.best_position = None
+        self._start = None
+
+    def __call__(self, positions):
+        if self._start is None:
+            self._start = time.perf_counter()
+        done = self.evaluations[-1] if self.evaluations else 0
+        if (self.max_evaluations is not None and done >= self.max_evaluations) or \
+                (self.max_seconds is not None and self.seconds and self.seconds[-1] >= self.max_seconds):
+            raise BudgetExhausted()
+        positions = np.atleast_2d(positions)
+        costs = np.asarray(self.cost_function(positions), dtype=float)
+        best = self.best[-1] if self.best else np.inf
+        finite = np.where(np.isfinite(costs), costs, np.inf)
+        if len(finite) and finite.min() < best:
+            best = finite.min()
+            self.best_position = positions[np.argmin(finite)].tolist()
+        self.seconds.append(time.perf_counter() - self._start)
+        self.evaluations.append(done + len(positions))
+        self.best.append(best)
+        return costs
+
+
+class PSOConfig(object):
+    """pso_necroptosis.make_optimizer's swarm with the given size and iterations"""
+
+    def __init__(self, num_particles=25, num_iterations=100, stopping_rules=True):
+        self.num_particles = num_particles
+        self.num_iterations = num_iterations
+        self.stopping_rules = stopping_rules
+
+    def __call__(self, seed, cost):
+        import pso_necroptosis
+        optimizer = pso_necroptosis.make_optimizer(seed)
+        optimizer.cost_function = optimizer.bounded_cost_function = None
+        optimizer.batch_cost_function = cost
+        if not self.stopping_rules:
+            optimizer.set_stopping_rules()
+        optimizer.run(self.num_particles, self.num_iterations)
+
+    def __repr__(self):
+        return 'PSOConfig(%d, %d, stopping_rules=%s)' % (self.num_particles, self.num_iterations,
+                                                         self.stopping_rules)
+
+
+class DifferentialEvolution(object):
+    """scipy's differential evolution within the swarm's bounds, a generation per cost call"""
+
+    def __init__(self, popsize=15, maxiter=100, mutation=(0.5, 1.0), recombination=0.7):
+        self.popsize = popsize
+        self.maxiter = maxiter
+        self.mutation = mutation
+        self.recombination = recombination
+
+    def __call__(self, seed, cost):
+        import scipy.optimize
+        import pso_necroptosis
+        swarm = pso_necroptosis.make_optimizer(seed)
+        scipy.optimize.differential_evolution(
+            lambda x: cost(x.T), list(zip(swarm.lb, swarm.ub)), popsize=self.popsize, maxiter=self.maxiter,
+            mutation=self.mutation, recombination=self.recombination, seed=seed, polish=False,
+            vectorized=True, updating='deferred', tol=0)
+
+    def __repr__(self):
+        return 'DifferentialEvolution(popsize=%d, maxiter=%d)' % (self.popsize, self.maxiter)
+
+
+class RandomSearch(object):
+    """Uniform samples within the swarm's bounds, ``batch`` per cost call"""
+
+    def __init__(self, batch=25, n_batches=100):
+        self.batch = batch
+        self.n_batches = n_batches
+
+    def __call__(self, seed, cost):
+        import pso_necroptosis
+        swarm = pso_necroptosis.make_optimizer(seed)
+        rng = np.random.default_rng(seed)
+        for _ in range(self.n_batches):
+            cost(rng.uniform(swarm.lb, swarm.ub, (self.batch, len(swarm.lb))))
+
+    def __repr__(self):
+        return 'RandomSearch(batch=%d, n_batches=%d)' % (self.batch, self.n_batches)
+
+
+CONFIGS = {
+    'pso-25': PSOConfig(25, 100),
+    'pso-25-no-stop': PSOConfig(25, 100, stopping_rules=False),
+    'pso-50': PSOConfig(50, 50),
+    'pso-100': PSOConfig(100, 25),
+    'de': DifferentialEvolution(popsize=15, maxiter=100),
+    'random': RandomSearch(25, 100),
+}
+
+
+def _init_worker():
+    import pso_necroptosis
+    pso_necroptosis.init_worker()
+
+
+def run_replicate(config, seed, cost='batch', max_evaluations=None, max_seconds=None):
+    """Run ``config`` for ``seed`` and return its trace
+
+    ``cost`` is ``'batch'`` for pso_necroptosis.obj_function_batch, or
+    ``'single'`` for obj_function called once per position.
+    """
+    import pso_necroptosis
+    if cost == 'batch':
+        function = pso_necroptosis.obj_function_batch
+    elif cost == 'single':
+        def function(positions):
+            return np.array([pso_necroptosis.obj_function(p)[0] for p in positions])
+    else:
+        raise ValueError("cost must be 'batch' or 'single'")
+    traced = TracedCost(function, max_evaluations=max_evaluations, max_seconds=max_seconds)
+    start = time.perf_counter()
+    try:
+        config(seed, traced)
+    except BudgetExhausted:
+        pass
+    return {'seed': seed, 'wall_seconds': time.perf_counter() - start, 'seconds': traced.seconds,
+            'evaluations': traced.evaluations, 'best': traced.best, 'best_position': traced.best_position}
+
+
+def run_benchmark(configs, seeds, cost='batch', max_evaluations=None, max_seconds=None, num_processors=None,
+                  verbose=True):
+    """Run every configuration for every seed
+
+    Parameters
+    ----------
+    configs : dict
+        Configurations by name: callables ``config(seed, cost)`` that
+        optimize the batched ``cost``, e.g. :class:`PSOConfig`
+    seeds : list of int
+        Seeds, the same for every configuration
+
+    Returns
+    -------
+    dict
+        Traces of every run by configuration name, in seed order
+    """
+    runs = {name: [None] * len(seeds) for name in configs}
+    with evaluation_pool(num_processors, initializer=_init_worker) as pool:
+        futures = {pool.submit(run_replicate, config, seed, cost, max_evaluations, max_seconds): (name, i)
+                   for name, config in configs.items() for i, seed in enumerate(seeds)}
+        for future, (name, i) in futures.items():
+            runs[name][i] = run = future.result()
+            if verbose:
+                print('%-16s seed %-4d best %.4f after %d evaluations, %.1f s'
+                      % (name, run['seed'], run['best'][-1] if run['best'] else np.nan,
+                         run['evaluations'][-1] if run['evaluations'] else 0, run['wall_seconds']))
+    return runs
+
+
+def time_to_threshold(run, threshold):
+    """Seconds and evaluations until the best cost of ``run`` first reached ``threshold``, or None"""
+    reached = np.flatnonzero(np.asarray(run['best']) <= threshold)
+    if not reached.size:
+        return None
+    return run['seconds'][reached[0]], run['evaluations'][reached[0]]
+
+
+def summarize(runs, thresholds):
+    """Time-to-threshold statistics and final costs of each configuration"""
+    summary = {}
+    for name, replicates in runs.items():
+        final = np.array([run['best'][-1] if run['best'] else np.inf for run in replicates])
+        entry = {'final_best': {'min': final.min(), 'median': float(np.median(final)), 'max': final.max()},
+                 'evaluations': int(np.median([run['evaluations'][-1] if run['evaluations'] else 0
+                                               for run in replicates])),
+                 'wall_seconds': float(np.median([run['wall_seconds'] for run in replicates])),
+                 'thresholds': {}}
+        for threshold in thresholds:
+            hits = [hit for hit in (time_to_threshold(run, threshold) for run in replicates) if hit is not None]
+            stats = {'reached': len(hits) / float(len(replicates))}
+            if hits:
+                seconds, evaluations = np.array(hits).T
+                stats.update({'seconds': np.percentile(seconds, [25, 50, 75]).tolist(),
+                              'evaluations': np.percentile(evaluations, [25, 50, 75]).tolist()})
+            entry['thresholds']['%g' % threshold] = stats
+        summary[name] = entry
+    return summary
+
+
+def print_summary(summary):
+    for name, entry in summary.items():
+        print('%s: final best %.4f (median, range %.4f-%.4f), %d evaluations, %.1f s'
+              % (name, entry['final_best']['median'], entry['final_best']['min'], entry['final_best']['max'],
+                 entry['evaluations'], entry['wall_seconds']))
+        for threshold, stats in entry['thresholds'].items():
+            if 'seconds' in stats:
+                print('  cost <= %-8s %3.0f%% of seeds, median %.1f s (IQR %.1f-%.1f), %d evaluations'
+                      % (threshold, 100 * stats['reached'], stats['seconds'][1], stats['seconds'][0],
+                         stats['seconds'][2], stats['evaluations'][1]))
+            else:
+                print('  cost <= %-8s not reached' % threshold)
+
+
+def _on_grid(xs, ys, grid):
+    # best cost so far at each grid point: the last value recorded at or before it
+    at = np.searchsorted(xs, grid, side='right') - 1
+    return np.where(at >= 0, np.asarray(ys)[np.maximum(at, 0)], np.nan)
+
+
+def plot_curves(runs, path=None):
+    """Median best cost, with quartile bands, against wall-clock time and evaluations"""
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5))
+    for ax, axis, label in zip(axes, ('seconds', 'evaluations'), ('Wall-clock time [s]', 'Cost evaluations')):
+        end = max(run[axis][-1] for replicates in runs.values() for run in replicates if run[axis])
+        grid = np.linspace(0, end, 400)
+        for name, replicates in runs.items():
+            curves = np.array([_on_grid(run[axis], run['best'], grid) for run in replicates if run[axis]])
+            # no run has a cost yet at the start of the grid
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                lo, median, hi = np.nanpercentile(curves, [25, 50, 75], axis=0)
+            line, = ax.plot(grid, median, lw=1.5, label=name)
+            ax.fill_between(grid, lo, hi, color=line.get_color(), alpha=0.2, linewidth=0)
+        ax.set_xlabel(label)
+        ax.set_ylabel('Best cost')
+        ax.set_yscale('log')
+    axes[0].legend(loc='best')
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path)
+    return fig
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--configs', nargs='+', default=['pso-25', 'pso-50', 'de'], choices=sorted(CONFIGS))
+    parser.add_argument('--seeds', type=int, default=8, help='seeds 0 .. n-1 for every configuration')
+    parser.add_argument('--cost', default='batch', choices=['batch', 'single'])
+    parser.add_argument('--max-evaluations', type=int)
+    parser.add_argument('--max-seconds', type=float)
+    parser.add_argument('--thresholds', nargs='+', type=float, default=[0.5, 0.4, 0.37])
+    parser.add_argument('--processes', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', help='write the traces and summary to this JSON file')
+    parser.add_argument('--plot', help='save the best-cost curves to this image')
+    args = parser.parse_args(argv)
+
+    configs = {name: CONFIGS[name] for name in args.configs}
+    runs = run_benchmark(configs, list(range(args.seeds)), cost=args.cost, max_evaluations=args.max_evaluations,
+                         max_seconds=args.max_seconds, num_processors=args.processes)
+    summary = summarize(runs, args.thresholds)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'configs': {name: repr(config) for name, config in configs.items()},
+                       'settings': vars(args), 'summary': summary, 'runs': runs}, f, indent=1)
+    if args.plot:
+        plot_curves(runs, args.plot)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
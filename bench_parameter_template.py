@@ -0,0 +1,147 @@
+"""Per-evaluation overhead of the Opt2Q likelihood's parameter handling.
+
+Times, per ``x``, what Opt2QcalibrationHCT116CV.likelihood_fn does before
+simulating:
+
+* ``dataframes``: the DataFrames it used to build (``k_val`` with
+  ``.iloc[np.repeat(...)]``, ``lig``, ``pd.concat``, the covariance table)
+* ``noise_model``: those plus ``NoiseModel.update_values`` and ``run``,
+  when Opt2Q is installed
+* ``template``: :meth:`ParameterTemplate.update` and ``sample``, which
+  replace both
+
+and, for each sampling mode of the template, how far the mean of each
+noisy parameter over the cells of a condition is from its true mean
+(RMS relative error over seeds), and how much the cells jump when
+``log10 kc2`` changes by 1e-6 (largest relative change over 1e-6; about
+ln 10 when the cells move smoothly with ``x``).
+
+::
+
+    python bench_parameter_template.py --data SuiX_et_al_2018_HCT116_Ferroptosis_Data.csv
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from parameter_template import SAMPLING, ParameterTemplate
+
+NAMES = ['kc0', 'kc2', 'kf3', 'kc3', 'kf4', 'kr7']
+X = np.array([-5, -2, -7.5, -2, -6, -2, 0.2, 0.2, 0.25])
+
+
+def dataframes(x, doses):
+    """The parameter mean and covariance DataFrames likelihood_fn built for ``x``"""
+    kc0_, kc2_, kf3_, kc3_, kf4_, kr7_ = 10 ** x[:6]
+    kc2_cv_, kc3_cv_, kc2_kc3_cor_ = x[6:9]
+    k_val = pd.DataFrame([['kc0', kc0_, True],
+                          ['kc2', kc2_, True],
+                          ['kf3', kf3_, False],
+                          ['kc3', kc3_, True],
+                          ['kf4', kf4_, False],
+                          ['kr7', kr7_, False]],
+                         columns=['param', 'value', 'apply_noise']) \
+        .iloc[np.repeat(range(6), len(doses))]
+    lig = pd.DataFrame(doses, columns=['value'])
+    lig['param'] = 'L_0'
+    lig['apply_noise'] = False
+    param_mean = pd.concat([k_val, lig], sort=False, ignore_index=True)
+    param_mean['Dose (uM)'] = np.tile(doses, 7)
+    kc2_var_, kc3_var_, kc2_kc3_cov_ = ((kc2_ * kc2_cv_) ** 2, (kc3_ * kc3_cv_) ** 2,
+                                        kc2_ * kc2_cv_ * kc3_ * kc3_cv_ * kc2_kc3_cor_)
+    param_covariance = pd.DataFrame([['kc2', 'kc2', kc2_var_],
+                                     ['kc3', 'kc3', kc3_var_],
+                                     ['kc2', 'kc3', kc2_kc3_cov_]],
+                                    columns=['param_i', 'param_j', 'value'])
+    return param_mean, param_covariance
+
+
+def make_template(doses, sample_size, **kwargs):
+    return ParameterTemplate(NAMES + ['L_0'], pd.DataFrame({'Dose (uM)': doses}), apply_noise=['kc0', 'kc2', 'kc3'],
+                             fixed={'L_0': doses}, log10_means=NAMES, cv=['kc2', 'kc3'],
+                             correlations=[('kc2', 'kc3')], sample_size=sample_size, **kwargs)
+
+
+def per_call(function, repeats):
+    """Best of 5 mean seconds per call over ``repeats`` calls"""
+    best = np.inf
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            function()
+        best = min(best, (time.perf_counter() - start) / repeats)
+    return best
+
+
+def run(doses, sample_size=10, repeats=200):
+    """Seconds per evaluation of each path, by name"""
+    x = X.copy()
+    results = {'dataframes': per_call(lambda: dataframes(x, doses), repeats)}
+    try:
+        from opt2q.noise import NoiseModel
+    except ImportError:
+        NoiseModel = None
+    if NoiseModel is not None:
+        NoiseModel.default_sample_size = sample_size
+        noise = NoiseModel(*dataframes(x, doses))
+
+        def noise_model():
+            param_mean, param_covariance = dataframes(x, doses)
+            noise.update_values(param_mean=param_mean, param_covariance=param_covariance)
+            return noise.run()
+
+        results['noise_model'] = per_call(noise_model, repeats)
+    template = make_template(doses, sample_size)
+
+    def sample():
+        template.update(x)
+        return template.sample()
+
+    results['template'] = per_call(sample, repeats)
+    return results
+
+
+def sampling_error(doses, sample_size=10, seeds=100, **kwargs):
+    """RMS relative error of the noisy parameters' population means, and the cells' jump for a tiny step in x"""
+    x = X.copy()
+    errors = []
+    for seed in range(seeds):
+        template = make_template(doses, sample_size, seed=seed, **kwargs)
+        template.update(x)
+        cells = template.sample()[:, template.noisy].reshape(len(doses), sample_size, -1)
+        errors.append(cells.mean(axis=1) / template.mean[:, template.noisy] - 1)
+    template = make_template(doses, sample_size, seed=0, **kwargs)
+    template.update(x)
+    before = template.sample()[:, template.noisy]
+    step = x.copy()
+    step[1] += 1e-6
+    template.update(step)
+    jump = np.max(np.abs(template.sample()[:, template.noisy] / before - 1)) / 1e-6
+    return np.sqrt(np.mean(np.square(errors))), jump
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data', help="cell viability CSV with a 'Dose (uM)' column (default: 6 doses)")
+    parser.add_argument('--sample-size', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args(argv)
+    doses = pd.read_csv(args.data)['Dose (uM)'].values if args.data else np.array([0., 1, 2, 5, 10, 20])
+    results = run(doses, args.sample_size, args.repeats)
+    for name, seconds in results.items():
+        print('%-12s %9.1f us per evaluation' % (name, 1e6 * seconds))
+    if 'noise_model' not in results:
+        print('(Opt2Q is not installed: noise_model not timed)')
+    print('%-22s %12s %12s' % ('sampling', 'mean error', 'jump'))
+    for sampling in SAMPLING:
+        for antithetic in (False, True):
+            error, jump = sampling_error(doses, args.sample_size, sampling=sampling, antithetic=antithetic)
+            print('%-22s %12.4f %12.3g' % (sampling + (' antithetic' if antithetic else ''), error, jump))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
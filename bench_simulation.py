@@ -0,0 +1,245 @@
+"""Simulation benchmarks for every model in the repository.
+
+Times, for necroptosis, GPX4Pathway, IronPathway, lolabrotation1.ferroptosis
+and the zombie_apocalypse ODE:
+
+* ``import``: importing the model module, in a fresh interpreter
+* ``network``: generating its reaction network with BNG (an empty network
+  cache) and loading it from the cache
+* ``compile``: building a simulator
+* ``simulate``: running an ensemble, for every combination of output times,
+  ensemble size, integrator and tolerance asked for
+
+Each case is run ``repeats`` times and its best time kept. Results are
+written as JSON; ``--compare baseline.json`` reports every case that became
+slower than the baseline by more than ``--threshold`` and exits with status 1
+if there is one::
+
+    python bench_simulation.py --output baseline.json
+    python bench_simulation.py --output new.json --compare baseline.json
+
+ScipyOdeSimulator runs with its default compiler, cython when it works,
+as the model scripts do; the report's ``meta`` records which was used.
+
+Ensembles are the model's parameters with every rate constant scaled by a
+random factor (log10-normal, sd 0.1, fixed seed); the zombie ensemble varies
+the initial population instead.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+MODELS = ('necroptosis', 'GPX4Pathway', 'IronPathway', 'lolabrotation1.ferroptosis', 'zombie_apocalypse')
+PYSB_MODELS = MODELS[:4]
+INTEGRATORS = ('scipyode', 'rosenbrock', 'bdf')
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+_IMPORT_SCRIPT = """
+import importlib, sys, time
+sys.path.insert(0, %r)
+start = time.perf_counter()
+module = importlib.import_module(%r)
+imported = time.perf_counter()
+if hasattr(module, 'get_model'):
+    module.get_model(equations=True)
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def best_of(function, repeats):
+    """Best and all wall times of ``repeats`` calls of ``function``"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), times
+
+
+def _fresh_process(name, cache_dir):
+    env = dict(os.environ, NETWORK_CACHE_DIR=cache_dir)
+    output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT % (_HERE, name)], env=env)
+    imported, network = output.decode().split()[-2:]
+    return float(imported), float(network)
+
+
+def bench_import(name, repeats):
+    """Import time, and network generation time without and with a cached network"""
+    cold, warm, imports = [], [], []
+    for _ in range(repeats):
+        cache_dir = tempfile.mkdtemp(prefix='bench-networks-')
+        imported, network = _fresh_process(name, cache_dir)
+        imports.append(imported)
+        cold.append(network)
+        warm.append(_fresh_process(name, cache_dir)[1])
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    cases = [('import', {}, imports)]
+    if name in PYSB_MODELS:
+        cases += [('network', {'cache': 'cold'}, cold), ('network', {'cache': 'warm'}, warm)]
+    return cases
+
+
+def ensemble(model, n_sets, seed=0):
+    """(n_sets, n_parameters) parameter values around the model's, rate constants perturbed"""
+    values = np.array([p.value for p in model.parameters])
+    rates = model.parameters_rules()
+    mask = np.array([p in rates for p in model.parameters])
+    param_values = np.repeat(values[np.newaxis], n_sets, axis=0)
+    rng = np.random.default_rng(seed)
+    param_values[:, mask] *= 10 ** rng.normal(0, 0.1, (n_sets, mask.sum()))
+    return param_values
+
+
+def make_simulator(model, tspan, integrator, rtol):
+    if integrator == 'scipyode':
+        from pysb.simulator import ScipyOdeSimulator
+        return ScipyOdeSimulator(model, tspan=tspan, integrator_options={'rtol': rtol, 'atol': rtol})
+    from batched_simulator import BatchedOdeSimulator
+    return BatchedOdeSimulator(model, tspan=tspan, integrator=integrator, rtol=rtol, atol=rtol)
+
+
+def bench_pysb(name, n_times, sizes, integrators, rtols, repeats):
+    model = importlib.import_module(name).get_model(equations=True)
+    t_end = 1440.0
+    cases = []
+    for n_t in n_times:
+        tspan = np.linspace(0, t_end, n_t)
+        for integrator in integrators:
+            for rtol in rtols:
+                simulators = []
+                params = {'integrator': integrator, 'rtol': rtol, 'n_times': n_t}
+                cases.append(('compile', params, best_of(
+                    lambda: simulators.append(make_simulator(model, tspan, integrator, rtol)), repeats)[1]))
+                simulator = simulators[-1]
+                for n_sets in sizes:
+                    param_values = ensemble(model, n_sets)
+                    times = best_of(lambda: simulator.run(param_values=param_values), repeats)[1]
+                    cases.append(('simulate', dict(params, n_sets=n_sets), times))
+    return cases
+
+
+def bench_zombie(n_times, sizes, rtols, repeats):
+    import zombie_apocalypse as zombie
+    cases = []
+    for n_t in n_times:
+        tspan = np.linspace(0, 5., n_t)
+        for rtol in rtols:
+            for n_sets in sizes:
+                y0 = np.array(zombie.y0) * np.linspace(0.5, 1.5, n_sets)[:, np.newaxis] if n_sets > 1 else \
+                    np.array([zombie.y0])
+
+                def run():
+                    for y in y0:
+                        zombie.odeint(zombie.f, y, tspan, rtol=rtol, atol=rtol)
+
+                cases.append(('simulate', {'integrator': 'odeint', 'rtol': rtol, 'n_times': n_t, 'n_sets': n_sets},
+                              best_of(run, repeats)[1]))
+    return cases
+
+
+def case_key(model, stage, params):
+    return '/'.join([stage, model] + ['%s=%s' % item for item in sorted(params.items())])
+
+
+def run_benchmarks(models=MODELS, n_times=(101, 1001), sizes=(1, 100), integrators=INTEGRATORS,
+                   rtols=(1e-5, 1e-8), repeats=3, verbose=True):
+    """Run every benchmark and return the report as a dict ready for JSON"""
+    results = {}
+    for name in models:
+        cases = bench_import(name, repeats)
+        if name == 'zombie_apocalypse':
+            cases += bench_zombie(n_times, sizes, rtols, repeats)
+        else:
+            cases += bench_pysb(name, n_times, sizes, integrators, rtols, repeats)
+        for stage, params, times in cases:
+            key = case_key(name, stage, params)
+            results[key] = dict(params, model=name, stage=stage, seconds=min(times), times=times)
+            if verbose:
+                print('%-80s %10.4f s' % (key, min(times)))
+    return {'meta': metadata(repeats), 'results': results}
+
+
+def scipyode_compiler():
+    """Compiler ScipyOdeSimulator uses by default, as the scripts run it: the first of pysb's that works"""
+    from pysb.simulator.scipyode import _rhs_builders
+    for name, builder in _rhs_builders.items():
+        if builder.check_safe():
+            return name
+    return None
+
+
+def metadata(repeats):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=_HERE,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pysb
+    import scipy
+    return {'timestamp': datetime.datetime.now().isoformat(), 'commit': commit, 'repeats': repeats,
+            'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'pysb': pysb.__version__, 'scipyode_compiler': scipyode_compiler(), 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare(report, baseline, threshold=0.2):
+    """Cases in both reports, as (key, baseline seconds, seconds, ratio), and the keys that slowed down"""
+    rows, slower = [], []
+    for key, result in sorted(report['results'].items()):
+        if key not in baseline['results']:
+            continue
+        before = baseline['results'][key]['seconds']
+        ratio = result['seconds'] / before if before > 0 else np.inf
+        rows.append((key, before, result['seconds'], ratio))
+        if ratio > 1 + threshold:
+            slower.append(key)
+    return rows, slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=MODELS)
+    parser.add_argument('--n-times', nargs='+', type=int, default=[101, 1001])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 100])
+    parser.add_argument('--integrators', nargs='+', default=list(INTEGRATORS), choices=INTEGRATORS)
+    parser.add_argument('--rtols', nargs='+', type=float, default=[1e-5, 1e-8])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown flagged in the comparison (default 0.2)')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.models, args.n_times, args.sizes, args.integrators, args.rtols, args.repeats)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, slower = compare(report, baseline, args.threshold)
+        compilers = baseline['meta'].get('scipyode_compiler'), report['meta']['scipyode_compiler']
+        if compilers[0] != compilers[1]:
+            print('warning: the baseline ran ScipyOdeSimulator with the %s compiler, this run with %s'
+                  % compilers)
+        print('\n%-80s %10s %10s %7s' % ('case', 'baseline', 'now', 'ratio'))
+        for key, before, after, ratio in rows:
+            print('%-80s %10.4f %10.4f %6.2fx%s' % (key, before, after, ratio, '  SLOWER' if key in slower else ''))
+        print('%d of %d cases slower by more than %d%%' % (len(slower), len(rows), 100 * args.threshold))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
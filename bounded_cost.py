@@ -0,0 +1,129 @@
+"""Early termination of calibration simulations whose cost is already too high.
+
+The calibration scripts score a simulated observable, rescaled to 0-1 over its
+trajectory, against normalized data by the sum of squared errors. The rescaling
+is an increasing affine map that is only known once the whole trajectory is,
+but whatever it turns out to be, it maps the points simulated so far into 0-1,
+so their error is at least that of the best such map. The remaining points
+can only add to it. :class:`CostBound` evaluates this bound each time the
+batched integrator passes a data time and abandons the parameter sets whose
+bound already exceeds the cost they have to beat.
+"""
+import numpy as np
+
+
+def normalized_sse_bound(ydata, ysim, n_points):
+    """Lower bound on ``sum((ydata - normalize(ysim)) ** 2)`` from a prefix of ``ysim``
+
+    Parameters
+    ----------
+    ydata : np.ndarray
+        Normalized data, shape (n_sets, n_t) or (n_t,)
+    ysim : np.ndarray
+        Simulated observable, shape (n_sets, n_t); only the first
+        ``n_points`` of each row are read
+    n_points : np.ndarray
+        Number of simulated points known for each set
+
+    Returns
+    -------
+    np.ndarray
+        Least squared error over the known points of any rescaling that maps
+        them into 0-1; the exact cost once every point is known
+    """
+    n_t = ysim.shape[1]
+    n_points = np.asarray(n_points)
+    known = np.arange(n_t) < n_points[:, None]
+    d = np.where(known, np.broadcast_to(ydata, ysim.shape), 0.0)
+    y = np.where(known, ysim, np.nan)
+    y_min = np.nanmin(y, axis=1, keepdims=True)
+    y_range = np.nanmax(y, axis=1, keepdims=True) - y_min
+    # position of each known point between the lowest and highest known so far
+    r = np.where(known & (y_range > 0), (y - y_min) / np.where(y_range > 0, y_range, 1.0), 0.0)
+    p, q = np.where(known, 1.0 - r, 0.0), r
+    # whatever the full trajectory, the lowest and highest known points are
+    # rescaled to some u <= v in 0-1, and the rest linearly in between:
+    # minimise sum((d - u * p - v * q) ** 2) over 0 <= u <= v <= 1
+    spp, spq, sqq = np.sum(p * p, 1), np.sum(p * q, 1), np.sum(q * q, 1)
+    spd, sqd, sdd = np.sum(p * d, 1), np.sum(q * d, 1), np.sum(d * d, 1)
+
+    def sse(u, v):
+        return sdd - 2 * u * spd - 2 * v * sqd + u * u * spp + 2 * u * v * spq + v * v * sqq
+
+    def ratio(a, b):
+        return np.where(b > 0, a / np.where(b > 0, b, 1.0), 0.0)
+
+    det = spp * sqq - spq ** 2
+    u = ratio(spd * sqq - sqd * spq, det)
+    v = ratio(sqd * spp - spd * spq, det)
+    interior = np.where((det > 0) & (0 <= u) & (u <= v) & (v <= 1), sse(u, v), np.inf)
+    # the best point on each edge of the triangle
+    on_u0 = sse(0.0, np.clip(ratio(sqd, sqq), 0, 1))
+    on_v1 = sse(np.clip(ratio(spd - spq, spp), 0, 1), 1.0)
+    w = np.clip(ratio(spd + sqd, n_points.astype(float)), 0, 1)
+    on_uv = sse(w, w)
+    lower = np.minimum(np.minimum(interior, on_u0), np.minimum(on_v1, on_uv))
+    # with the whole trajectory known the rescaling is fixed
+    lower = np.where(n_points >= n_t, sse(0.0, 1.0), lower)
+    return np.maximum(lower, 0.0)
+
+
+class CostBound(object):
+    """``stop`` callback for :meth:`BatchedOdeSimulator.run`
+
+    Parameters
+    ----------
+    observable : pysb.Observable or int
+        Observable compared to the data, its network must be generated; or
+        its column of the trajectories when the simulator is run with
+        ``outputs``
+    ydata : np.ndarray
+        Normalized data at each of the simulator's output times
+    bounds : np.ndarray
+        Cost each parameter set has to beat, e.g. its particle's personal
+        best; a set is abandoned once its lower bound exceeds it
+    check_every : int, optional
+        Bounds are checked once this many sets have reached new data
+        points, rather than after every step. A late check only stops a set
+        a little later; defaults to an eighth of the sets.
+
+    Attributes
+    ----------
+    values : np.ndarray
+        Observable at every output time reached, shape (n_sets, n_t)
+    aborted : np.ndarray
+        Sets that were abandoned
+    """
+
+    def __init__(self, observable, ydata, bounds, check_every=None):
+        if isinstance(observable, (int, np.integer)):
+            self.species, self.coefficients = np.array([observable]), np.ones(1)
+        else:
+            self.species = np.array(observable.species, dtype=int)
+            self.coefficients = np.array(observable.coefficients, dtype=float)
+        self.ydata = np.asarray(ydata, dtype=float)
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.values = np.full((len(self.bounds), len(self.ydata)), np.nan)
+        self.aborted = np.zeros(len(self.bounds), dtype=bool)
+        self.check_every = check_every or max(1, len(self.bounds) // 8)
+        self._n_out = np.zeros(len(self.bounds), dtype=int)
+        self._pending = np.zeros(len(self.bounds), dtype=bool)
+
+    def __call__(self, rows, n_out, trajectories):
+        self.values[rows] = trajectories[:, :, self.species].dot(self.coefficients)
+        self._n_out[rows] = n_out
+        self._pending[rows] = np.isfinite(self.bounds[rows])
+        pending = np.flatnonzero(self._pending & ~self.aborted)
+        if len(pending) < self.check_every:
+            return np.zeros(len(rows), dtype=bool)
+        self._pending[:] = False
+        lower = normalized_sse_bound(self.ydata, self.values[pending], self._n_out[pending])
+        self.aborted[pending[lower > self.bounds[pending]]] = True
+        # sets checked now but not passed in this step are stopped at their next one
+        return self.aborted[rows]
+
+    def costs(self, normalize):
+        """Final costs of the completed sets, inf for the abandoned ones"""
+        costs = np.sum((self.ydata - normalize(self.values, axis=1)) ** 2, axis=1)
+        costs[self.aborted] = np.inf
+        return costs
@@ -0,0 +1,192 @@
+"""Multi-start calibration campaigns that survive interruption.
+
+A campaign runs ``n_restarts`` independent PSO restarts, scheduled across a
+pool of worker processes. Each finished restart's best position and cost are
+written into memory-mapped ``.npy`` files as soon as the restart completes:
+
+``<output>.npy``
+    (n_restarts, n_dims) best positions, NaN until the restart has finished
+``<output>_cost.npy``
+    (n_restarts,) best cost of each restart, NaN until it has finished
+``<output>_swarms/restart_<i>.pkl``
+    swarm state of restart ``i`` saved every ``checkpoint_every`` iterations,
+    removed once the restart is finished
+``<output>_basins.npz``
+    archive of the optima found, if ``basin_radius`` is given
+
+Running the same campaign again skips the finished restarts and resumes the
+unfinished ones from their last swarm checkpoint. Restart ``i`` is seeded with
+``base_seed + i``, so a resumed campaign produces the same results as an
+uninterrupted one. Only the parent process writes to the result files.
+"""
+import os
+import pickle
+import tempfile
+from concurrent.futures import as_completed
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from basins import BasinArchive, BasinStop
+from parallel_pso import evaluation_pool
+
+
+def result_paths(output):
+    """Paths of the positions file, cost file and swarm checkpoint directory"""
+    if output.endswith('.npy'):
+        output = output[:-4]
+    return output + '.npy', output + '_cost.npy', output + '_swarms'
+
+
+def open_results(output, n_restarts=None, n_dims=None):
+    """Open (or create, if sizes are given) the memory-mapped result files
+
+    A positions file without its cost file is not a campaign's (e.g. a
+    saved set of best positions) and is never overwritten.
+    """
+    best_path, cost_path, _ = result_paths(output)
+    if os.path.exists(best_path) and not os.path.exists(cost_path):
+        raise IOError('%s exists without %s, so is not a campaign\'s results; choose another output'
+                      % (best_path, cost_path))
+    if os.path.exists(best_path) and os.path.exists(cost_path):
+        best = open_memmap(best_path, mode='r+')
+        cost = open_memmap(cost_path, mode='r+')
+        if n_restarts is not None and best.shape != (n_restarts, n_dims):
+            raise ValueError('%s holds a campaign of shape %s, not %s'
+                             % (best_path, best.shape, (n_restarts, n_dims)))
+        return best, cost
+    if n_restarts is None:
+        raise IOError('No campaign results at %s' % best_path)
+    best = open_memmap(best_path, mode='w+', dtype=float, shape=(n_restarts, n_dims))
+    cost = open_memmap(cost_path, mode='w+', dtype=float, shape=(n_restarts,))
+    best[:] = np.nan
+    cost[:] = np.nan
+    best.flush()
+    cost.flush()
+    return best, cost
+
+
+def load_results(output):
+    """Best positions and costs of the finished restarts of a campaign"""
+    best, cost = open_results(output)
+    done = ~np.isnan(cost)
+    return np.array(best[done]), np.array(cost[done])
+
+
+def _save_state(path, state):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _run_restart(make_optimizer, index, seed, num_particles, num_iterations, swarm_dir, checkpoint_every,
+                 basin_path=None, basin_radius=None, basin_patience=None):
+    optimizer = make_optimizer(seed)
+    path = os.path.join(swarm_dir, 'restart_%d.pkl' % index)
+    stop = None
+    if basin_radius is not None:
+        archive = BasinArchive(basin_radius, basin_path)
+        stop = BasinStop(archive, basin_patience)
+        if len(archive) and optimizer.lb is not None:
+            optimizer.set_initial_positions(archive.sample_unexplored(optimizer.lb, optimizer.ub, num_particles,
+                                                                      optimizer.rng))
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            optimizer.set_state(pickle.load(f))
+    optimizer.run(num_particles, num_iterations,
+                  checkpoint=lambda state: _save_state(path, state),
+                  checkpoint_every=checkpoint_every, stop=stop)
+    saved = (num_iterations - optimizer.iteration) * num_particles if optimizer.stopped else 0
+    # only stops in a known basin are the archive's doing; the optimizer's own stopping rules are counted apart
+    in_basin = stop is not None and optimizer.stopped_by == repr(stop)
+    return (index, optimizer.best, optimizer.best_fitness, saved if in_basin else 0, 0 if in_basin else saved,
+            optimizer.stopped_by, optimizer.iteration)
+
+
+def run_campaign(make_optimizer, n_restarts, output, num_particles, num_iterations, num_processors=None,
+                 initializer=None, initargs=(), checkpoint_every=10, base_seed=0, verbose=True,
+                 basin_radius=None, basin_patience=10):
+    """Run, or resume, a multi-start PSO campaign
+
+    Parameters
+    ----------
+    make_optimizer : callable
+        Module-level function taking a seed and returning a configured
+        :class:`parallel_pso.ParallelPSO` (cost function, start and bounds set)
+    n_restarts : int
+        Number of independent restarts
+    output : str
+        Prefix of the result files, see the module docstring
+    num_particles, num_iterations : int
+        Passed to :meth:`ParallelPSO.run` for every restart
+    num_processors : int, optional
+        Worker processes; restarts run one per worker at a time
+    initializer, initargs
+        Run once in each worker, e.g. to build its simulator
+    checkpoint_every : int
+        Iterations between swarm checkpoints of a running restart
+    base_seed : int
+        Restart ``i`` is seeded with ``base_seed + i``
+    basin_radius : float, optional
+        Keep an archive of the optima found in ``<output>_basins.npz`` (see
+        basins), stop restarts that settle in a known basin and start later
+        restarts outside the known basins. Restarts then depend on the order
+        in which earlier ones finished, so are no longer reproducible.
+    basin_patience : int
+        Iterations a swarm's best has to stay in a known basin to be stopped
+
+    Returns
+    -------
+    best, cost : np.memmap
+        Best position and cost of every restart
+    """
+    n_dims = len(make_optimizer(base_seed).start)
+    best, cost = open_results(output, n_restarts, n_dims)
+    _, _, swarm_dir = result_paths(output)
+    os.makedirs(swarm_dir, exist_ok=True)
+
+    archive = None
+    if basin_radius is not None:
+        archive = BasinArchive(basin_radius, result_paths(output)[0][:-4] + '_basins.npz')
+
+    remaining = np.flatnonzero(np.isnan(cost))
+    stopped_early = 0
+    if verbose:
+        print('campaign %s: %d of %d restarts finished' % (output, n_restarts - len(remaining), n_restarts))
+    with evaluation_pool(num_processors, initializer=initializer, initargs=initargs) as pool:
+        futures = [pool.submit(_run_restart, make_optimizer, i, base_seed + i, num_particles, num_iterations,
+                               swarm_dir, checkpoint_every, None if archive is None else archive.path, basin_radius,
+                               basin_patience)
+                   for i in remaining]
+        try:
+            for n, future in enumerate(as_completed(futures), 1):
+                i, position, fitness, saved, saved_early, stopped_by, iterations = future.result()
+                stopped_early += saved_early
+                if position is not None:
+                    best[i] = position
+                # a restart whose every evaluation failed is still finished
+                cost[i] = np.inf if np.isnan(fitness) else fitness
+                best.flush()
+                cost.flush()
+                if archive is not None and position is not None:
+                    archive.add(position, cost[i], saved)
+                    archive.save()
+                checkpoint = os.path.join(swarm_dir, 'restart_%d.pkl' % i)
+                if os.path.exists(checkpoint):
+                    os.remove(checkpoint)
+                if verbose:
+                    print('restart %d finished after %d iterations%s, cost %g, %d left'
+                          % (i, iterations, '' if stopped_by is None else ' (%s)' % stopped_by, cost[i],
+                             len(remaining) - n))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if not os.listdir(swarm_dir):
+        os.rmdir(swarm_dir)
+    if verbose:
+        print('%d evaluations saved by the optimizer\'s stopping rules' % stopped_early)
+        if archive is not None:
+            print(archive.report())
+    return best, cost
@@ -0,0 +1,175 @@
+"""Streaming ensemble simulation with online summary statistics.
+
+Simulating thousands of parameter sets at once holds every trajectory in
+memory. :func:`stream_ensemble` instead runs the sets in chunks sized to a
+memory budget and folds each chunk's observable trajectories into running
+statistics before the next chunk is simulated:
+
+* count, mean and variance at every time point (Chan et al.'s pairwise
+  update of Welford's algorithm), and min and max
+* quantiles, from a reservoir sample of whole trajectories of fixed size
+* optionally the trajectories themselves, appended to a
+  :class:`trajectory_store.TrajectoryStore`
+
+Memory use is set by the budget, which the reservoir and the chunks share,
+not by the number of parameter sets. Sets whose integration failed (NaN
+trajectories) are left out of the statistics at the time points they failed.
+"""
+import numpy as np
+
+from batched_simulator import BatchedOdeSimulator
+from ensemble_result import EnsembleResult
+
+
+class EnsembleStats(object):
+    """Running statistics of observable trajectories
+
+    Parameters
+    ----------
+    observables : list of str
+        Observable names
+    tspan : np.ndarray
+        Output times
+    reservoir_size : int
+        Trajectories kept for quantile estimates
+    seed : int, optional
+        Seed for the reservoir sampling
+    """
+
+    def __init__(self, observables, tspan, reservoir_size=2000, seed=None):
+        self.observables = list(observables)
+        self.tspan = np.asarray(tspan)
+        shape = (len(self.observables), len(self.tspan))
+        self.n_sets = 0
+        self.count = np.zeros(shape, dtype=int)
+        self.mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.reservoir = np.empty((reservoir_size,) + shape)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, trajectories):
+        """Fold in a (n_sets, n_observables, n_t) chunk of trajectories"""
+        chunk = np.asarray(trajectories, dtype=float)
+        valid = ~np.isnan(chunk)
+        n = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(chunk, axis=0) / n
+            m2 = np.nansum((chunk - mean) ** 2, axis=0)
+            total = self.count + n
+            delta = mean - self.mean
+            has = n > 0
+            self.mean = np.where(has, self.mean + delta * n / np.maximum(total, 1), self.mean)
+            self._m2 = np.where(has, self._m2 + m2 + delta ** 2 * self.count * n / np.maximum(total, 1), self._m2)
+        self.count = total
+        self.min = np.fmin(self.min, np.nanmin(np.where(valid, chunk, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(valid, chunk, -np.inf), axis=0))
+        self._sample(chunk)
+        self.n_sets += len(chunk)
+
+    def _sample(self, chunk):
+        # Algorithm R: the i-th trajectory seen replaces a random one of the
+        # k kept with probability k / (i + 1)
+        k = len(self.reservoir)
+        seen = self.n_sets + np.arange(len(chunk))
+        fill = seen < k
+        self.reservoir[seen[fill]] = chunk[fill]
+        rest = np.flatnonzero(~fill)
+        keep = rest[self._rng.random(len(rest)) < k / (seen[rest] + 1.0)]
+        for i, slot in zip(keep, self._rng.integers(0, k, len(keep))):
+            self.reservoir[slot] = chunk[i]
+
+    @property
+    def variance(self):
+        """Sample variance at every time point"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self._m2 / (self.count - 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def sample(self):
+        """The (n_kept, n_observables, n_t) trajectories of the reservoir"""
+        return self.reservoir[:min(self.n_sets, len(self.reservoir))]
+
+    def quantile(self, q):
+        """Quantile(s) ``q`` at every time point, estimated from the reservoir"""
+        return np.nanquantile(self.sample, q, axis=0)
+
+    def index(self, observable):
+        return self.observables.index(observable)
+
+
+def chunk_size(n_species, n_t, n_observables, memory_budget, keep_species=True):
+    """Parameter sets per chunk so that a chunk fits in ``memory_budget`` bytes
+
+    Counts the species trajectories (held twice, by the integrator and the
+    simulation result, unless only the observables are kept), the Jacobian
+    and its inverse, and the observables.
+    """
+    trajectories = 2 * n_t * n_species if keep_species else 0
+    per_set = 8 * (trajectories + 3 * n_species ** 2 + 2 * n_t * n_observables + 20 * n_species)
+    return max(1, int(memory_budget // per_set))
+
+
+def stream_ensemble(simulator, param_values, observables=None, memory_budget=256 * 2 ** 20,
+                    reservoir_size=None, store=None, seed=None, verbose=False):
+    """Simulate ``param_values`` in chunks and return their :class:`EnsembleStats`
+
+    Parameters
+    ----------
+    simulator : pysb.simulator.Simulator
+        Simulator of the model that runs several parameter sets per call,
+        e.g. a :class:`batched_simulator.BatchedOdeSimulator`
+    param_values : np.ndarray
+        (n_sets, n_parameters) parameter values; may be a memory-mapped array
+    observables : list of str, optional
+        Observables to summarise, all of the model's by default
+    memory_budget : int
+        Bytes the reservoir and the trajectories of one chunk may take
+    reservoir_size : int, optional
+        Trajectories kept for quantile estimates; by default as many as fit
+        in half the memory budget, up to 2000
+    store : trajectory_store.TrajectoryStore, optional
+        Append each chunk's trajectories to this store, keyed by their row
+        in ``param_values``
+    seed : int, optional
+        Seed for the reservoir sampling
+    """
+    model = simulator.model
+    if observables is None:
+        observables = [obs.name for obs in model.observables]
+    tspan = simulator.tspan
+    trajectory_bytes = 8 * len(observables) * len(tspan)
+    if reservoir_size is None:
+        reservoir_size = int(max(1, min(2000, memory_budget // 2 // trajectory_bytes)))
+    stats = EnsembleStats(observables, tspan, reservoir_size=reservoir_size, seed=seed)
+    # a BatchedOdeSimulator computes just the observables, unless the store keeps species
+    outputs = observables if isinstance(simulator, BatchedOdeSimulator) and (
+        store is None or store.n_species is None) else None
+    size = chunk_size(len(model.species), len(tspan), len(observables),
+                      max(memory_budget - reservoir_size * trajectory_bytes, 0), keep_species=outputs is None)
+    for start in range(0, len(param_values), size):
+        chunk = np.asarray(param_values[start:start + size])
+        result = simulator.run(param_values=chunk) if outputs is None else \
+            simulator.run(param_values=chunk, outputs=outputs)
+        if isinstance(result, EnsembleResult):
+            trajectories = np.stack([result.observable_view(name) for name in observables], axis=1)
+        else:
+            records = result.observables if len(chunk) > 1 else [result.observables]
+            trajectories = np.array([[record[name] for name in observables] for record in records])
+            del records
+        if store is not None:
+            species = None
+            if store.n_species is not None:
+                species = result.species_array if isinstance(result, EnsembleResult) else result.species
+            store.append(np.arange(start, start + len(chunk)), dict(zip(observables, trajectories.swapaxes(0, 1))),
+                         species=species, param_values=chunk)
+        del result
+        stats.update(trajectories)
+        if verbose:
+            print('%d of %d parameter sets simulated' % (stats.n_sets, len(param_values)))
+    return stats
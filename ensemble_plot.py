@@ -0,0 +1,221 @@
+"""Plots of large trajectory ensembles.
+
+Drawing every trajectory of an ensemble as its own line makes one matplotlib
+artist per trajectory and observable; for thousands of parameter sets the
+figure takes far longer to render than the ensemble takes to simulate. The
+functions here summarise an observable's trajectories instead:
+
+* :func:`density` bins the trajectories at every time point (and between
+  time points, by linear interpolation) and draws the counts as one image
+* :func:`percentile_bands` draws the median and shaded percentile bands
+
+:func:`ensemble_figure` draws a panel per observable, and
+:func:`stats_figure` does the same from the :class:`ensemble.EnsembleStats`
+of a streamed ensemble. Both can overlay data points and save the figure,
+which works with the non-interactive Agg backend (``MPLBACKEND=Agg``).
+"""
+import matplotlib.colors
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def normalize(trajectories):
+    """Rescale each (row) trajectory to 0-1"""
+    trajectories = np.asarray(trajectories, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ymin = np.nanmin(trajectories, axis=1, keepdims=True)
+        ymax = np.nanmax(trajectories, axis=1, keepdims=True)
+        return (trajectories - ymin) / (ymax - ymin)
+
+
+def density_counts(tspan, trajectories, bins=200, upsample=4, y_range=None):
+    """Histogram of (n_sets, n_times) trajectories at every time point
+
+    Each interval between output times is split into ``upsample`` steps,
+    linearly interpolated, so that steep trajectories leave a continuous
+    trace. NaN values are not counted.
+
+    Returns
+    -------
+    times : np.ndarray
+        The (n_times - 1) * upsample + 1 time points binned
+    edges : np.ndarray
+        The ``bins + 1`` bin edges
+    counts : np.ndarray
+        (bins, len(times)) trajectory counts
+    """
+    tspan = np.asarray(tspan, dtype=float)
+    y = np.asarray(trajectories, dtype=float)
+    fractions = np.arange(upsample) / float(upsample)
+    times = np.append((tspan[:-1, None] + np.diff(tspan)[:, None] * fractions).ravel(), tspan[-1])
+    fine = (y[:, :-1, None] + (y[:, 1:] - y[:, :-1])[:, :, None] * fractions).reshape(len(y), -1)
+    fine = np.concatenate([fine, y[:, -1:]], axis=1)
+    if y_range is None:
+        y_range = (np.nanmin(y), np.nanmax(y))
+    lower, upper = y_range
+    if not upper > lower:
+        upper = lower + 1.0
+    edges = np.linspace(lower, upper, bins + 1)
+    valid = np.isfinite(fine) & (fine >= lower) & (fine <= upper)
+    rows = np.minimum(((fine - lower) / (upper - lower) * bins).astype(int, copy=False), bins - 1)
+    columns = np.broadcast_to(np.arange(len(times)), fine.shape)
+    counts = np.bincount((rows[valid] * len(times) + columns[valid]), minlength=bins * len(times))
+    return times, edges, counts.reshape(bins, len(times))
+
+
+def density(ax, tspan, trajectories, bins=200, upsample=4, y_range=None, log=True, cmap='Blues'):
+    """Draw the density of (n_sets, n_times) trajectories on ``ax`` as an image
+
+    Parameters
+    ----------
+    bins : int
+        Bins along the y axis
+    upsample : int
+        Time points binned per output interval, see :func:`density_counts`
+    y_range : tuple, optional
+        (lower, upper) limits of the bins, the trajectories' range by default
+    log : bool
+        Logarithmic color scale, so rare trajectories stay visible next to
+        the bulk of the ensemble
+    """
+    times, edges, counts = density_counts(tspan, trajectories, bins=bins, upsample=upsample, y_range=y_range)
+    counts = np.ma.masked_equal(counts, 0)
+    norm = matplotlib.colors.LogNorm() if log and counts.count() else None
+    # time points sit at the center of their column
+    middle = (times[1:] + times[:-1]) / 2
+    time_edges = np.concatenate([[times[0]], middle, [times[-1]]])
+    return ax.pcolormesh(time_edges, edges, counts, cmap=cmap, norm=norm, shading='flat', rasterized=True)
+
+
+def draw_bands(ax, tspan, bands, median=None, mean=None, color='C0'):
+    """Draw shaded ``bands``, (lower, upper, label) from outermost in, and the median and mean"""
+    for i, (lower, upper, label) in enumerate(bands):
+        ax.fill_between(tspan, lower, upper, color=color, alpha=0.15 + 0.5 * i / max(len(bands), 1),
+                        linewidth=0, label=label)
+    if median is not None:
+        ax.plot(tspan, median, color=color, lw=1.5, label='median')
+    if mean is not None:
+        ax.plot(tspan, mean, 'k--', lw=1, label='mean')
+
+
+def percentile_bands(ax, tspan, trajectories, percentiles=(5, 25), mean=True, color='C0'):
+    """Draw the median of (n_sets, n_times) trajectories and bands between percentiles
+
+    ``percentiles`` are the lower edges of the bands; the band from ``p``
+    reaches to ``100 - p``.
+    """
+    trajectories = np.asarray(trajectories, dtype=float)
+    percentiles = sorted(percentiles)
+    edges = np.nanpercentile(trajectories, list(percentiles) + [50] + [100 - p for p in percentiles[::-1]], axis=0)
+    n = len(percentiles)
+    bands = [(edges[i], edges[-1 - i], '%g-%g%%' % (p, 100 - p)) for i, p in enumerate(percentiles)]
+    draw_bands(ax, tspan, bands, median=edges[n], mean=np.nanmean(trajectories, axis=0) if mean else None,
+               color=color)
+
+
+def overlay_data(ax, x, y, normalized=True, **kwargs):
+    """Scatter data points over a panel
+
+    With ``normalized`` the panel's y axis is in the units of the data;
+    otherwise the data, e.g. normalized measurements over trajectories in
+    molecules, go on a second y axis.
+    """
+    kwargs.setdefault('color', 'C3')
+    kwargs.setdefault('zorder', 3)
+    kwargs.setdefault('label', 'data')
+    if not normalized:
+        ax = ax.twinx()
+        ax.set_ylim(0, 1.05)
+        ax.set_ylabel('Normalized', fontsize=12)
+    return ax.scatter(x, y, **kwargs)
+
+
+def _panels(names, ncols, figsize):
+    nrows = int(np.ceil(len(names) / float(ncols)))
+    fig, axes = plt.subplots(nrows, ncols, figsize=figsize, squeeze=False)
+    for ax in axes.ravel()[len(names):]:
+        ax.set_visible(False)
+    return fig, axes.ravel()
+
+
+def _label(ax, name, normalized):
+    ax.set_xlabel('Time min', fontsize=14)
+    ax.set_ylabel('Normalized amount' if normalized else 'Amount of produced [molecules]', fontsize=14)
+    ax.set_title(name)
+
+
+def ensemble_figure(tspan, trajectories, names, kind='density', data=None, normalized=(), ncols=4,
+                    figsize=(15, 10), path=None, **kwargs):
+    """A panel per observable summarising its trajectories
+
+    Parameters
+    ----------
+    tspan : np.ndarray
+        Output times
+    trajectories : mapping
+        (n_sets, n_times) trajectories by observable name, e.g. the
+        ``observables`` of an :class:`ensemble_result.EnsembleResult`
+    names : list of str
+        Observables to draw, one panel each
+    kind : str
+        ``'density'`` (:func:`density`) or ``'bands'``
+        (:func:`percentile_bands`)
+    data : dict, optional
+        (x, y) data points to overlay, by observable name
+    normalized : collection of str
+        Observables whose trajectories are each rescaled to 0-1 first, as
+        when they are compared with normalized data
+    path : str, optional
+        Save the figure here
+    kwargs
+        Passed to :func:`density` or :func:`percentile_bands`
+    """
+    if kind not in ('density', 'bands'):
+        raise ValueError("kind must be 'density' or 'bands'")
+    data = data or {}
+    fig, axes = _panels(names, ncols, figsize)
+    for ax, name in zip(axes, names):
+        y = normalize(trajectories[name]) if name in normalized else trajectories[name]
+        if kind == 'density':
+            density(ax, tspan, y, **kwargs)
+        else:
+            percentile_bands(ax, tspan, y, **kwargs)
+        _label(ax, name, name in normalized)
+        if name in data:
+            overlay_data(ax, *data[name], normalized=name in normalized)
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path)
+    return fig
+
+
+def stats_figure(stats, kind='bands', data=None, ncols=4, figsize=(15, 10), path=None, **kwargs):
+    """A panel per observable of a streamed ensemble's :class:`ensemble.EnsembleStats`
+
+    ``'bands'`` draws the exact min-max range and mean, and the 5-95%
+    band and median estimated from the reservoir sample. ``'density'``
+    draws the density of the reservoir sample. ``data`` (x, y) points by
+    observable name go on a normalized second y axis.
+    """
+    if kind not in ('density', 'bands'):
+        raise ValueError("kind must be 'density' or 'bands'")
+    data = data or {}
+    names = stats.observables
+    fig, axes = _panels(names, ncols, figsize)
+    if kind == 'bands':
+        lo, median, hi = stats.quantile([0.05, 0.5, 0.95])
+    for j, (ax, name) in enumerate(zip(axes, names)):
+        if kind == 'density':
+            density(ax, stats.tspan, stats.sample[:, j], **kwargs)
+        else:
+            draw_bands(ax, stats.tspan, [(stats.min[j], stats.max[j], 'min-max'), (lo[j], hi[j], '5-95%')],
+                       median=median[j], mean=stats.mean[j], **kwargs)
+        _label(ax, name, False)
+        if name in data:
+            overlay_data(ax, *data[name], normalized=False)
+    if kind == 'bands':
+        axes[len(names) - 1].legend(loc='best', fontsize=10)
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path)
+    return fig
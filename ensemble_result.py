@@ -0,0 +1,222 @@
+"""Array-backed simulation results for ensembles of parameter sets.
+
+:class:`pysb.simulator.SimulationResult` stores every simulation as its own
+record array, computes observables with a Python loop over simulations and
+observables, and deep-copies the model for every result. For thousands of
+parameter sets that dominates the cost of a batched simulation, and reading
+it back through ``result.dataframe`` goes through a pandas MultiIndex lookup
+per simulation.
+
+:class:`EnsembleResult` keeps the observables in one array of shape
+(n_observables, n_sims, n_times), computed with a single sparse matrix
+product from the species trajectories:
+
+* ``result.observables['MLKLp_obs']`` is a contiguous (n_sims, n_times)
+  view, no copy made
+* ``result.array`` is the (n_sims, n_times, n_observables) view of the same
+  data
+* ``dtype=np.float32`` halves the memory taken by the species and
+  observables
+
+Integer indexing, iteration, ``all`` and ``dataframe`` behave as for
+``SimulationResult``; the per-simulation record arrays and the dataframe are
+built the first time they are asked for.
+
+A simulator run with only some ``outputs`` passes their trajectories instead
+of the species'. The result then holds those outputs as its observables and
+has no species or expressions.
+"""
+import copy
+import itertools
+from collections.abc import Sequence
+from datetime import datetime
+
+import numpy as np
+import scipy.sparse
+import sympy
+from pysb import __version__ as PYSB_VERSION
+from pysb.core import time
+from pysb.simulator.base import SimulationResult
+
+
+def observable_matrix(model):
+    """Sparse (n_species, n_observables) matrix mapping species to observables"""
+    rows, cols, values = [], [], []
+    for j, obs in enumerate(model.observables):
+        rows.extend(obs.species)
+        cols.extend([j] * len(obs.species))
+        values.extend(obs.coefficients)
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(len(model.species), len(model.observables)))
+
+
+class _Observables(Sequence):
+    """Observables of every simulation: by name, a (n_sims, n_times) array view"""
+
+    def __init__(self, result):
+        self._result = result
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._result.observable_view(key)
+        return self._result._records()[key]
+
+    def __len__(self):
+        return self._result.nsims
+
+
+class EnsembleResult(SimulationResult):
+    """Simulation result of many parameter sets, held in arrays
+
+    Parameters
+    ----------
+    simulator : pysb.simulator.Simulator
+        Simulator that produced the trajectories
+    tout : np.ndarray
+        Output times of each simulation, shape (n_sims, n_times)
+    trajectories : np.ndarray
+        Species trajectories, shape (n_sims, n_times, n_species)
+    obs_matrix : scipy.sparse matrix, optional
+        From :func:`observable_matrix`; pass it to avoid rebuilding it
+    dtype : np.dtype
+        Storage type of the species and observable arrays
+    outputs : list of str, optional
+        Names of the columns of ``trajectories`` if these are outputs
+        (observables, or species named ``'__s<i>'``) rather than species
+
+    Notes
+    -----
+    Unlike ``SimulationResult`` the model is not copied, so the result
+    refers to the simulator's model as it is now.
+    """
+
+    def __init__(self, simulator, tout, trajectories, obs_matrix=None, dtype=np.float64, outputs=None):
+        model = simulator._model
+        self._model = model
+        self._param_values = simulator.param_values.copy()
+        self._initials = simulator.initials.copy()
+        self.simulator_class = simulator.__class__
+        self.init_kwargs = copy.deepcopy(simulator._init_kwargs)
+        self.run_kwargs = copy.deepcopy(simulator._run_kwargs)
+        self.squeeze = True
+        self.tout = tout
+        self.n_sims_per_parameter_set = 1
+        self.pysb_version = PYSB_VERSION
+        self.timestamp = datetime.now()
+        self.custom_attrs = {}
+        self._yfull = None
+        self._dataframe = None
+        self._built = False
+
+        self.outputs = outputs
+        trajectories = np.asarray(trajectories, dtype=dtype)
+        n_sims, n_t, width = trajectories.shape
+        self._nsims = n_sims
+        if outputs is None:
+            self.species_array = trajectories
+            """Species trajectories, shape (n_sims, n_times, n_species)"""
+            if obs_matrix is None:
+                obs_matrix = observable_matrix(model)
+            self.observable_names = [obs.name for obs in model.observables]
+            flat = trajectories.reshape(n_sims * n_t, width)
+            self._data = np.asarray(obs_matrix.T.dot(flat.T), dtype=dtype).reshape(
+                len(self.observable_names), n_sims, n_t)
+            self._expression_data = self._expressions(model)
+        else:
+            self.species_array = None
+            self.observable_names = list(outputs)
+            self._data = np.ascontiguousarray(trajectories.transpose(2, 0, 1))
+            self.expression_names = []
+            self._expression_data = np.empty((0, n_sims, n_t), dtype=dtype)
+        self._index = {name: i for i, name in enumerate(self.observable_names)}
+        simulator._reset_run_overrides()
+
+    def _expressions(self, model):
+        exprs = model.expressions_dynamic(include_local=False)
+        self.expression_names = [expr.name for expr in exprs]
+        if not exprs:
+            return np.empty((0,) + self._data.shape[1:], dtype=self._data.dtype)
+        # evaluated over the whole ensemble at once, broadcasting observables
+        # (n_sims, n_times) against parameters (n_sims, 1) and time (n_times,)
+        names = self.observable_names + [p.name for p in model.parameters] + [time.name]
+        args = list(self._data) + [p[:, None] for p in np.asarray(self._param_values, dtype=float).T] + \
+            [np.asarray(self.tout[0], dtype=float)]
+        values = [np.broadcast_to(sympy.lambdify(names, expr.expand_expr(), 'numpy')(*args), self._data.shape[1:])
+                  for expr in exprs]
+        return np.array(values, dtype=self._data.dtype)
+
+    @property
+    def array(self):
+        """Observables as a (n_sims, n_times, n_observables) view"""
+        return self._data.transpose(1, 2, 0)
+
+    def observable_view(self, name):
+        """One observable of every simulation as a (n_sims, n_times) view"""
+        return self._data[self._index[name]]
+
+    def _build(self):
+        # the per-simulation record arrays of SimulationResult, on first use
+        if self._built:
+            return
+        obs_dtype = list(zip(self.observable_names, itertools.repeat(float))) or float
+        expr_dtype = list(zip(self.expression_names, itertools.repeat(float))) or float
+        obs = np.ascontiguousarray(self.array, dtype=float)
+        expr = np.ascontiguousarray(self._expression_data.transpose(1, 2, 0), dtype=float)
+        self._y = None if self.species_array is None else list(np.asarray(self.species_array, dtype=float))
+        self._yobs_view = list(obs)
+        self._yexpr_view = list(expr)
+        self._yobs = [o.reshape(-1).view(obs_dtype) for o in obs]
+        self._yexpr = [e.reshape(-1).view(expr_dtype) for e in expr]
+        self._built = True
+
+    def _records(self):
+        self._build()
+        return self._yobs
+
+    def __getattr__(self, name):
+        # the SimulationResult attributes built lazily
+        if name in ('_y', '_yobs', '_yobs_view', '_yexpr', '_yexpr_view'):
+            self._build()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _require_species(self):
+        if self.species_array is None:
+            raise ValueError('Only the outputs %s were kept; run the simulator without outputs for species, '
+                             'expressions, all or dataframe' % self.outputs)
+
+    @property
+    def species(self):
+        self._require_species()
+        return super(EnsembleResult, self).species
+
+    @property
+    def expressions(self):
+        self._require_species()
+        return super(EnsembleResult, self).expressions
+
+    @property
+    def all(self):
+        self._require_species()
+        return super(EnsembleResult, self).all
+
+    @property
+    def observables(self):
+        """Observables of every simulation
+
+        Indexed by name, a (n_sims, n_times) view of one observable; indexed
+        by number or iterated, a record array per simulation. A single
+        simulation gives its record array, as for ``SimulationResult``.
+        """
+        if not self.observable_names:
+            raise ValueError('Model has no observables')
+        if self.nsims == 1 and self.squeeze:
+            return self._records()[0]
+        return _Observables(self)
+
+    @property
+    def dataframe(self):
+        """The pandas DataFrame of ``SimulationResult``, built once when first asked for"""
+        if self._dataframe is None:
+            self._require_species()
+            self._dataframe = super(EnsembleResult, self).dataframe
+        return self._dataframe
@@ -0,0 +1,501 @@
+"""Global sensitivity analysis of observable trajectories.
+
+Which rate constants drive the timing of MLKLp phosphorylation? A
+calibration gives thousands of parameter sets that fit, but not how each
+rate shapes the trajectories. :class:`SobolAnalysis` and
+:class:`MorrisAnalysis` answer that for every observable at every output
+time, over a parameter space that is either
+
+* :class:`UniformSpace`: a box, e.g. the swarm's bounds in log10 space, or
+* :class:`EnsembleSpace`: the marginal distributions of a calibrated
+  ensemble (the parameters are sampled independently, each from its
+  ensemble values, as the Sobol decomposition requires)
+
+:class:`SobolAnalysis` evaluates the Saltelli design of a scrambled Sobol
+sequence, ``n (d + 2)`` runs for ``n`` samples of ``d`` parameters, and
+estimates first-order indices with Saltelli et al.'s (2010) estimator and
+total indices with Jansen's. :class:`MorrisAnalysis` evaluates ``r``
+one-at-a-time trajectories, ``r (d + 1)`` runs, for the mean (``mu``),
+mean absolute (``mu_star``) and standard deviation (``sigma``) of the
+elementary effects, a cheaper screening.
+
+Neither keeps the simulated trajectories. Each block of runs is folded into
+running sums, from which the indices are computed, and is then dropped, so
+memory does not grow with the number of runs. Confidence intervals come
+from a Poisson bootstrap: every sample carries a Poisson(1) weight for each
+bootstrap replicate, derived from the seed and the sample's index, so the
+replicates are folded as the samples are. Because designs and weights depend
+only on the sample index, :meth:`extend` adds samples to an analysis, saved
+to ``path`` between sessions, with results identical to running all
+samples at once; a saved analysis refuses to be extended over another space
+or with another ``evaluate``. Blocks are simulated by ``evaluate``, a
+batched simulation of parameter sets, on a pool of worker processes::
+
+    analysis = SobolAnalysis(necroptosis_space('ensemble'), necroptosis_outputs, path='necro_sobol.npz')
+    analysis.extend(1024, num_processors=8)
+    indices = analysis.indices()     # indices['ST'][observable, time, parameter]
+"""
+import functools
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import scipy.stats.qmc
+
+from parallel_pso import evaluation_pool
+
+
+class UniformSpace(object):
+    """Box ``lower`` - ``upper`` of the parameters, sampled uniformly"""
+
+    def __init__(self, lower, upper, names=None):
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.dim = len(self.lower)
+        self.names = list(names) if names is not None else ['x%d' % i for i in range(self.dim)]
+
+    def transform(self, u):
+        """Points of the space at (n, dim) points ``u`` of the unit hypercube"""
+        return self.lower + u * (self.upper - self.lower)
+
+    def fingerprint(self):
+        """Hash of the bounds, which a saved analysis must have been run over"""
+        return _digest('uniform', self.lower, self.upper)
+
+
+class EnsembleSpace(object):
+    """Independent marginals of an ensemble: each parameter at quantile ``u`` of its ensemble values"""
+
+    def __init__(self, positions, names=None):
+        positions = np.asarray(positions, dtype=float)
+        self.positions = positions[np.all(np.isfinite(positions), axis=1)]
+        self.dim = self.positions.shape[1]
+        self.names = list(names) if names is not None else ['x%d' % i for i in range(self.dim)]
+        self._sorted = np.sort(self.positions, axis=0)
+        self._levels = (np.arange(len(self.positions)) + 0.5) / len(self.positions)
+
+    def transform(self, u):
+        return np.column_stack([np.interp(u[:, i], self._levels, self._sorted[:, i]) for i in range(self.dim)])
+
+    def fingerprint(self):
+        """Hash of the ensemble, which a saved analysis must have been run over"""
+        return _digest('ensemble', self._sorted)
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(np.ascontiguousarray(part).tobytes() if isinstance(part, np.ndarray) else repr(part).encode())
+    return digest.hexdigest()
+
+
+def _function_fingerprint(function):
+    """Hash of a function's module and name and, for a ``functools.partial``, its bound arguments"""
+    if isinstance(function, functools.partial):
+        return _digest(_function_fingerprint(function.func), function.args, sorted(function.keywords.items()))
+    module = getattr(function, '__module__', None)
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(getattr(sys.modules['__main__'], '__file__', '')))[0]
+    return _digest(module, getattr(function, '__qualname__', repr(function)))
+
+
+class _IncrementalAnalysis(object):
+    """Samples evaluated block by block and folded into saved running sums
+
+    Subclasses define ``_runs_per_sample``, ``_design(samples)``, returning
+    the (n_samples, runs_per_sample, dim) unit-hypercube points, and
+    ``_fold(samples, outputs, weights)``, which adds the (n_samples,
+    runs_per_sample, n_observables, n_times) ``outputs`` to the sums.
+    """
+    _runs_per_sample = None
+
+    def __init__(self, space, evaluate, n_bootstrap=100, seed=0, path=None):
+        self.space = space
+        self.evaluate = evaluate
+        self.n_bootstrap = n_bootstrap
+        self.seed = seed
+        self.path = path
+        self.n_samples = 0
+        self.n_failed = 0
+        self.sums = None
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _settings(self):
+        return np.array([self.space.dim, self.n_bootstrap, self.seed, self._runs_per_sample])
+
+    def _fingerprints(self):
+        """Hashes of the space and of ``evaluate``, which the saved sums were folded from"""
+        return np.array([self.space.fingerprint(), _function_fingerprint(self.evaluate)])
+
+    def _load(self):
+        with np.load(self.path) as saved:
+            if not np.array_equal(saved['settings'], self._settings()):
+                raise ValueError('%s holds an analysis with other settings (dim, n_bootstrap, seed, runs per '
+                                 'sample): %s' % (self.path, saved['settings'].tolist()))
+            fingerprints = saved['fingerprints'] if 'fingerprints' in saved.files else np.array(['', ''])
+            for name, old, new in zip(('parameter space', 'evaluate function'), fingerprints, self._fingerprints()):
+                if old != new:
+                    raise ValueError('%s holds an analysis of another %s; use a new path' % (self.path, name))
+            self.n_samples = int(saved['n_samples'])
+            self.n_failed = int(saved['n_failed'])
+            self.sums = {key[5:]: saved[key] for key in saved.files if key.startswith('sums_')}
+
+    def save(self):
+        """Write the running sums to ``path``, replacing it atomically"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, settings=self._settings(), fingerprints=self._fingerprints(), n_samples=self.n_samples,
+                     n_failed=self.n_failed, **{'sums_' + key: value for key, value in (self.sums or {}).items()})
+        os.replace(tmp, self.path)
+
+    def weights(self, samples):
+        """(n_samples, 1 + n_bootstrap) weights: 1 for the estimate, then Poisson(1) bootstrap weights"""
+        weights = np.ones((len(samples), 1 + self.n_bootstrap))
+        for row, sample in enumerate(samples):
+            rng = np.random.default_rng([self.seed, 1, int(sample)])
+            weights[row, 1:] = rng.poisson(1.0, self.n_bootstrap)
+        return weights
+
+    def extend(self, n_samples, block_size=64, num_processors=1, checkpoint_seconds=60, verbose=False):
+        """Evaluate samples until the analysis holds ``n_samples``
+
+        Parameters
+        ----------
+        block_size : int
+            Samples per call of ``evaluate``, ``block_size *
+            runs_per_sample`` parameter sets
+        num_processors : int
+            Worker processes evaluating blocks; ``evaluate`` must then be a
+            module-level function. 1 evaluates in this process.
+        checkpoint_seconds : float
+            Seconds between saves to ``path``, which is also saved at the end
+        """
+        starts = list(range(self.n_samples, n_samples, block_size))
+        blocks = [np.arange(start, min(start + block_size, n_samples)) for start in starts]
+        last_save = time.time()
+        if num_processors == 1:
+            results = ((block, self.evaluate(self._positions(block))) for block in blocks)
+            self._fold_all(results, n_samples, last_save, checkpoint_seconds, verbose)
+        else:
+            with evaluation_pool(num_processors) as pool:
+                # a bounded window of blocks in flight keeps memory use fixed
+                window = 2 * (num_processors or os.cpu_count())
+                futures = [(block, pool.submit(self.evaluate, self._positions(block))) for block in blocks[:window]]
+
+                def results():
+                    for i in range(len(blocks)):
+                        block, future = futures[i]
+                        if i + window < len(blocks):
+                            following = blocks[i + window]
+                            futures.append((following, pool.submit(self.evaluate, self._positions(following))))
+                        yield block, future.result()
+                        futures[i] = None
+
+                self._fold_all(results(), n_samples, last_save, checkpoint_seconds, verbose)
+        if self.path is not None:
+            self.save()
+        return self
+
+    def _positions(self, block):
+        return self.space.transform(self._design(block).reshape(-1, self.space.dim))
+
+    def _fold_all(self, results, n_samples, last_save, checkpoint_seconds, verbose):
+        # blocks are folded in order, so a saved analysis always holds samples 0 .. n_samples - 1
+        for block, outputs in results:
+            outputs = np.asarray(outputs, dtype=float)
+            outputs = outputs.reshape((len(block), self._runs_per_sample) + outputs.shape[1:])
+            # a sample with a failed run is left out entirely
+            failed = ~np.all(np.isfinite(outputs.reshape(len(block), -1)), axis=1)
+            weights = self.weights(block)
+            weights[failed] = 0
+            outputs = np.where(failed[(slice(None),) + (np.newaxis,) * (outputs.ndim - 1)], 0.0, outputs)
+            self._fold(block, outputs, weights)
+            self.n_samples = int(block[-1]) + 1
+            self.n_failed += int(failed.sum())
+            if self.path is not None and time.time() - last_save > checkpoint_seconds:
+                self.save()
+                last_save = time.time()
+            if verbose:
+                print('%d of %d samples evaluated (%d runs), %d failed'
+                      % (self.n_samples, n_samples, self.n_samples * self._runs_per_sample, self.n_failed))
+
+    def _add(self, key, value):
+        if self.sums is None:
+            self.sums = {}
+        self.sums[key] = self.sums[key] + value if key in self.sums else value
+
+
+def _interval(replicates, confidence):
+    with warnings.catch_warnings():
+        # NaN replicates: no variance at t = 0, or no samples
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(replicates, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+
+
+class SobolAnalysis(_IncrementalAnalysis):
+    """First-order and total Sobol indices of every output
+
+    Sample ``j`` is row ``j`` of a scrambled Sobol sequence of dimension
+    ``2 d``: its first half is the point of matrix A, its second of B.
+    Each sample is run at A, B and the ``d`` points AB_i (A with parameter
+    ``i`` from B). Powers of two for ``n_samples`` keep the sequence's
+    balance.
+
+    Parameters
+    ----------
+    space : UniformSpace or EnsembleSpace
+    evaluate : callable
+        (n_sets, dim) points of the space to (n_sets, n_observables,
+        n_times) outputs, e.g. :func:`necroptosis_outputs`
+    n_bootstrap : int
+        Bootstrap replicates for the confidence intervals
+    seed : int
+        Scrambling and bootstrap seed
+    path : str, optional
+        ``.npz`` file keeping the analysis between sessions; an existing one
+        is loaded and extended
+    """
+
+    def __init__(self, space, evaluate, n_bootstrap=100, seed=0, path=None):
+        self._runs_per_sample = space.dim + 2
+        super(SobolAnalysis, self).__init__(space, evaluate, n_bootstrap=n_bootstrap, seed=seed, path=path)
+
+    def _design(self, samples):
+        sampler = scipy.stats.qmc.Sobol(2 * self.space.dim, scramble=True, seed=self.seed)
+        if samples[0]:
+            sampler.fast_forward(int(samples[0]))
+        with warnings.catch_warnings():
+            # blocks need not be powers of two; n_samples should be
+            warnings.simplefilter('ignore', UserWarning)
+            u = sampler.random(len(samples))
+        a, b = u[:, :self.space.dim], u[:, self.space.dim:]
+        ab = np.repeat(a[:, np.newaxis], self.space.dim, axis=1)
+        index = np.arange(self.space.dim)
+        ab[:, index, index] = b
+        return np.concatenate([a[:, np.newaxis], b[:, np.newaxis], ab], axis=1)
+
+    def _fold(self, samples, outputs, weights):
+        if self.sums is None:
+            # outputs are shifted by the first sample's, so the sums of squares do not cancel; the first-order
+            # estimator depends slightly on the shift, which is thus the same however the samples are blocked
+            self.sums = {'shift': outputs[0, 0]}
+        outputs = outputs - self.sums['shift']
+        fa, fb, fab = outputs[:, 0], outputs[:, 1], outputs[:, 2:]
+        self._add('weight', weights.sum(axis=0))
+        self._add('sum', np.einsum('nr,n...->r...', weights, fa + fb))
+        self._add('squares', np.einsum('nr,n...->r...', weights, fa ** 2 + fb ** 2))
+        self._add('first', np.einsum('nr,n...,ni...->ri...', weights, fb, fab - fa[:, np.newaxis]))
+        self._add('total', np.einsum('nr,ni...->ri...', weights, (fa[:, np.newaxis] - fab) ** 2))
+
+    def indices(self, confidence=0.95):
+        """Sobol indices, with their bootstrap confidence intervals
+
+        Returns
+        -------
+        dict
+            ``S1`` and ``ST``, (n_observables, n_times, dim) first-order
+            and total indices; ``S1_interval`` and ``ST_interval``, their
+            (2, n_observables, n_times, dim) lower and upper bounds; and
+            ``variance``, (n_observables, n_times). Indices are NaN where
+            an output does not vary.
+        """
+        if self.sums is None:
+            raise ValueError('No samples evaluated yet')
+        s = self.sums
+        weight = s['weight'].reshape((-1,) + (1,) * (s['sum'].ndim - 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s['sum'] / (2 * weight)
+            variance = s['squares'] / (2 * weight) - mean ** 2
+            variance = np.where(variance > 0, variance, np.nan)[:, np.newaxis]
+            first = s['first'] / weight[:, np.newaxis] / variance
+            total = s['total'] / (2 * weight[:, np.newaxis]) / variance
+        # (replicate, parameter, observable, time) to (replicate, observable, time, parameter)
+        first, total = np.moveaxis(first, 1, -1), np.moveaxis(total, 1, -1)
+        return {'S1': first[0], 'ST': total[0], 'S1_interval': _interval(first[1:], confidence),
+                'ST_interval': _interval(total[1:], confidence), 'variance': variance[0, 0],
+                'names': self.space.names, 'n_samples': self.n_samples, 'n_failed': self.n_failed}
+
+
+class MorrisAnalysis(_IncrementalAnalysis):
+    """Elementary-effect screening of every output
+
+    Sample ``j`` is a one-at-a-time trajectory on a ``levels``-level grid
+    of the unit hypercube: a random start, then each parameter in random
+    order moved by ``levels / (2 (levels - 1))``. Elementary effects are
+    per unit of the hypercube, i.e. of the whole range of a parameter.
+
+    Parameters are as for :class:`SobolAnalysis`, plus ``levels``.
+    """
+
+    def __init__(self, space, evaluate, levels=4, n_bootstrap=100, seed=0, path=None):
+        self._runs_per_sample = space.dim + 1
+        self.levels = levels
+        self.delta = levels / (2.0 * (levels - 1))
+        super(MorrisAnalysis, self).__init__(space, evaluate, n_bootstrap=n_bootstrap, seed=seed, path=path)
+
+    def _settings(self):
+        return np.append(super(MorrisAnalysis, self)._settings(), self.levels)
+
+    def _trajectories(self, samples):
+        """Start, steps and order of moves of each sample's trajectory"""
+        d = self.space.dim
+        grid = np.arange(self.levels) / (self.levels - 1.0)
+        starts, steps, orders = np.empty((len(samples), d)), np.empty((len(samples), d)), []
+        for row, sample in enumerate(samples):
+            rng = np.random.default_rng([self.seed, 2, int(sample)])
+            starts[row] = rng.choice(grid, d)
+            orders.append(rng.permutation(d))
+        # move up from the lower half of the grid, down from the upper
+        steps[:] = np.where(starts + self.delta <= 1 + 1e-12, self.delta, -self.delta)
+        return starts, steps, np.array(orders, dtype=int).reshape(len(samples), d)
+
+    def _design(self, samples):
+        starts, steps, orders = self._trajectories(samples)
+        moves = np.zeros((len(samples), self.space.dim + 1, self.space.dim))
+        rows = np.arange(len(samples))[:, np.newaxis]
+        moves[rows, np.arange(1, self.space.dim + 1), orders] = np.take_along_axis(steps, orders, axis=1)
+        return starts[:, np.newaxis] + np.cumsum(moves, axis=1)
+
+    def _fold(self, samples, outputs, weights):
+        _, steps, orders = self._trajectories(samples)
+        rows = np.arange(len(outputs))[:, np.newaxis]
+        # the effect of parameter orders[:, k] is the change made by the k-th move
+        effects = np.empty((len(outputs), self.space.dim) + outputs.shape[2:])
+        effects[rows, orders] = np.diff(outputs, axis=1) / np.take_along_axis(steps, orders, axis=1).reshape(
+            orders.shape + (1,) * (outputs.ndim - 2))
+        self._add('weight', weights.sum(axis=0))
+        self._add('sum', np.einsum('nr,ni...->ri...', weights, effects))
+        self._add('absolute', np.einsum('nr,ni...->ri...', weights, np.abs(effects)))
+        self._add('squares', np.einsum('nr,ni...->ri...', weights, effects ** 2))
+
+    def indices(self, confidence=0.95):
+        """Elementary effect statistics, with bootstrap confidence intervals
+
+        Returns
+        -------
+        dict
+            ``mu``, ``mu_star`` and ``sigma``, (n_observables, n_times,
+            dim), and ``mu_star_interval``, (2, n_observables, n_times, dim)
+        """
+        if self.sums is None:
+            raise ValueError('No samples evaluated yet')
+        s = self.sums
+        weight = s['weight'].reshape((-1,) + (1,) * (s['sum'].ndim - 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = s['sum'] / weight
+            mu_star = s['absolute'] / weight
+            sigma = np.sqrt(np.maximum(s['squares'] / weight - mu ** 2, 0) * weight / (weight - 1))
+        mu, mu_star, sigma = (np.moveaxis(x, 1, -1) for x in (mu, mu_star, sigma))
+        return {'mu': mu[0], 'mu_star': mu_star[0], 'sigma': sigma[0],
+                'mu_star_interval': _interval(mu_star[1:], confidence), 'names': self.space.names,
+                'n_samples': self.n_samples, 'n_failed': self.n_failed}
+
+
+def ranking(indices, key, observable, time_index, names=None):
+    """Parameters by decreasing index ``key`` of one observable at one output time, with the values"""
+    values = indices[key][observable, time_index]
+    names = names or indices['names']
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf))
+    return [(names[i], values[i]) for i in order]
+
+
+def plot_indices(indices, tspan, observable, name, keys=('S1', 'ST'), path=None):
+    """Indices of one observable against time, a line per parameter, with shaded confidence intervals"""
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(1, len(keys), figsize=(6 * len(keys), 4.5), squeeze=False)
+    for ax, key in zip(axes[0], keys):
+        for i, parameter in enumerate(indices['names']):
+            line, = ax.plot(tspan, indices[key][observable, :, i], lw=1.5, label=parameter)
+            if key + '_interval' in indices:
+                lower, upper = indices[key + '_interval'][:, observable, :, i]
+                ax.fill_between(tspan, lower, upper, color=line.get_color(), alpha=0.2, linewidth=0)
+        ax.set_xlabel('Time min', fontsize=12)
+        ax.set_ylabel(key, fontsize=12)
+        ax.set_title('%s: %s' % (name, key))
+    axes[0, -1].legend(loc='best', fontsize=9)
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path)
+    return fig
+
+
+NECROPTOSIS_TSPAN = np.linspace(0, 960, 97)
+_necroptosis = {}
+
+
+def necroptosis_outputs(positions, normalized=False):
+    """(n, n_observables, n_times) observables of pso_necroptosis for (n, n_rates) log10 rate constants
+
+    Runs a :class:`batched_simulator.BatchedOdeSimulator` at
+    ``NECROPTOSIS_TSPAN``, built once per process. With ``normalized``
+    every trajectory is rescaled to 0-1, as it is compared with the data,
+    so that the indices are those of its timing rather than its amount;
+    trajectories that do not change are 0. Pass
+    ``functools.partial(necroptosis_outputs, normalized=True)`` as an
+    analysis' ``evaluate``.
+    """
+    import pso_necroptosis
+    from batched_simulator import BatchedOdeSimulator
+    if 'simulator' not in _necroptosis:
+        _necroptosis['simulator'] = pso_necroptosis.get_model.simulator(NECROPTOSIS_TSPAN,
+                                                                        simulator_class=BatchedOdeSimulator)
+    names = [obs.name for obs in pso_necroptosis.model.observables]
+    result = _necroptosis['simulator'].run(param_values=pso_necroptosis.batch_param_values(positions), outputs=names)
+    outputs = np.stack([result.observable_view(name) for name in names], axis=1)
+    if normalized:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            low, high = outputs.min(axis=2, keepdims=True), outputs.max(axis=2, keepdims=True)
+            outputs = np.where(high > low, (outputs - low) / (high - low), 0.0)
+    return outputs
+
+
+def necroptosis_space(kind='ensemble', ensemble='necro_optimizer_best_25_100_927_TNF100.npy', parameter_range=2):
+    """The log10 rate constants of pso_necroptosis
+
+    ``'prior'``: the swarm's bounds, ``parameter_range`` decades around the
+    model's values; ``'ensemble'``: the marginals of the calibrated
+    ``ensemble`` of best positions.
+    """
+    import pso_necroptosis
+    names = [p.name for p, rate in zip(pso_necroptosis.model.parameters, pso_necroptosis.rate_mask) if rate]
+    if kind == 'prior':
+        center = pso_necroptosis.log10_original_values
+        return UniformSpace(center - parameter_range, center + parameter_range, names)
+    if kind == 'ensemble':
+        return EnsembleSpace(np.load(ensemble), names)
+    raise ValueError("kind must be 'prior' or 'ensemble'")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--method', default='sobol', choices=['sobol', 'morris'])
+    parser.add_argument('--space', default='ensemble', choices=['ensemble', 'prior'])
+    parser.add_argument('--normalized', action='store_true', help='analyse trajectories rescaled to 0-1')
+    parser.add_argument('--samples', type=int, default=1024)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--path', help='.npz file the analysis is kept in and extended from')
+    parser.add_argument('--plot', help='save the indices of MLKLp_obs to this image')
+    args = parser.parse_args()
+
+    import pso_necroptosis
+    evaluate = functools.partial(necroptosis_outputs, normalized=True) if args.normalized else necroptosis_outputs
+    analysis_class = SobolAnalysis if args.method == 'sobol' else MorrisAnalysis
+    analysis = analysis_class(necroptosis_space(args.space), evaluate, path=args.path)
+    analysis.extend(args.samples, num_processors=args.processes, verbose=True)
+    result = analysis.indices()
+    observable = [obs.name for obs in pso_necroptosis.model.observables].index(pso_necroptosis.mlklp_obs)
+    key = 'ST' if args.method == 'sobol' else 'mu_star'
+    for t in (24, 48, 72, 96):
+        print('t = %g: %s' % (NECROPTOSIS_TSPAN[t], ', '.join(
+            '%s %.2f' % item for item in ranking(result, key, observable, t))))
+    if args.plot:
+        plot_indices(result, NECROPTOSIS_TSPAN, observable, pso_necroptosis.mlklp_obs,
+                     keys=('S1', 'ST') if args.method == 'sobol' else ('mu_star', 'sigma'), path=args.plot)
@@ -0,0 +1,189 @@
+"""Multi-start gradient-based calibration of the necroptosis model.
+
+Minimizes the cost of ``pso_necroptosis.obj_function`` (normalized MLKLp
+against the x100/y100 data) over the log10 rate constants, within the
+swarm's bounds, with scipy's L-BFGS-B or trust-region (``trust-constr``)
+optimizer. The gradient comes from :class:`gradients.GradientSimulator`:
+forward sensitivities for necroptosis, the adjoint for larger models.
+
+The first start is the model's own parameters, the rest are uniform within
+the bounds. Every cost evaluation is recorded with the ODE solves it took,
+so :func:`solves_to_reach` gives the solves needed to match a cost, e.g.
+the best one PSO found::
+
+    python gradient_calibration.py --starts 20 --pso-seeds 4
+
+runs both and reports the solves and time each needed to reach PSO's best
+cost. PSO's best positions are scored again at the gradient simulator's
+tighter tolerances first: the batched simulator PSO runs with, at
+``rtol = atol = 1e-5``, misjudges the tiny MLKLp amounts of the best fits.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import scipy.optimize
+
+import pso_necroptosis
+from gradients import GradientSimulator, normalized_sse
+
+METHODS = ('L-BFGS-B', 'trust-constr')
+
+
+class GradientObjective(object):
+    """Cost and gradient of log10 rate constants, recording every evaluation
+
+    Parameters
+    ----------
+    simulator : gradients.GradientSimulator
+    cost : callable
+        Cost of the observables, see :mod:`gradients`
+    failure_cost : float
+        Cost returned, with a zero gradient, when a simulation fails
+
+    Attributes
+    ----------
+    solves, seconds, costs, best : list
+        After each evaluation: ODE solves so far, time since the first
+        evaluation started, its cost, best cost so far
+    """
+
+    def __init__(self, simulator, cost, failure_cost):
+        self.simulator = simulator
+        self.cost = cost
+        self.failure_cost = failure_cost
+        self.solves, self.seconds, self.costs, self.best = [], [], [], []
+        self.best_position = None
+        self._start = None
+
+    def __call__(self, position):
+        if self._start is None:
+            self._start = time.perf_counter()
+        value, gradient = self.simulator.cost_and_gradient(pso_necroptosis.batch_param_values(position[None])[0],
+                                                           self.cost)
+        if not (np.isfinite(value) and np.all(np.isfinite(gradient))):
+            value, gradient = self.failure_cost, np.zeros_like(position)
+        if not self.best or value < self.best[-1]:
+            self.best_position = np.array(position)
+        self.solves.append(self.simulator.solves)
+        self.seconds.append(time.perf_counter() - self._start)
+        self.costs.append(value)
+        self.best.append(min(value, self.best[-1]) if self.best else value)
+        return value, gradient
+
+
+def make_objective(method='auto', rtol=1e-7, atol=1e-12):
+    """:class:`GradientObjective` of pso_necroptosis' cost"""
+    simulator = GradientSimulator(pso_necroptosis.model, pso_necroptosis.t, parameters=pso_necroptosis.rate_mask,
+                                  observables=[pso_necroptosis.mlklp_obs], method=method, rtol=rtol, atol=atol)
+    # normalized trajectories and data are within 0-1, so no cost exceeds one per data point
+    return GradientObjective(simulator, normalized_sse(pso_necroptosis.ydata_norm),
+                             failure_cost=float(len(pso_necroptosis.ydata_norm)))
+
+
+def calibrate(n_starts=20, method='L-BFGS-B', seed=0, max_iterations=200, gradient_method='auto', target=None,
+              verbose=False):
+    """Minimize the necroptosis cost from ``n_starts`` starting points
+
+    Parameters
+    ----------
+    method : str
+        ``'L-BFGS-B'`` or ``'trust-constr'`` (with a BFGS Hessian approximation)
+    max_iterations : int
+        Iterations per start
+    gradient_method : str
+        Passed to :class:`gradients.GradientSimulator`
+    target : float, optional
+        Stop starting new optimizations once the best cost reaches this
+
+    Returns
+    -------
+    dict
+        ``best_cost``, ``best_position``, the result of every start
+        (``starts``) and the evaluation trace (``solves``, ``seconds``,
+        ``best``)
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of %s' % ', '.join(METHODS))
+    swarm = pso_necroptosis.make_optimizer(seed)
+    bounds = list(zip(swarm.lb, swarm.ub))
+    rng = np.random.default_rng(seed)
+    starts = np.vstack([pso_necroptosis.log10_original_values,
+                        rng.uniform(swarm.lb, swarm.ub, (n_starts - 1, len(swarm.lb)))])[:n_starts]
+    objective = make_objective(gradient_method)
+    results = []
+    for i, x0 in enumerate(starts):
+        if method == 'L-BFGS-B':
+            result = scipy.optimize.minimize(objective, x0, jac=True, method=method, bounds=bounds,
+                                             options={'maxiter': max_iterations})
+        else:
+            result = scipy.optimize.minimize(objective, x0, jac=True, method=method, hess=scipy.optimize.BFGS(),
+                                             bounds=scipy.optimize.Bounds(swarm.lb, swarm.ub),
+                                             options={'maxiter': max_iterations})
+        results.append({'start': x0.tolist(), 'position': result.x.tolist(), 'cost': float(result.fun),
+                        'evaluations': int(result.nfev), 'message': str(result.message)})
+        if verbose:
+            print('start %d: cost %.4f after %d evaluations, %d solves so far, best %.4f'
+                  % (i, result.fun, result.nfev, objective.solves[-1], objective.best[-1]))
+        if target is not None and objective.best[-1] <= target:
+            break
+    return {'method': method, 'gradient_method': objective.simulator.method, 'best_cost': objective.best[-1],
+            'best_position': objective.best_position.tolist(), 'starts': results, 'solves': objective.solves,
+            'seconds': objective.seconds, 'best': objective.best}
+
+
+def solves_to_reach(run, threshold):
+    """ODE solves and seconds until the best cost of a :func:`calibrate` run reached ``threshold``, or None"""
+    reached = np.flatnonzero(np.asarray(run['best']) <= threshold)
+    if not reached.size:
+        return None
+    return run['solves'][reached[0]], run['seconds'][reached[0]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--starts', type=int, default=20)
+    parser.add_argument('--method', default='L-BFGS-B', choices=METHODS)
+    parser.add_argument('--gradient', default='auto', choices=['auto', 'forward', 'adjoint'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pso-seeds', type=int, default=4, help='PSO runs (pso-25 of bench_calibration) to compare')
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help='costs within this of the PSO best count as matching it')
+    parser.add_argument('--output', help='write both runs to this JSON file')
+    args = parser.parse_args(argv)
+
+    from bench_calibration import CONFIGS, run_replicate
+    pso_runs = [run_replicate(CONFIGS['pso-25'], seed) for seed in range(args.pso_seeds)]
+    # PSO's costs come from the batched simulator at rtol = atol = 1e-5, loose enough to distort the small
+    # MLKLp amounts of the best positions, so its best positions are scored again at the gradient tolerances
+    accurate = make_objective(args.gradient)
+    for run in pso_runs:
+        run['accurate_best'] = accurate(np.array(run['best_position']))[0]
+        found = np.flatnonzero(np.diff(np.concatenate([[np.inf], run['best']])) < 0)[-1]
+        run['evaluations_to_best'], run['seconds_to_best'] = run['evaluations'][found], run['seconds'][found]
+    pso_best = min(run['accurate_best'] for run in pso_runs)
+    target = pso_best + args.tolerance
+    print('PSO (25 particles, %d seeds): best cost %.4f, median %d simulations, %.1f s per run'
+          % (args.pso_seeds, pso_best, np.median([run['evaluations'][-1] for run in pso_runs]),
+             np.median([run['wall_seconds'] for run in pso_runs])))
+    for run in pso_runs:
+        print('  seed %d: best %.4f (%.4f as PSO scored it), found after %d simulations, %.1f s'
+              % (run['seed'], run['accurate_best'], run['best'][-1], run['evaluations_to_best'],
+                 run['seconds_to_best']))
+
+    run = calibrate(args.starts, args.method, args.seed, gradient_method=args.gradient, verbose=True)
+    hit = solves_to_reach(run, target)
+    print('%s with %s gradients: best cost %.4f after %d solves, %.1f s'
+          % (args.method, run['gradient_method'], run['best_cost'], run['solves'][-1], run['seconds'][-1]))
+    print('  %s' % ('reached %.4f after %d solves, %.1f s' % ((target,) + hit) if hit else
+                    'did not reach %.4f' % target))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'pso': pso_runs, 'gradient': run}, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Gradients of trajectory costs with respect to model parameters.
+
+Particle swarms only ever see cost values, so calibrating even the small
+necroptosis model takes millions of simulations. :class:`GradientSimulator`
+returns, along with a cost of the observable trajectories, its gradient with
+respect to the chosen parameters (by default in log10 space, as the
+optimizers search), computed one of two ways:
+
+* ``'forward'``: the forward sensitivity equations
+  ``dS/dt = J S + df/dp`` are integrated along with the model, giving
+  every observable's derivative at every output time; their cost grows
+  with the number of parameters, so they suit small models such as
+  necroptosis
+* ``'adjoint'``: the model is integrated forward, then the adjoint
+  ``dl/dt = -J^T l`` backward from the last output time, picking up the
+  cost's derivative at every output time; its cost does not depend on
+  the number of parameters, so it suits the ferroptosis network
+
+The forward sensitivities are integrated with LSODA, which switches to its
+stiff method only where it needs to, with a finite-difference Jacobian of
+the augmented system: with the model's Jacobian on its diagonal blocks
+alone (the "simultaneous corrector" approximation of CVODES) the Newton
+iterations converge poorly, and LSODA took 3-5 times as long, BDF 15-40
+times, on necroptosis. The adjoint integrates with BDF and the sparse
+analytic Jacobians of :class:`batched_simulator.MassActionNetwork`.
+
+A cost is a callable taking the (n_times, n_observables) observable
+trajectories and returning the cost and its (n_times, n_observables)
+derivative; :func:`normalized_sse` builds the cost of
+``pso_necroptosis.obj_function``.
+"""
+import numpy as np
+import scipy.integrate
+import scipy.sparse
+import sympy
+from pysb import Parameter
+
+from batched_simulator import MassActionNetwork
+from ensemble_result import observable_matrix
+
+METHODS = ('forward', 'adjoint')
+# augmented system size up to which 'auto' uses forward sensitivities
+FORWARD_SIZE = 500
+
+
+def normalized_sse(ydata, observable=0):
+    """Sum of squared differences between ``ydata`` and an observable rescaled to 0-1
+
+    The cost of ``pso_necroptosis.obj_function``: the trajectory of column
+    ``observable`` is min-max normalized over time first. The derivative
+    goes through the (one-sided) derivatives of the minimum and maximum.
+    """
+    ydata = np.asarray(ydata, dtype=float)
+
+    def cost(observables):
+        y = observables[:, observable]
+        low, high = np.argmin(y), np.argmax(y)
+        span = y[high] - y[low]
+        norm = (y - y[low]) / span
+        residual = 2 * (norm - ydata)
+        gradient = np.zeros_like(observables)
+        g = residual / span
+        g[low] -= residual.sum() / span - (residual * norm).sum() / span
+        g[high] -= (residual * norm).sum() / span
+        gradient[:, observable] = g
+        return float(np.sum((norm - ydata) ** 2)), gradient
+
+    return cost
+
+
+class GradientSimulator(object):
+    """Simulate a model's observables with their derivatives by chosen parameters
+
+    Parameters
+    ----------
+    model : pysb.Model
+    tspan : np.ndarray
+        Output times
+    parameters : np.ndarray, optional
+        Boolean mask over, or indices of, ``model.parameters`` to
+        differentiate by, e.g. pso_necroptosis' ``rate_mask``; all by
+        default
+    observables : list of str, optional
+        Observables passed to the cost, all by default
+    method : str
+        ``'forward'``, ``'adjoint'`` or ``'auto'``: forward sensitivities
+        while the augmented system has at most ``FORWARD_SIZE`` variables
+    log10 : bool
+        Differentiate by the log10 of the parameters
+    rtol, atol : float
+        Integration tolerances. ``atol`` is far below any amount a cost
+        should see: normalized costs do not depend on the scale of a
+        trajectory, so optimizers otherwise find parameters whose
+        observables are small enough to be integration error, and fit it.
+
+    Attributes
+    ----------
+    solves : int
+        ODE integrations run so far: one per forward-sensitivity solve, two
+        (forward and backward) per adjoint solve
+    """
+
+    def __init__(self, model, tspan, parameters=None, observables=None, method='auto', log10=True,
+                 rtol=1e-7, atol=1e-12):
+        self.network = MassActionNetwork(model)
+        self.model = model
+        self.tspan = np.asarray(tspan, dtype=float)
+        n_parameters = len(model.parameters)
+        if parameters is None:
+            parameters = np.arange(n_parameters)
+        parameters = np.asarray(parameters)
+        self.parameters = np.flatnonzero(parameters) if parameters.dtype == bool else parameters.astype(int)
+        names = [obs.name for obs in model.observables]
+        self.observables = names if observables is None else list(observables)
+        self.obs_matrix = observable_matrix(model)[:, [names.index(name) for name in self.observables]].toarray()
+        size = self.network.n_species * (len(self.parameters) + 1)
+        if method == 'auto':
+            method = 'forward' if size <= FORWARD_SIZE else 'adjoint'
+        if method not in METHODS:
+            raise ValueError("method must be 'forward', 'adjoint' or 'auto'")
+        self.method = method
+        self.log10 = log10
+        self.rtol = rtol
+        self.atol = atol
+        self.solves = 0
+        self._initials = self._compile_initials()
+
+    def _compile_initials(self):
+        symbols = self.network.parameter_symbols
+        subs = dict(zip(self.network.parameters, symbols))
+        values = [sympy.Integer(0)] * self.network.n_species
+        for initial in self.model.initials:
+            value = initial.value
+            value = value if isinstance(value, Parameter) else value.expand_expr()
+            values[self.model.get_species_index(initial.pattern)] = sympy.sympify(value).xreplace(subs)
+        partials = [[sympy.diff(value, p) for p in symbols] for value in values]
+        return sympy.lambdify(symbols, values, 'numpy'), sympy.lambdify(symbols, partials, 'numpy')
+
+    def _point(self, param_values):
+        """Rate constants, initial amounts and their derivatives by the chosen parameters"""
+        param_values = np.asarray(param_values, dtype=float).reshape(-1)
+        values, partials = self._initials
+        y0 = np.array([float(v) for v in values(*param_values)])
+        dy0 = np.array(partials(*param_values), dtype=float)[:, self.parameters]
+        k = self.network.rate_constants(param_values)[0]
+        dk = self.network.rate_constant_partials(param_values)[0][:, self.parameters]
+        if self.log10:
+            # d/dlog10(p) = p ln(10) d/dp
+            chain = param_values[self.parameters] * np.log(10)
+            dy0, dk = dy0 * chain, dk * chain
+        return k, dk, y0, dy0
+
+    def sensitivities(self, param_values):
+        """Observables and their derivatives by the chosen parameters, from forward sensitivities
+
+        Returns
+        -------
+        observables : np.ndarray
+            (n_times, n_observables)
+        derivatives : np.ndarray
+            (n_times, n_observables, n_chosen_parameters)
+        """
+        k, dk, y0, dy0 = self._point(param_values)
+        y, s = forward_sensitivities(self.network, k, dk, y0, dy0, self.tspan, rtol=self.rtol, atol=self.atol)
+        self.solves += 1
+        return y @ self.obs_matrix, np.einsum('so,tsp->top', self.obs_matrix, s)
+
+    def cost_and_gradient(self, param_values, cost):
+        """Value of ``cost`` on the observables of ``param_values``, and its gradient
+
+        ``param_values`` holds every model parameter; the gradient is by the
+        chosen ones. A failed integration gives a NaN cost and gradient.
+        """
+        if self.method == 'forward':
+            observables, derivatives = self.sensitivities(param_values)
+            if not np.all(np.isfinite(observables)):
+                return np.nan, np.full(len(self.parameters), np.nan)
+            value, d_observables = cost(observables)
+            return value, np.einsum('to,top->p', d_observables, derivatives)
+        k, dk, y0, dy0 = self._point(param_values)
+        trajectory = forward_solution(self.network, k, y0, self.tspan, rtol=self.rtol, atol=self.atol)
+        self.solves += 1
+        if trajectory is None:
+            return np.nan, np.full(len(self.parameters), np.nan)
+        observables = trajectory.sol(self.tspan).T @ self.obs_matrix
+        value, d_observables = cost(observables)
+        if not np.all(np.isfinite(d_observables)):
+            return np.nan, np.full(len(self.parameters), np.nan)
+        gradient = adjoint_gradient(self.network, k, dk, dy0, self.tspan, trajectory.sol,
+                                    d_observables @ self.obs_matrix.T, rtol=self.rtol, atol=self.atol)
+        self.solves += 1
+        return value, gradient
+
+
+def forward_sensitivities(network, k, dk, y0, dy0, tspan, rtol=1e-7, atol=1e-12):
+    """Integrate one parameter set with its forward sensitivities
+
+    Parameters
+    ----------
+    network : batched_simulator.MassActionNetwork
+    k : np.ndarray
+        Rate constants, shape (n_reactions,)
+    dk : np.ndarray
+        Their derivatives by the parameters, shape (n_reactions, n_parameters)
+    y0, dy0 : np.ndarray
+        Initial amounts, (n_species,), and their derivatives, (n_species, n_parameters)
+    tspan : np.ndarray
+        Output times
+
+    Returns
+    -------
+    y : np.ndarray
+        (n_times, n_species) trajectories, NaN after a failure
+    s : np.ndarray
+        (n_times, n_species, n_parameters) sensitivities dy/dp
+    """
+    n, n_p = network.n_species, dk.shape[1]
+    k1 = k[None]
+    stoichiometry = network.stoichiometry
+
+    def rhs(t, z):
+        y = z[None, :n]
+        s = z[n:].reshape(n, n_p)
+        ds = network.jacobian(k1, y)[0] @ s + stoichiometry @ (network.monomials(y)[0][:, None] * dk)
+        return np.concatenate([network.rhs(k1, y)[0], ds.ravel()])
+
+    sol = scipy.integrate.solve_ivp(rhs, (tspan[0], tspan[-1]), np.concatenate([y0, dy0.ravel()]), method='LSODA',
+                                    t_eval=tspan, rtol=rtol, atol=atol)
+    z = np.full((len(tspan), n * (n_p + 1)), np.nan)
+    z[:sol.y.shape[1]] = sol.y.T
+    return z[:, :n], z[:, n:].reshape(len(tspan), n, n_p)
+
+
+def forward_solution(network, k, y0, tspan, rtol=1e-7, atol=1e-12):
+    """Integrate one parameter set with a dense output, for :func:`adjoint_gradient`; None on failure"""
+    k1 = k[None]
+    sol = scipy.integrate.solve_ivp(lambda t, y: network.rhs(k1, y[None])[0], (tspan[0], tspan[-1]), y0,
+                                    method='BDF', dense_output=True, rtol=rtol, atol=atol,
+                                    jac=lambda t, y: network.sparse_jacobian(k, y))
+    return sol if sol.success else None
+
+
+def adjoint_gradient(network, k, dk, dy0, tspan, trajectory, d_species, rtol=1e-7, atol=1e-12):
+    """Gradient of a cost of the outputs at ``tspan`` by the adjoint method
+
+    Integrates ``dl/dt = -J^T l`` and the gradient integrand
+    ``dq/dt = -l^T df/dp`` backward from the last output time, adding the
+    cost's derivative by the species at every output time to ``l``.
+
+    Parameters
+    ----------
+    k, dk, dy0 : np.ndarray
+        As for :func:`forward_sensitivities`
+    trajectory : callable
+        Species amounts at a time, e.g. the forward solution's dense output
+    d_species : np.ndarray
+        (n_times, n_species) derivatives of the cost by the species
+
+    Returns
+    -------
+    np.ndarray
+        (n_parameters,) gradient, NaN if the backward integration fails
+    """
+    n, n_p = network.n_species, dk.shape[1]
+    k1 = k[None]
+    stoichiometry = scipy.sparse.csr_matrix(network.stoichiometry)
+
+    def rhs(t, z):
+        y = trajectory(t)[None]
+        adjoint = z[:n]
+        d_adjoint = -network.sparse_jacobian(k, y[0]).T.dot(adjoint)
+        d_gradient = -(stoichiometry.T.dot(adjoint) * network.monomials(y)[0]) @ dk
+        return np.concatenate([d_adjoint, d_gradient])
+
+    def jacobian(t, z):
+        y = trajectory(t)
+        coupling = -(dk.T * network.monomials(y[None])[0]) @ network.stoichiometry.T
+        return scipy.sparse.bmat([[-network.sparse_jacobian(k, y).T, None],
+                                  [scipy.sparse.csr_matrix(coupling), scipy.sparse.csr_matrix((n_p, n_p))]],
+                                 format='csc')
+
+    z = np.zeros(n + n_p)
+    for i in range(len(tspan) - 1, 0, -1):
+        z[:n] += d_species[i]
+        sol = scipy.integrate.solve_ivp(rhs, (tspan[i], tspan[i - 1]), z, method='BDF', rtol=rtol, atol=atol,
+                                        jac=jacobian)
+        if not sol.success:
+            return np.full(n_p, np.nan)
+        z = sol.y[:, -1]
+    adjoint = z[:n] + d_species[0]
+    return z[n:] + adjoint @ dy0
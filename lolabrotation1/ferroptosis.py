@@ -1,11 +1,8 @@
-from pylab import *
 from pysb.core import * # brings in all of the Python classes needed to define a PySB model
 from pysb.bng import *
-from pysb.integrate import *
 from pysb.macros import equilibrate, catalyze
-import matplotlib.pyplot as plt
 import numpy as np
-from pysb.simulator import ScipyOdeSimulator # Simulating an ODE with SciPy
+from model_factory import ModelFactory
 
 # instantiate a model
 Model()
@@ -258,153 +255,160 @@ Observable('FFA_rad_obs', FFA(b1=None, state="rad") ** PM)
 Observable('GPX4_GSH_Lipid_alcohol_complex_obs', GSH(b1GPX4=1, state='ox') ** Cyto % GPX4(b1GSH=1, b2PUFA_PL=2, state='a') ** Cyto % PUFA_PL(b2GPX4=2, state='lipid_alcohol') ** Cyto)
 Observable('PUFA_PL_lipid_alcohol_obs', PUFA_PL(b2GPX4=None, state="lipid_alcohol") ** Cyto)
 
-# generate_equations(model)
-# generate_network(model)
-# print(model.species)
-
-tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
-result = ScipyOdeSimulator(model, tspan=tspan).run() # run solver of model
-
-plt.figure()
-plt.plot(tspan, result.observables['PUFA_PL_liperox_obs'][:], lw = 1.5, label = 'PUFA_PL_liperox_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of PUFA_PL_liperox_obs produced [# of molecules]', fontsize=14)
-plt.title('PUFA_PL_liperox_obs molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-plt.figure()
-plt.plot(tspan, result.observables['FFA_rad_obs'][:], lw = 1.5, label = 'FFA_rad_obs') #plot observable
-plt.xlabel('Time [min]', fontsize=14)
-plt.ylabel('Amount of PFFA_rad_obs produced [# of molecules]', fontsize=14)
-plt.title('FFA_rad_obs molecules')
-plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-plt.show()
-
-# plt.figure()
-# plt.plot(tspan, result.observables['Cys2_Env_obs'][:], lw = 1.5, label = 'Cys2_Env_obs molecules') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Cys2_Env_obs produced [# of molecules]', fontsize=14)
-# plt.title('Cys2_Env_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Cys2_Cyto_obs'][:], lw = 1.5, label = 'Cys2_Cyto_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Cys2_Cyto_obs produced [# of molecules]', fontsize=14)
-# plt.title('Cys2_Cyto_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['CR_obs'][:], lw = 1.5, label = 'CR_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of CR_obs produced [# of molecules]', fontsize=14)
-# plt.title('CR_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Cys_obs'][:], lw = 1.5, label = 'Cys_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Cys_obs produced [# of molecules]', fontsize=14)
-# plt.title('Cys_obs_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GCL_obs'][:], lw = 1.5, label = 'GCL_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GCL_obs produced [# of molecules]', fontsize=14)
-# plt.title('GCL_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Glut_Cys_obs'][:], lw = 1.5, label = 'Glut_Cys_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Glut_Cys_obs produced [# of molecules]', fontsize=14)
-# plt.title('Glut_Cys_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GSS_obs'][:], lw = 1.5, label = 'GSS_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GSS_obs produced [# of molecules]', fontsize=14)
-# plt.title('GSS_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GSH_unbound_red_obs'][:], lw = 1.5, label = 'GSH_unbound_red_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GSH_unbound_red_obs produced [# of molecules]', fontsize=14)
-# plt.title('GSH_unbound_red_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GSH_unbound_ox_obs'][:], lw = 1.5, label = 'GSH_unbound_ox_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GSH_unbound_ox_obs produced [# of molecules]', fontsize=14)
-# plt.title('GSH_unbound_ox_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GPX4_unbound_inactive_obs'][:], lw = 1.5, label = 'GPX4_unbound_inactive_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GPX4_unbound_inactive_obs produced [# of molecules]', fontsize=14)
-# plt.title('GPX4_unbound_inactive_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['GPX4_bound_active_obs'][:], lw = 1.5, label = 'GPX4_bound_active_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of GPX4_bound_active_obs produced [# of molecules]', fontsize=14)
-# plt.title('GPX4_bound_active_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Fe3_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
-# plt.title('Fe3_Env_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Fe3_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
-# plt.title('Fe3_Env_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
-#
-# plt.figure()
-# plt.plot(tspan, result.observables['Transferrin_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
-# plt.xlabel('Time [min]', fontsize=14)
-# plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
-# plt.title('Fe3_Env_obs molecules')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
-# plt.show()
\ No newline at end of file
+# the network is generated and the ODEs compiled on first use, not on import; the network is stiff,
+# so its default simulator is the sparse-LU BDF path
+get_model = ModelFactory(model, stiff=True)
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    # generate_equations(model)
+    # generate_network(model)
+    # print(model.species)
+
+    tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
+    result = get_model.simulator(tspan).run() # run solver of model
+
+    plt.figure()
+    plt.plot(tspan, result.observables['PUFA_PL_liperox_obs'][:], lw = 1.5, label = 'PUFA_PL_liperox_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of PUFA_PL_liperox_obs produced [# of molecules]', fontsize=14)
+    plt.title('PUFA_PL_liperox_obs molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+    plt.figure()
+    plt.plot(tspan, result.observables['FFA_rad_obs'][:], lw = 1.5, label = 'FFA_rad_obs') #plot observable
+    plt.xlabel('Time [min]', fontsize=14)
+    plt.ylabel('Amount of PFFA_rad_obs produced [# of molecules]', fontsize=14)
+    plt.title('FFA_rad_obs molecules')
+    plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    plt.show()
+
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Cys2_Env_obs'][:], lw = 1.5, label = 'Cys2_Env_obs molecules') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Cys2_Env_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Cys2_Env_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Cys2_Cyto_obs'][:], lw = 1.5, label = 'Cys2_Cyto_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Cys2_Cyto_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Cys2_Cyto_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['CR_obs'][:], lw = 1.5, label = 'CR_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of CR_obs produced [# of molecules]', fontsize=14)
+    # plt.title('CR_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Cys_obs'][:], lw = 1.5, label = 'Cys_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Cys_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Cys_obs_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GCL_obs'][:], lw = 1.5, label = 'GCL_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GCL_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GCL_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Glut_Cys_obs'][:], lw = 1.5, label = 'Glut_Cys_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Glut_Cys_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Glut_Cys_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GSS_obs'][:], lw = 1.5, label = 'GSS_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GSS_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GSS_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GSH_unbound_red_obs'][:], lw = 1.5, label = 'GSH_unbound_red_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GSH_unbound_red_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GSH_unbound_red_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GSH_unbound_ox_obs'][:], lw = 1.5, label = 'GSH_unbound_ox_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GSH_unbound_ox_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GSH_unbound_ox_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GPX4_unbound_inactive_obs'][:], lw = 1.5, label = 'GPX4_unbound_inactive_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GPX4_unbound_inactive_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GPX4_unbound_inactive_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['GPX4_bound_active_obs'][:], lw = 1.5, label = 'GPX4_bound_active_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of GPX4_bound_active_obs produced [# of molecules]', fontsize=14)
+    # plt.title('GPX4_bound_active_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Fe3_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Fe3_Env_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Fe3_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Fe3_Env_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
+    #
+    # plt.figure()
+    # plt.plot(tspan, result.observables['Transferrin_Env_obs'][:], lw = 1.5, label = 'Fe3_Env_obs') #plot observable
+    # plt.xlabel('Time [min]', fontsize=14)
+    # plt.ylabel('Amount of Fe3_Env_obs produced [# of molecules]', fontsize=14)
+    # plt.title('Fe3_Env_obs molecules')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # # plt.savefig('GSH:GPX4 binding.pdf') # to save figure
+    # plt.show()
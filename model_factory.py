@@ -0,0 +1,69 @@
+"""Per-process model and simulator factories for the pathway model modules.
+
+The model modules (necroptosis, GPX4Pathway, IronPathway and
+lolabrotation1.ferroptosis) only declare their PySB components at import time.
+Generating the reaction network and compiling the ODE right-hand side are left
+to the first caller that actually needs them, and the results are kept for the
+lifetime of the process. Networks come from the on-disk cache in
+network_cache whenever the model structure has been generated before.
+"""
+import numpy as np
+
+from network_cache import generate_equations
+
+
+class ModelFactory(object):
+    """Return a model, building its network and simulators lazily
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model declared by the calling module
+    stiff : bool
+        Make :meth:`simulator`'s default the sparse-LU BDF path of
+        :class:`batched_simulator.BatchedOdeSimulator` instead of
+        ``ScipyOdeSimulator``, for stiff networks on which it is faster
+
+    Examples
+    --------
+    >>> get_model = ModelFactory(model)
+    >>> model = get_model(equations=True)
+    >>> solver = get_model.simulator(np.linspace(0, 960, 8))
+    """
+
+    def __init__(self, model, stiff=False):
+        self.model = model
+        self.stiff = stiff
+        self._simulators = {}
+
+    def __call__(self, equations=False):
+        """Return the model, generating its reaction network if asked to"""
+        if equations and not self.model.reactions:
+            generate_equations(self.model)
+        return self.model
+
+    def simulator(self, tspan, simulator_class=None, **kwargs):
+        """Return a simulator for ``tspan``, compiling it once per process"""
+        if simulator_class is None and self.stiff:
+            from batched_simulator import BatchedOdeSimulator as simulator_class
+            kwargs.setdefault('integrator', 'bdf')
+        elif simulator_class is None:
+            # imported here so that importing a model does not pull in scipy
+            from pysb.simulator import ScipyOdeSimulator as simulator_class
+        tspan = np.asarray(tspan, dtype=float)
+        key = (simulator_class, tspan.tobytes(), repr(sorted(kwargs.items())))
+        if key not in self._simulators:
+            self._simulators[key] = simulator_class(self(equations=True), tspan=tspan, **kwargs)
+        return self._simulators[key]
+
+    def tuned_simulator(self, tspan, param_values=None, target=1e-3, verbose=False, **kwargs):
+        """Return a simulator with the integrator and tolerances :func:`autotune.autotune` picks
+
+        The choice is probed on ``param_values`` (or the model's parameters)
+        the first time and cached on disk after that.
+        """
+        from autotune import autotune, simulator_options
+        tuned = autotune(self(equations=True), tspan, param_values=param_values, target=target, verbose=verbose)
+        simulator_class, options = simulator_options(tuned)
+        options.update(kwargs)
+        return self.simulator(tspan, simulator_class=simulator_class, **options)
@@ -0,0 +1,335 @@
+"""Batched ODE simulation of a cell population on several CPU cores.
+
+Opt2QcalibrationHCT116CV.py simulated its heterogeneous cells with the
+``cupsoda`` GPU solver, and chose a GPU per evaluating process from
+``current_process().ident % 4``. :class:`MulticoreSimulator` takes the same
+arguments, and a parameter table with one row per cell, and integrates the
+cells with :class:`batched_simulator.BatchedOdeSimulator`'s integrators on
+CPU cores instead:
+
+* the cells are sorted by stiffness and split into chunks, at least
+  ``chunks_per_process`` per worker process, so one slow chunk does not
+  leave the other cores idle
+* each worker is pinned to one core of the simulator's :attr:`cores` and
+  writes its chunks' trajectories straight into a shared-memory array,
+  so only rate constants and initial amounts are sent to the workers
+* :func:`core_group` splits the cores among the processes evaluating the
+  likelihood, so each evaluating process gets its own cores in place of a
+  GPU index
+
+Every run records the cells simulated per second in :attr:`last_run`::
+
+    python multicore_simulator.py --cells 160 --processes 1 2 4
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from multiprocessing.util import Finalize
+
+import numpy as np
+import pandas as pd
+
+from batched_simulator import _SPARSE_METHODS, BatchedOdeSimulator, integrate_block, integrate_sparse
+from ensemble_result import EnsembleResult
+
+# set in each worker by _start_worker
+_network = None
+_buffers = {}
+
+
+def available_cores():
+    """CPU cores this process may run on"""
+    return sorted(os.sched_getaffinity(0))
+
+
+def core_group(n_groups, index=None, cores=None):
+    """The ``index``-th of ``n_groups`` equal, disjoint groups of ``cores``
+
+    Parameters
+    ----------
+    n_groups : int
+        Processes sharing the cores, e.g. the workers of the pool that
+        evaluates the likelihood
+    index : int, optional
+        Group wanted; by default the calling pool worker's number (one for
+        the first worker started), so each worker of a pool gets a
+        different group
+    cores : list of int, optional
+        Cores to split (default :func:`available_cores`)
+
+    With more groups than cores, groups share cores round-robin.
+    """
+    cores = available_cores() if cores is None else sorted(cores)
+    if index is None:
+        identity = multiprocessing.current_process()._identity
+        index = identity[-1] - 1 if identity else 0
+    index %= n_groups
+    if n_groups > len(cores):
+        return [cores[index % len(cores)]]
+    size = len(cores) // n_groups
+    return cores[index * size:(index + 1) * size]
+
+
+def param_array(model, param_table):
+    """(n_cells, n_parameters) values of ``model``'s parameters from a table with one row per cell
+
+    ``param_table`` is a DataFrame in the layout of Opt2Q's noise model
+    output: parameters the model has take their column's values, the
+    others their default; columns the model has no parameter for (e.g.
+    experimental conditions, ``simulation``) are ignored.
+    """
+    values = np.tile([p.value for p in model.parameters], (len(param_table), 1))
+    for j, parameter in enumerate(model.parameters):
+        if parameter.name in param_table.columns:
+            values[:, j] = param_table[parameter.name].values
+    return values
+
+
+def _start_worker(network, cores, started):
+    # the pool forks, so the network and the counter are inherited rather than pickled
+    global _network
+    _network = network
+    with started.get_lock():
+        core = cores[started.value % len(cores)]
+        started.value += 1
+    os.sched_setaffinity(0, {core})
+
+
+def _free(memory):
+    memory.close()
+    memory.unlink()
+
+
+def _attach(name, shape, dtype):
+    # the parent reuses its buffer while it is large enough, with the shape of each run
+    if name not in _buffers:
+        for memory in _buffers.values():
+            memory.close()
+        _buffers.clear()
+        _buffers[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=_buffers[name].buf)
+
+
+def _integrate_chunk(buffer, rows, k, y0, tspan, integrator, rtol, atol, max_steps, projection):
+    """Integrate one chunk of cells in a worker into rows ``rows`` of the shared output"""
+    trajectories = _attach(*buffer)
+    if integrator == 'rosenbrock':
+        trajectories[rows] = integrate_block(_network, k, y0, tspan, rtol=rtol, atol=atol, max_steps=max_steps,
+                                             projection=projection)
+    else:
+        trajectories[rows] = integrate_sparse(_network, k, y0, tspan, method=_SPARSE_METHODS[integrator],
+                                              rtol=rtol, atol=atol, projection=projection)
+    return len(rows)
+
+
+class MulticoreSimulator(BatchedOdeSimulator):
+    """Simulate a population of cells on several CPU cores
+
+    A drop-in for pysb's ``CupSodaSimulator``: the same arguments, and
+    ``param_values``, given to the constructor, :meth:`run` or set, may
+    also be a parameter table with one row per cell (see
+    :func:`param_array`). Takes :class:`BatchedOdeSimulator`'s
+    keyword arguments, ``integrator_options`` as cupSODA's (``rtol``,
+    ``atol``, ``max_steps``), and:
+
+    * ``cores``: cores to run on (default all this process may use when
+      the workers start); setting :attr:`cores` later restarts the workers
+    * ``processes``: worker processes (default one per core); with one,
+      the cells are integrated in this process, pinned to ``cores`` if
+      given
+    * ``chunks_per_process``: chunks of cells per worker per run
+      (default 2)
+
+    cupSODA's ``gpu``, ``vol``, ``memory_usage``, ``obs_species_only`` and
+    ``cleanup`` are accepted and ignored. Stopping sets part way (``stop``) is not
+    supported.
+
+    The workers are started by the first run and kept until :meth:`close`.
+    """
+
+    def __init__(self, model, tspan=None, initials=None, param_values=None, verbose=False, **kwargs):
+        for cupsoda_only in ('gpu', 'vol', 'memory_usage', 'obs_species_only', 'cleanup'):
+            kwargs.pop(cupsoda_only, None)
+        for name, value in (kwargs.pop('integrator_options', None) or {}).items():
+            if name not in ('rtol', 'atol', 'max_steps'):
+                raise ValueError('Unsupported integrator option: %s' % name)
+            kwargs.setdefault(name, value)
+        cores = kwargs.pop('cores', None)
+        self.processes = kwargs.pop('processes', None)
+        self.chunks_per_process = kwargs.pop('chunks_per_process', 2)
+        super(MulticoreSimulator, self).__init__(model, tspan=tspan, initials=initials, param_values=param_values,
+                                                 verbose=verbose, **kwargs)
+        self._cores = None if cores is None else sorted(cores)
+        self._pool = None
+        self._memory = None
+        # stop the workers and free the buffer when the simulator is collected, or as the process exits: a process
+        # started by multiprocessing waits for its children, so the workers must be stopped first, and before the
+        # pool's own queues are closed (priority 10)
+        self._pool_finalizer = self._memory_finalizer = None
+        self._owner = os.getpid()
+        self.last_run = None
+        """``cells``, ``processes``, ``seconds`` and ``cells_per_second`` of the last run"""
+
+    @property
+    def cores(self):
+        """Cores the workers run on, one worker per core (round-robin if more workers)"""
+        return available_cores() if self._cores is None else self._cores
+
+    @cores.setter
+    def cores(self, cores):
+        cores = None if cores is None else sorted(cores)
+        self._forget_inherited()
+        if cores != self._cores:
+            self._shutdown()
+            self._cores = cores
+
+    @property
+    def n_processes(self):
+        return self.processes or len(self.cores)
+
+    def _forget_inherited(self):
+        # a process forked from the one that started the workers, e.g. a worker evaluating the likelihood, can
+        # neither use nor stop them, and the shared buffer is not its to free
+        if self._owner != os.getpid():
+            self._pool = self._memory = self._pool_finalizer = self._memory_finalizer = None
+            self._owner = os.getpid()
+
+    def _executor(self):
+        if self._pool is None:
+            context = multiprocessing.get_context('fork')
+            self._pool = ProcessPoolExecutor(max_workers=self.n_processes, mp_context=context,
+                                             initializer=_start_worker,
+                                             initargs=(self.network, self.cores, context.Value('i', 0)))
+            self._pool_finalizer = Finalize(self, self._pool.shutdown, exitpriority=100)
+        return self._pool
+
+    def _output_buffer(self, shape):
+        size = int(np.prod(shape)) * self.dtype.itemsize
+        if self._memory is None or self._memory.size < size:
+            self._release_memory()
+            self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self._memory_finalizer = Finalize(self, _free, args=(self._memory,), exitpriority=100)
+        return np.ndarray(shape, dtype=self.dtype, buffer=self._memory.buf)
+
+    def chunks(self, k, y0):
+        """Cell indices of each chunk, similar in stiffness, for the workers"""
+        chunk_size = min(self.group_size, max(1, math.ceil(len(y0) / (self.n_processes * self.chunks_per_process))))
+        order = np.argsort(self.network.stiffness(k, y0), kind='stable')
+        return [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+
+    def run(self, tspan=None, initials=None, param_values=None, stop=None, outputs=None):
+        """Run all cells and return an :class:`ensemble_result.EnsembleResult`"""
+        if stop is not None:
+            raise ValueError('stop is not supported by MulticoreSimulator')
+        if self.n_processes == 1:
+            if self._cores is not None:
+                os.sched_setaffinity(0, self._cores)
+            start = time.perf_counter()
+            result = super(MulticoreSimulator, self).run(tspan=tspan, initials=initials, param_values=param_values,
+                                                         outputs=outputs)
+            self._record(len(result.tout), 1, time.perf_counter() - start)
+            return result
+        start = time.perf_counter()
+        self._forget_inherited()
+        super(BatchedOdeSimulator, self).run(tspan=tspan, initials=initials,
+                                             param_values=param_values, _run_kwargs=[])
+        if outputs is None:
+            outputs = self.outputs
+        names, projection = (None, None) if outputs is None else self.projection(outputs)
+        k = self.network.rate_constants(self.param_values)
+        y0 = np.array(self.initials, dtype=float)
+        width = self.network.n_species if projection is None else projection.shape[1]
+        shape = (len(y0), len(self.tspan), width)
+        pool = self._executor()
+        trajectories = self._output_buffer(shape)
+        buffer = (self._memory.name, shape, self.dtype)
+        futures = [pool.submit(_integrate_chunk, buffer, rows, k[rows], y0[rows], self.tspan, self.integrator,
+                               self.rtol, self.atol, self.max_steps, projection)
+                   for rows in self.chunks(k, y0)]
+        for future in futures:
+            future.result()
+        # copied out of the shared buffer, which the next run overwrites
+        trajectories = np.array(trajectories)
+        tout = np.array([self.tspan] * len(y0))
+        self._record(len(y0), self.n_processes, time.perf_counter() - start)
+        self._logger.info('All simulation(s) complete')
+        return EnsembleResult(self, tout, trajectories, obs_matrix=self.obs_matrix, dtype=self.dtype, outputs=names)
+
+    def _process_incoming_params(self, new_params):
+        if isinstance(new_params, pd.DataFrame):
+            new_params = param_array(self._model, new_params)
+        return super(MulticoreSimulator, self)._process_incoming_params(new_params)
+
+    def _record(self, cells, processes, seconds):
+        self.last_run = {'cells': cells, 'processes': processes, 'seconds': seconds,
+                         'cells_per_second': cells / seconds}
+        self._logger.info('%d cells in %.3f s on %d processes: %.1f cells/s'
+                          % (cells, seconds, processes, cells / seconds))
+
+    def _release_memory(self):
+        if self._memory is not None:
+            self._memory_finalizer()
+            self._memory = self._memory_finalizer = None
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool_finalizer()
+            self._pool = self._pool_finalizer = None
+
+    def close(self):
+        """Stop the workers and free the shared output buffer"""
+        self._forget_inherited()
+        self._shutdown()
+        self._release_memory()
+
+
+def cells_per_second(model, tspan, param_values, processes, repeats=3, **kwargs):
+    """Best cells simulated per second of :class:`MulticoreSimulator` with each number of ``processes``"""
+    report = {}
+    for n in processes:
+        simulator = MulticoreSimulator(model, tspan=tspan, processes=n, **kwargs)
+        try:
+            rates = []
+            for _ in range(repeats):
+                simulator.run(param_values=param_values)
+                rates.append(simulator.last_run['cells_per_second'])
+            report[n] = max(rates)
+        finally:
+            simulator.close()
+    return report
+
+
+def main(argv=None):
+    import importlib
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', default='lolabrotation1.ferroptosis')
+    parser.add_argument('--cells', type=int, default=160, help='cells, log-normal around the model parameters')
+    parser.add_argument('--cv', type=float, default=0.2, help='coefficient of variation of the rate constants')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, len(available_cores())])
+    parser.add_argument('--integrator', default='rosenbrock', choices=['rosenbrock', 'bdf', 'radau'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    model = importlib.import_module(args.model).get_model(equations=True)
+    tspan = np.linspace(0, 5000, 100)
+    values = np.array([p.value for p in model.parameters])
+    rates = np.array([not p.name.endswith('_0') for p in model.parameters])
+    sigma = np.sqrt(np.log1p(args.cv ** 2))
+    noise = np.random.default_rng(args.seed).normal(-sigma ** 2 / 2, sigma, (args.cells, rates.sum()))
+    param_values = np.tile(values, (args.cells, 1))
+    param_values[:, rates] *= np.exp(noise)
+    print('%s: %d cells, %d species, %d cores' % (args.model, args.cells, len(model.species),
+                                                   len(available_cores())))
+    for n, rate in cells_per_second(model, tspan, param_values, args.processes, integrator=args.integrator).items():
+        print('  %2d processes: %8.1f cells/s' % (n, rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
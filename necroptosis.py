@@ -1,11 +1,8 @@
-from pylab import *
 from pysb.core import *
 from pysb.bng import *
-from pysb.integrate import *
 from pysb.macros import catalyze
-import matplotlib.pyplot as plt
 import numpy as np
-from pysb.simulator import ScipyOdeSimulator
+from model_factory import ModelFactory
 
 # instantiate a model
 Model()
@@ -50,17 +47,20 @@ Observable('CII_MLKL_bind_obs', CII(bMLKL=1, state='a') % MLKL(bCII=1, state='u'
 Observable('MLKLu_obs', MLKL(bCII=None, state='u'))
 Observable('MLKLp_obs', MLKL(bCII=None, state='p'))
 
-generate_equations(model)
+# the network is generated and the ODEs compiled on first use, not on import
+get_model = ModelFactory(model)
 
-tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
-result = ScipyOdeSimulator(model, tspan=tspan).run() # run solver of model
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
 
-# plt.figure()
-# plt.plot(tspan, result.observables['MLKLp_obs'][:], lw = 1.5, label = 'MLKLp_obs') #plot observable
-# plt.xlabel('Time [hours]', fontsize=14)
-# plt.ylabel('Phosphorylated MLKL amount [molecules]', fontsize=14)
-# plt.title('Amount of MLKLp over time')
-# plt.legend(loc = 'best', fontsize = 12) # add legend to plot
-# plt.savefig('pMLKL to paramset14.pdf') # to save figure
-# plt.show()
+    tspan = np.linspace(0, 1440, 1441) # time span of simulation (start, stop, step)
+    result = get_model.simulator(tspan).run() # run solver of model
 
+    # plt.figure()
+    # plt.plot(tspan, result.observables['MLKLp_obs'][:], lw = 1.5, label = 'MLKLp_obs') #plot observable
+    # plt.xlabel('Time [hours]', fontsize=14)
+    # plt.ylabel('Phosphorylated MLKL amount [molecules]', fontsize=14)
+    # plt.title('Amount of MLKLp over time')
+    # plt.legend(loc = 'best', fontsize = 12) # add legend to plot
+    # plt.savefig('pMLKL to paramset14.pdf') # to save figure
+    # plt.show()
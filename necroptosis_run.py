@@ -6,8 +6,13 @@ from pysb.macros import catalyze
 import matplotlib.pyplot as plt
 import numpy as np
 from pysb.simulator import ScipyOdeSimulator
-from necroptosis import model
+from necroptosis import model, get_model
+from batched_simulator import BatchedOdeSimulator
+from ensemble import stream_ensemble
+from ensemble_plot import ensemble_figure, stats_figure
+from trajectory_store import TrajectoryStore, fingerprint
 import pandas as pd
+import shutil
 
 # print('model species')
 # print(model.species)
@@ -41,96 +46,53 @@ x100 = np.array([30, 90, 270, 480, 600, 720, 840, 960]) # time in minutes
 y100 = np.array([0.00885691708746097,0.0161886154261265,0.0373005242261882,0.2798939020159581,0.510, .7797294067, 0.95,1]) # normalized values
 
 tspan = np.linspace(0, 1440, 101) # time span of simulation (start, stop, step)
-# Scipy is a Python library for scientific computing. Scipy is the solver for our model
-result = ScipyOdeSimulator(model, tspan=tspan).run(param_values=all_pars) # run solver of model
-# Simulation results
-df = result.dataframe
+solver = get_model.simulator(tspan, simulator_class=BatchedOdeSimulator)
 
-plt.figure(figsize=(15,10))
-plt.subplot(241)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['TNF_obs'].iloc[:], lw = 1.5, label = 'TNF_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount produced [molecules]', fontsize=14)
-plt.title('TNF_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
+# Stream the ensemble through the solver in chunks that fit in memory_budget bytes, keeping running statistics of
+# every observable, instead of holding all trajectories at once. Set to False to simulate and summarise them all at once
+stream = True
+memory_budget = 256 * 2 ** 20
 
-# plt.figure()
-plt.subplot(242)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['CI_inactive_obs'].iloc[:], lw = 1.5, label = 'CI_inactive_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('CI_inactive_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
+# The trajectories are written to this store the first time, and read back instead of simulated on later runs
+# (None: always simulate). The store records a hash of the model, tspan and all_pars; a store of anything else is
+# out of date, so it is removed and the trajectories simulated again
+store_path = 'necro_trajectories_25_100_927_TNF100'
+store = None
+if store_path is not None:
+    store_kwargs = dict(observables=[obs.name for obs in model.observables], tspan=tspan,
+                        fingerprint=fingerprint(model, tspan, all_pars))
+    try:
+        store = TrajectoryStore(store_path, **store_kwargs)
+    except ValueError as error:
+        print('%s; simulating again' % error)
+        shutil.rmtree(store_path)
+        store = TrajectoryStore(store_path, **store_kwargs)
+stored = store is not None and len(store) == n_pars
 
-# plt.figure()
-plt.subplot(243)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['TNF_CI_CIi_obs'].iloc[:], lw = 1.5, label = 'TNF_CI_CIi_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('TNF_CI_CIi_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
+# Each observable's trajectories are drawn as a density image ('density') or as percentile bands ('bands') rather
+# than one line per parameter set; MLKLp is normalized as in the calibration and drawn with its data
+kind = 'density'
+data = {'MLKLp_obs': (x100, y100)}
 
-# plt.figure()
-plt.subplot(244)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['CIa_obs'].iloc[:], lw = 1.5, label = 'CIa_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('CIa_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
+trajectories = store
+if not stored and stream:
+    stats = stream_ensemble(solver, all_pars, memory_budget=memory_budget, store=store, verbose=True)
+    if store is None:
+        # without a store the stream keeps only a sample of the trajectories, so its density and quantiles come from
+        # that sample, and MLKLp is not normalized
+        stats_figure(stats, kind=kind, data=data)
+        plt.show()
+elif not stored:
+    # all parameter sets are integrated together as one vectorized system
+    result = solver.run(param_values=all_pars) # run solver of model
+    if store is not None:
+        store.append(np.arange(n_pars), result)
+    # Simulation results: result.observables['name'] is a (n_sets, n_times) view of that observable
+    trajectories = result.observables
 
-# plt.figure()
-plt.subplot(245)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['CIIa_obs'].iloc[:], lw = 1.5, label = 'CIIa_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('CIIa_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
-
-# plt.figure()
-plt.subplot(246)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['CII_MLKL_bind_obs'].iloc[:], lw = 1.5, label = 'CII_MLKL_bind_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('CII_MLKL_bind_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
-
-# plt.figure()
-plt.subplot(247)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['MLKLu_obs'].iloc[:], lw = 1.5, label = 'MLKLu_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('MLKLu_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
-
-# plt.figure()
-plt.subplot(248)
-for i in range(len(all_pars)):
-    plt.plot(tspan, df.loc[i]['MLKLp_obs'].iloc[:], lw = 1.5, label = 'MLKLp_obs') #plot observable
-# plt.scatter(x100, y100)
-plt.xlabel('Time min', fontsize=14)
-plt.ylabel('Amount of produced [molecules]', fontsize=14)
-plt.title('MLKLp_obs')
-# plt.legend(loc = 'best', fontsize = 12) #add legend to plot
-# plt.savefig('E+S_to_P.pdf') #to save figure
-plt.show()
+if trajectories is not None:
+    # store['name'] is a (n_sets, n_times) array of that observable, read from disk; the first run draws the same
+    # figure from the store it has just filled as later runs do
+    ensemble_figure(tspan, trajectories, [obs.name for obs in model.observables], kind=kind, data=data,
+                    normalized=['MLKLp_obs'])
+    plt.show()
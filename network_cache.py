@@ -0,0 +1,117 @@
+"""Persistent on-disk cache for BioNetGen network generation.
+
+``generate_equations`` shells out to BNG and parses the resulting net file,
+which holds the species, the reactions (from which PySB derives the ODEs) and
+the observable-to-species groups. The net file text is stored under a key
+hashed from the model's structure: monomers, compartments, rules, initials,
+observables, expressions, energy patterns and tags. Parameter values are not
+part of the key, so editing a rate constant or an initial amount reuses the
+cached network; editing a rule only invalidates the cache entry of the model
+that contains it.
+
+The cache directory defaults to ``~/.cache/lolabrotation1/networks`` and can
+be moved with the ``NETWORK_CACHE_DIR`` environment variable.
+"""
+import hashlib
+import os
+import tempfile
+
+import pysb
+import pysb.bng
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on Windows, workers may race BNG
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lolabrotation1', 'networks')
+
+
+def cache_dir():
+    """Directory that holds the cached net files"""
+    return os.environ.get('NETWORK_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def model_hash(model):
+    """Hash of everything in ``model`` that determines its reaction network"""
+    h = hashlib.sha1(('pysb ' + pysb.__version__).encode())
+    for components in (model.monomers, model.compartments, model.rules, model.initials,
+                       model.observables, model.expressions, model.energypatterns, model.tags):
+        for component in components:
+            h.update(repr(component).encode())
+            h.update(b'\n')
+        h.update(b'--\n')
+    return h.hexdigest()
+
+
+def net_path(model, directory=None):
+    """Path of the cached net file for ``model``"""
+    return os.path.join(directory or cache_dir(), '%s-%s.net' % (model.name, model_hash(model)))
+
+
+def generate_equations(model, cache=True, directory=None, cleanup=True, verbose=False, **kwargs):
+    """Like :func:`pysb.bng.generate_equations`, reusing a cached network when possible
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model whose species, reactions and observable groups are filled in
+    cache : bool
+        If False, always run BNG (the result is still written to the cache)
+    directory : str, optional
+        Cache directory, defaults to :func:`cache_dir`
+    cleanup, verbose, kwargs
+        Passed to :func:`pysb.bng.generate_network` on a cache miss
+
+    Returns
+    -------
+    bool
+        True if the network was loaded from the cache
+    """
+    if model.reactions:
+        return True
+    path = net_path(model, directory)
+    if cache and os.path.exists(path):
+        _load(model, path)
+        return True
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'w') as lock:
+        # only one process runs BNG for a given model; the others wait for it
+        # and then read its result
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if cache and os.path.exists(path):
+                _load(model, path)
+                return True
+            text = pysb.bng.generate_network(model, cleanup=cleanup, verbose=verbose, **kwargs)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    pysb.bng._parse_netfile(model, iter(text.split('\n')))
+    return False
+
+
+def _load(model, path):
+    with open(path) as f:
+        pysb.bng._parse_netfile(model, iter(f.read().split('\n')))
+
+
+def clear(model=None, directory=None):
+    """Remove the cached network of ``model``, or every cached network"""
+    directory = directory or cache_dir()
+    if model is not None:
+        paths = [net_path(model, directory)]
+    elif os.path.isdir(directory):
+        paths = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.net')]
+    else:
+        paths = []
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
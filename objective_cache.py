@@ -0,0 +1,219 @@
+"""Memoizing cache around calibration cost functions.
+
+Swarms revisit nearly the same parameter vectors, most visibly at the bounds
+where positions are clipped. :class:`ObjectiveCache` keys each vector by its
+coordinates rounded to ``resolution`` and returns the stored cost for a
+repeat instead of simulating it again. The most recently used ``max_size``
+costs are held in memory. With a ``path``, every cost is also written to a
+SQLite file, which keeps them across restarts and lets every worker of a
+campaign see what the others have computed. The file keeps at most
+``max_file_size`` costs, of all namespaces, dropping the least recently
+used.
+
+Cached costs are only valid for one cost function on one model and data set.
+Give each a distinct ``namespace`` (e.g. from :func:`network_cache.model_hash`
+and the data) when they share a file.
+"""
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from parallel_pso import _fitness
+
+# in-memory caches of this process, shared by every ObjectiveCache (and
+# unpickled copy of one) with the same namespace, resolution and path
+_stores = {}
+
+
+class _Store(object):
+
+    def __init__(self):
+        self.costs = OrderedDict()
+        self.hits = 0
+        self.file_hits = 0
+        self.misses = 0
+        self.db = None
+        self.pid = None
+
+
+class ObjectiveCache(object):
+    """Cost function wrapper that remembers the costs it has computed
+
+    Parameters
+    ----------
+    cost_function : callable
+        Cost of a parameter vector, or of a (n_particles, n_dims) array of
+        them if ``batched``
+    batched : bool
+        Whether ``cost_function`` is batched; only the uncached rows are
+        passed on to it, in one call
+    resolution : float
+        Vectors whose coordinates round to the same multiples of this share
+        a cost
+    max_size : int
+        Costs held in memory, least recently used evicted first
+    path : str, optional
+        SQLite file keeping the costs across restarts and processes
+    max_file_size : int
+        Costs kept in the file, least recently used removed first
+    namespace : str
+        Distinguishes cost functions sharing a file
+
+    Examples
+    --------
+    >>> cost = ObjectiveCache(obj_function_batch, batched=True, path='necro_costs.sqlite')
+    >>> optimizer = ParallelPSO(batch_cost_function=cost, start=log10_original_values)
+    """
+
+    def __init__(self, cost_function, batched=False, resolution=1e-6, max_size=100000, path=None,
+                 max_file_size=1000000, namespace='default'):
+        self.cost_function = cost_function
+        self.batched = batched
+        self.resolution = resolution
+        self.max_size = max_size
+        self.path = None if path is None else os.path.abspath(path)
+        self.max_file_size = max_file_size
+        self.namespace = namespace
+        self._store = _store(self._store_key())
+
+    def _store_key(self):
+        return self.namespace, self.resolution, self.path
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_store']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._store = _store(self._store_key())
+
+    def keys(self, positions):
+        """Cache keys of a (n, n_dims) array of positions"""
+        grid = np.round(np.asarray(positions, dtype=float) / self.resolution).astype(np.int64)
+        return [row.tobytes() for row in np.atleast_2d(grid)]
+
+    def __call__(self, positions):
+        if self.batched:
+            return self.lookup(positions)
+        cost = self.lookup(np.asarray(positions)[np.newaxis])[0]
+        return cost,
+
+    def lookup(self, positions):
+        """Costs of a (n, n_dims) array of positions, computing only the ones not cached"""
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        keys = self.keys(positions)
+        store = self._store
+        costs = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            if key in store.costs:
+                store.costs.move_to_end(key)
+                costs[i] = store.costs[key]
+                store.hits += 1
+            else:
+                missing.append(i)
+        if missing and self.path is not None:
+            found = self._read([keys[i] for i in missing])
+            for i in missing:
+                if keys[i] in found:
+                    costs[i] = found[keys[i]]
+                    self._remember(keys[i], costs[i])
+                    store.file_hits += 1
+            missing = [i for i in missing if keys[i] not in found]
+        if missing:
+            # a position within the same cell of the grid may come up twice
+            # in one call; it is computed once
+            first = OrderedDict()
+            for i in missing:
+                first.setdefault(keys[i], i)
+            rows = list(first.values())
+            if self.batched:
+                computed = np.asarray(self.cost_function(positions[rows]), dtype=float).reshape(len(rows))
+            else:
+                computed = np.array([_fitness(self.cost_function(positions[i])) for i in rows])
+            for key, cost in zip(first, computed):
+                self._remember(key, cost)
+            if self.path is not None:
+                self._write(list(zip(first, computed)))
+            for i in missing:
+                costs[i] = store.costs[keys[i]]
+            store.misses += len(rows)
+            store.hits += len(missing) - len(rows)
+        return costs
+
+    def _remember(self, key, cost):
+        costs = self._store.costs
+        costs[key] = cost
+        costs.move_to_end(key)
+        while len(costs) > self.max_size:
+            costs.popitem(last=False)
+
+    def _connect(self):
+        store = self._store
+        # a connection inherited from the parent of a forked worker is not reused
+        if store.db is None or store.pid != os.getpid():
+            store.db = sqlite3.connect(self.path, timeout=60)
+            store.pid = os.getpid()
+            store.db.execute('PRAGMA journal_mode=WAL')
+            store.db.execute('CREATE TABLE IF NOT EXISTS costs '
+                             '(namespace TEXT, resolution REAL, key BLOB, cost REAL, used REAL, '
+                             'PRIMARY KEY (namespace, resolution, key))')
+            # files written before costs were evicted have no last-use times
+            if 'used' not in [row[1] for row in store.db.execute('PRAGMA table_info(costs)')]:
+                with store.db:
+                    store.db.execute('ALTER TABLE costs ADD COLUMN used REAL DEFAULT 0')
+        return store.db
+
+    def _read(self, keys):
+        db = self._connect()
+        found = {}
+        # stay below SQLite's limit on bound variables
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = db.execute('SELECT key, cost FROM costs WHERE namespace = ? AND resolution = ? AND key IN (%s)'
+                              % ','.join('?' * len(chunk)), [self.namespace, self.resolution] + chunk)
+            # SQLite keeps NaN as NULL
+            found.update((bytes(key), np.nan if cost is None else cost) for key, cost in rows)
+        if found:
+            with db:
+                db.executemany('UPDATE costs SET used = ? WHERE namespace = ? AND resolution = ? AND key = ?',
+                               [(time.time(), self.namespace, self.resolution, key) for key in found])
+        return found
+
+    def _write(self, items):
+        db = self._connect()
+        with db:
+            now = time.time()
+            db.executemany('INSERT OR REPLACE INTO costs VALUES (?, ?, ?, ?, ?)',
+                           [(self.namespace, self.resolution, key, float(cost), now) for key, cost in items])
+            excess = db.execute('SELECT COUNT(*) FROM costs').fetchone()[0] - self.max_file_size
+            if excess > 0:
+                db.execute('DELETE FROM costs WHERE rowid IN (SELECT rowid FROM costs ORDER BY used LIMIT ?)',
+                           (excess,))
+
+    def stats(self):
+        """Lookups answered from memory and from the file, and costs computed, in this process"""
+        store = self._store
+        lookups = store.hits + store.file_hits + store.misses
+        return {'hits': store.hits, 'file_hits': store.file_hits, 'misses': store.misses,
+                'size': len(store.costs),
+                'hit_rate': (store.hits + store.file_hits) / float(lookups) if lookups else 0.0}
+
+    def clear(self):
+        """Forget every cost of this namespace, in memory and in the file"""
+        store = self._store
+        store.costs.clear()
+        store.hits = store.file_hits = store.misses = 0
+        if self.path is not None:
+            with self._connect() as db:
+                db.execute('DELETE FROM costs WHERE namespace = ?', (self.namespace,))
+
+
+def _store(key):
+    if key not in _stores:
+        _stores[key] = _Store()
+    return _stores[key]
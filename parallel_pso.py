@@ -0,0 +1,360 @@
+"""Particle swarm optimization with whole-swarm evaluation on a process pool.
+
+:class:`ParallelPSO` follows the update rule of simplepso's ``PSO`` (Kennedy's
+constriction coefficients, clipped speeds and positions, shrinking inertia),
+but keeps the swarm in arrays and hands every generation's particles to an
+executor in one go. Pass the same executor to every restart of a campaign so
+the worker processes, and the simulators they built, stay alive between
+restarts.
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_PHI = 2.05
+_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+class EvaluationPool(ProcessPoolExecutor):
+    """ProcessPoolExecutor that knows its number of workers, :attr:`num_workers`"""
+
+    def __init__(self, num_workers, initializer=None, initargs=()):
+        super(EvaluationPool, self).__init__(max_workers=num_workers, initializer=_start_worker,
+                                             initargs=(initializer, initargs))
+        self.num_workers = num_workers
+
+
+def _start_worker(initializer, initargs):
+    # keep each worker on one core; numpy's BLAS would otherwise fan out. The variables only reach libraries loaded
+    # after this (a spawned worker's); threadpoolctl, if installed, also limits those already loaded
+    for variable in _THREAD_VARIABLES:
+        os.environ[variable] = '1'
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(1)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def evaluation_pool(num_processors=None, initializer=None, initargs=()):
+    """Persistent pool of worker processes for evaluating particles
+
+    ``initializer`` runs once in each worker, which is the place to build
+    and warm up the worker's simulator.
+    """
+    return EvaluationPool(num_processors or os.cpu_count(), initializer=initializer, initargs=initargs)
+
+
+def _fitness(value):
+    # cost functions in this repo return one-element tuples
+    return value[0] if isinstance(value, (tuple, list)) else value
+
+
+class ParallelPSO(object):
+    """Particle swarm optimizer evaluating each generation as one batch
+
+    Parameters
+    ----------
+    cost_function : callable
+        Takes a parameter vector and returns its cost, or a one-element tuple
+        holding it. Must be picklable (a module-level function) to run on a
+        process pool.
+    start : array
+        Starting position; bounds set with ``parameter_range`` are around it
+    verbose : bool
+        Print swarm statistics every iteration
+    shrink_steps : bool
+        Shrink the inertia weight as iterations progress
+    seed : int, optional
+        Seed for the swarm's random number generator
+    batch_cost_function : callable, optional
+        Takes a (n_particles, n_dims) array of positions and returns the
+        array of their costs. Used instead of ``cost_function`` when given,
+        so each generation is one call, e.g. one multi-parameter simulation.
+    bounded_cost_function : callable, optional
+        Like ``batch_cost_function`` but also takes the cost each particle
+        has to beat, and may stop evaluating a particle once it cannot.
+        Returns the costs (inf for the stopped particles) and a boolean
+        array marking the particles evaluated in full.
+    bound : str
+        What a bounded evaluation has to beat: ``'personal'``, the
+        particle's own best, or ``'swarm'``, the swarm's best so far.
+        With ``'swarm'`` more evaluations stop early, but a particle that
+        only improves on its own best is not recorded as doing so.
+    """
+
+    def __init__(self, cost_function=None, start=None, verbose=False, shrink_steps=True, seed=None,
+                 batch_cost_function=None, bounded_cost_function=None, bound='personal'):
+        if cost_function is None and batch_cost_function is None and bounded_cost_function is None:
+            raise ValueError('Must provide cost_function, batch_cost_function or bounded_cost_function')
+        if bound not in ('personal', 'swarm'):
+            raise ValueError("bound must be 'personal' or 'swarm'")
+        self.cost_function = cost_function
+        self.batch_cost_function = batch_cost_function
+        self.bounded_cost_function = bounded_cost_function
+        self.bound = bound
+        self.start = None if start is None else np.array(start, dtype=float)
+        self.verbose = verbose
+        self.update_w = shrink_steps
+        self.rng = np.random.default_rng(seed)
+        self.lb = self.ub = None
+        self.min_speed, self.max_speed = -10000, 10000
+        fi = _PHI + _PHI
+        self.w = 2.0 / np.abs(2.0 - fi - np.sqrt(fi ** 2 - 4 * fi))
+
+        self.best = None
+        """Best position found by the swarm"""
+        self.best_fitness = np.inf
+        self.values = np.array([])
+        """Best cost after each iteration"""
+        self.history = np.empty((0, 0))
+        """Best position after each iteration"""
+        self.n_evaluations = 0
+        """Particles evaluated, in full or not"""
+        self.n_aborted = 0
+        """Evaluations a bounded cost function stopped early"""
+        self.iteration = 0
+        """Number of generations completed"""
+        self.stopping_rules = []
+        self.stopped_by = None
+        """Stopping rule that ended the run, if any"""
+        self.stop_iteration = None
+        self.initial_positions = None
+        self.pos = self.speed = self.pbest_pos = self.pbest_fit = None
+
+    def set_start_position(self, position):
+        self.start = np.array(position, dtype=float)
+
+    def set_speed(self, speed_min=-10000, speed_max=10000):
+        """Set the min and max change of each coordinate per iteration"""
+        self.min_speed, self.max_speed = speed_min, speed_max
+
+    def set_bounds(self, parameter_range=None, lower=None, upper=None):
+        """Set the search space, either start +/- parameter_range or explicit arrays"""
+        if self.start is None:
+            raise ValueError('Must provide a starting position before setting bounds')
+        if parameter_range is None and (lower is None or upper is None):
+            raise ValueError('Need to provide parameter_range or lower and upper')
+        self.lb = self.start - parameter_range if lower is None else np.asarray(lower, dtype=float)
+        self.ub = self.start + parameter_range if upper is None else np.asarray(upper, dtype=float)
+
+    def evaluate(self, positions, executor=None, bounds=None):
+        """Costs of a (n_particles, n_dims) array of positions
+
+        ``bounds``, the costs to beat, is only used by a bounded cost function.
+        """
+        # executors other than an EvaluationPool are assumed to have a worker per core
+        n_workers = getattr(executor, 'num_workers', None) or os.cpu_count()
+        if self.bounded_cost_function is not None:
+            if bounds is None:
+                bounds = np.full(len(positions), np.inf)
+            if executor is None:
+                costs, completed = self.bounded_cost_function(positions, bounds)
+            else:
+                n_blocks = min(n_workers, len(positions))
+                results = list(executor.map(self.bounded_cost_function, np.array_split(positions, n_blocks),
+                                            np.array_split(bounds, n_blocks)))
+                costs = np.concatenate([r[0] for r in results])
+                completed = np.concatenate([r[1] for r in results])
+            self.n_evaluations += len(positions)
+            self.n_aborted += int(np.sum(~np.asarray(completed)))
+            return np.asarray(costs, dtype=float).reshape(len(positions))
+        if self.batch_cost_function is not None:
+            if executor is None:
+                costs = self.batch_cost_function(positions)
+            else:
+                # one block of particles per worker
+                blocks = np.array_split(positions, min(n_workers, len(positions)))
+                costs = np.concatenate(list(executor.map(self.batch_cost_function, blocks)))
+            self.n_evaluations += len(positions)
+            return np.asarray(costs, dtype=float).reshape(len(positions))
+        if executor is None:
+            costs = [self.cost_function(p) for p in positions]
+        else:
+            chunksize = max(1, len(positions) // (4 * n_workers))
+            costs = list(executor.map(self.cost_function, positions, chunksize=chunksize))
+        self.n_evaluations += len(positions)
+        return np.array([_fitness(c) for c in costs], dtype=float)
+
+    def run(self, num_particles, num_iterations, executor=None, checkpoint=None, checkpoint_every=10, stop=None):
+        """Run the optimization
+
+        Parameters
+        ----------
+        num_particles : int
+            Number of particles in the swarm
+        num_iterations : int
+            Number of generations
+        executor : concurrent.futures.Executor, optional
+            Executor to evaluate each generation on, typically from
+            :func:`evaluation_pool`. Evaluated in this process if None.
+        checkpoint : callable, optional
+            Called with :meth:`get_state` every ``checkpoint_every``
+            iterations, e.g. to save the swarm so the run can be resumed
+        checkpoint_every : int
+            Iterations between checkpoints
+        stop : callable, optional
+            Called with the optimizer after every iteration, like the rules
+            of :meth:`set_stopping_rules`, which are checked first
+        """
+        if self.start is None:
+            raise ValueError('Must provide a starting position')
+        if self.lb is None:
+            self.set_bounds(parameter_range=2)
+        if self.iteration == 0:
+            self._initialize(num_particles, num_iterations)
+
+        for g in range(self.iteration, num_iterations):
+            if self.update_w:
+                self.w = (num_iterations - g + 1.) / num_iterations
+            if self.bound == 'personal':
+                bounds = self.pbest_fit
+            else:
+                bounds = np.full(len(self.pos), self.best_fitness)
+            fitness = self.evaluate(self.pos, executor, bounds)
+
+            improved = fitness < self.pbest_fit
+            self.pbest_pos[improved] = self.pos[improved]
+            self.pbest_fit[improved] = fitness[improved]
+            i = np.argmin(self.pbest_fit)
+            if self.best is None or self.pbest_fit[i] < self.best_fitness:
+                self.best, self.best_fitness = self.pbest_pos[i].copy(), self.pbest_fit[i]
+
+            u1 = self.rng.uniform(0, 1, self.pos.shape)
+            u2 = self.rng.uniform(0, 1, self.pos.shape)
+            self.speed = self.w * (self.speed + _PHI * u1 * (self.pbest_pos - self.pos)
+                                   + _PHI * u2 * (self.best - self.pos))
+            self.speed = np.clip(self.speed, self.min_speed, self.max_speed)
+            self.pos = np.clip(self.pos + self.speed, self.lb, self.ub)
+
+            self.values[g] = self.best_fitness
+            self.history[g] = self.best
+            self.iteration = g + 1
+            if self.verbose:
+                self.print_stats(g + 1, fitness)
+            if checkpoint is not None and self.iteration % checkpoint_every == 0:
+                checkpoint(self.get_state())
+            rule = self._stopping_rule(stop)
+            if rule is not None:
+                self.stopped_by, self.stop_iteration = repr(rule), self.iteration
+                if self.verbose:
+                    print('stopped by %s at iteration %d' % (self.stopped_by, self.iteration))
+                break
+        return self.best
+
+    @property
+    def stopped(self):
+        """Whether the last run was ended early by a stopping rule"""
+        return self.stopped_by is not None
+
+    def _stopping_rule(self, stop):
+        for rule in self.stopping_rules + ([stop] if stop is not None else []):
+            if rule(self):
+                return rule
+        return None
+
+    def set_stopping_rules(self, *rules):
+        """End runs early once any of ``rules`` holds
+
+        A rule is called with the optimizer after every iteration and returns
+        True to stop, e.g. :class:`SwarmDiameter`, :class:`NoImprovement` or
+        :class:`RelativeStagnation`. The rule that fired and the iteration are
+        recorded in ``stopped_by`` and ``stop_iteration``.
+        """
+        self.stopping_rules = list(rules)
+
+    def set_initial_positions(self, positions):
+        """Start the swarm from these (n_particles, n_dims) positions instead of uniformly in the bounds"""
+        self.initial_positions = np.array(positions, dtype=float)
+
+    def _initialize(self, num_particles, num_iterations):
+        size = len(self.start)
+        if self.initial_positions is None:
+            self.pos = self.rng.uniform(self.lb, self.ub, (num_particles, size))
+        else:
+            self.pos = np.clip(self.initial_positions, self.lb, self.ub)
+        self.speed = self.rng.uniform(self.min_speed, self.max_speed, (num_particles, size))
+        self.pbest_pos = self.pos.copy()
+        self.pbest_fit = np.full(num_particles, np.inf)
+        self.values = np.zeros(num_iterations)
+        self.history = np.zeros((num_iterations, size))
+
+    _state_attributes = ('iteration', 'pos', 'speed', 'pbest_pos', 'pbest_fit', 'best', 'best_fitness',
+                         'values', 'history', 'w', 'n_evaluations', 'n_aborted', 'lb', 'ub', 'stopped_by',
+                         'stop_iteration')
+
+    def get_state(self):
+        """Snapshot of the swarm, from which :meth:`set_state` resumes the run"""
+        state = {name: copy.deepcopy(getattr(self, name)) for name in self._state_attributes}
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def set_state(self, state):
+        """Restore a snapshot taken by :meth:`get_state`; the next run continues from it"""
+        for name in self._state_attributes:
+            setattr(self, name, copy.deepcopy(state[name]))
+        self.rng.bit_generator.state = state['rng']
+
+    def print_stats(self, iteration, fitness):
+        if iteration == 1:
+            print('{:<10}'.format('iteration') + '\t'.join(['{:>12}'] * 6).format(
+                'best', 'mean', 'min', 'max', 'std', 'aborted'))
+        # stopped evaluations have no cost to summarise
+        fitness = fitness[np.isfinite(fitness)]
+        if fitness.size == 0:
+            fitness = np.array([np.nan])
+        print('{:<10}'.format(iteration) + '\t'.join(['{:>12.3f}'] * 5 + ['{:>12d}']).format(
+            self.best_fitness, fitness.mean(), fitness.min(), fitness.max(), fitness.std(), self.n_aborted))
+
+
+class SwarmDiameter(object):
+    """Stop once every two particles are closer than ``tol``"""
+
+    def __init__(self, tol):
+        self.tol = tol
+
+    def __call__(self, optimizer):
+        pos = optimizer.pos
+        diameter = np.sqrt(np.max(np.sum((pos[:, None] - pos[None]) ** 2, axis=2)))
+        return diameter < self.tol
+
+    def __repr__(self):
+        return 'SwarmDiameter(tol=%g)' % self.tol
+
+
+class NoImprovement(object):
+    """Stop once the best cost has improved by no more than ``tol`` in ``k`` iterations"""
+
+    def __init__(self, k, tol=0.0):
+        self.k = k
+        self.tol = tol
+
+    def __call__(self, optimizer):
+        g = optimizer.iteration
+        return g > self.k and optimizer.values[g - 1 - self.k] - optimizer.values[g - 1] <= self.tol
+
+    def __repr__(self):
+        return 'NoImprovement(k=%d, tol=%g)' % (self.k, self.tol)
+
+
+class RelativeStagnation(object):
+    """Stop once the best cost has improved by less than a fraction ``rtol`` of itself in ``k`` iterations"""
+
+    def __init__(self, k, rtol=1e-3):
+        self.k = k
+        self.rtol = rtol
+
+    def __call__(self, optimizer):
+        g = optimizer.iteration
+        if g <= self.k:
+            return False
+        before, now = optimizer.values[g - 1 - self.k], optimizer.values[g - 1]
+        return before - now <= self.rtol * abs(before)
+
+    def __repr__(self):
+        return 'RelativeStagnation(k=%d, rtol=%g)' % (self.k, self.rtol)
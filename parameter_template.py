@@ -0,0 +1,176 @@
+"""Flat parameter vectors to noise-model parameters, without DataFrames.
+
+The Opt2Q likelihood in Opt2QcalibrationHCT116CV.py turns every ``x`` into
+parameter mean and covariance DataFrames (``pd.DataFrame``, ``.iloc``,
+``pd.concat``) and passes them through ``NoiseModel.update_values`` and
+``NoiseModel.run``, which validate and pivot them again, before simulating.
+A :class:`ParameterTemplate` is laid out once, from the parameter names,
+experimental conditions and the layout of ``x``. Each evaluation then:
+
+* :meth:`ParameterTemplate.update` writes ``x`` into preallocated
+  (n_conditions, n_parameters) means and (n_conditions, n_noisy, n_noisy)
+  covariances, in place
+* :meth:`ParameterTemplate.sample` draws the cell population the way
+  Opt2Q's noise model does: multivariate log-normal, per condition, with
+  the means and covariances given, a default coefficient of variation
+  for noisy parameters without one, into a preallocated array
+
+Fresh random cells on every evaluation make the likelihood noisy between
+nearby ``x``. With ``sampling='common'`` the standard normal draws behind
+the cells are fixed once (common random numbers), and with
+``sampling='sobol'`` they are scrambled Sobol points instead, so each
+cell moves smoothly with the means and covariances in ``x`` and a few
+cells cover the population evenly. ``antithetic=True`` pairs every draw
+``z`` with ``-z``.
+
+:attr:`ParameterTemplate.frame` is a DataFrame in the layout of
+``NoiseModel.run()`` (parameters, conditions, ``simulation``), made once
+and sharing memory with the samples, for simulators that want one.
+"""
+import numpy as np
+import pandas as pd
+import scipy.special
+from scipy.stats import qmc
+
+SAMPLING = ('random', 'common', 'sobol')
+
+
+class ParameterTemplate(object):
+    """Preallocated parameter means, covariances and samples per experimental condition
+
+    Parameters
+    ----------
+    names : list of str
+        Noise-model parameters, the columns of the means and samples
+    conditions : pd.DataFrame
+        One row per experimental condition, e.g. ``cell_viability[['Dose (uM)']]``
+    apply_noise : list of str
+        Parameters drawn from the log-normal population; the others are
+        their mean in every cell
+    fixed : dict, optional
+        Per-condition values, by parameter name, of parameters not in
+        ``x``, e.g. ``{'L_0': doses}``
+    log10_means : list of str
+        Parameters whose log10 means are ``x[0], x[1], ...``, in order
+    cv : list of str
+        Parameters whose coefficients of variation follow in ``x``
+    correlations : list of (str, str)
+        Parameter pairs whose correlations follow in ``x``
+    default_cv : float
+        Coefficient of variation of noisy parameters not in ``cv`` (Opt2Q's
+        default, 0.2)
+    sample_size : int
+        Cells per condition
+    seed : int, optional
+        Seed for the samples
+    sampling : str
+        ``'random'``: new normal draws on every :meth:`sample`;
+        ``'common'``: normal draws made once and reused; ``'sobol'``:
+        scrambled Sobol points, one scrambling per condition, made once
+        and reused
+    antithetic : bool
+        Make the second half of each condition's draws the negatives of
+        the first; ``sample_size`` must be even
+
+    Examples
+    --------
+    >>> template = ParameterTemplate(['kc0', 'kc2', 'kc3', 'L_0'], cell_viability[['Dose (uM)']],
+    ...                              apply_noise=['kc0', 'kc2', 'kc3'], fixed={'L_0': doses},
+    ...                              log10_means=['kc0', 'kc2', 'kc3'], cv=['kc2', 'kc3'],
+    ...                              correlations=[('kc2', 'kc3')])
+    >>> template.update(x)
+    >>> param_values = template.sample()     # (n_conditions * sample_size, 4)
+    """
+
+    def __init__(self, names, conditions, apply_noise=(), fixed=None, log10_means=(), cv=(), correlations=(),
+                 default_cv=0.2, sample_size=10, seed=None, sampling='random', antithetic=False):
+        if sampling not in SAMPLING:
+            raise ValueError('sampling must be one of %s' % ', '.join(SAMPLING))
+        if antithetic and sample_size % 2:
+            raise ValueError('antithetic sampling needs an even sample_size')
+        self.names = list(names)
+        self.conditions = conditions.reset_index(drop=True)
+        self.n_conditions = len(self.conditions)
+        self.sample_size = sample_size
+        self.sampling = sampling
+        self.antithetic = antithetic
+        index = {name: i for i, name in enumerate(self.names)}
+        self.noisy = np.array([index[name] for name in apply_noise], dtype=int)
+        noisy = {name: i for i, name in enumerate(apply_noise)}
+        self._means = np.array([index[name] for name in log10_means], dtype=int)
+        self._cv = np.array([noisy[name] for name in cv], dtype=int)
+        self._correlations = np.array([[noisy[a], noisy[b]] for a, b in correlations], dtype=int).reshape(-1, 2)
+        self.size = len(self._means) + len(self._cv) + len(self._correlations)
+        self._rng = np.random.default_rng(seed)
+
+        self.mean = np.zeros((self.n_conditions, len(self.names)))
+        for name, values in (fixed or {}).items():
+            self.mean[:, index[name]] = values
+        self.covariance = np.zeros((self.n_conditions, len(self.noisy), len(self.noisy)))
+        self._cv_values = np.full(len(self.noisy), float(default_cv))
+        self._correlation = np.eye(len(self.noisy))
+        # cells of condition c are rows c * sample_size ... (c + 1) * sample_size - 1
+        self.samples = np.empty((self.n_conditions * sample_size, len(self.names)))
+        self._normal = np.empty((self.n_conditions, sample_size, len(self.noisy)))
+        if sampling != 'random':
+            self._draw_normal()
+        conditions = self.conditions.loc[np.repeat(np.arange(self.n_conditions), sample_size)].reset_index(drop=True)
+        self.frame = pd.concat([pd.DataFrame(self.samples, columns=self.names, copy=False), conditions], axis=1)
+        self.frame['simulation'] = np.arange(len(self.samples))
+
+    def update(self, x):
+        """Write the means, coefficients of variation and correlations in ``x`` in place
+
+        Returns the number of entries of ``x`` used, :attr:`size`; the rest
+        (e.g. measurement model parameters) are the caller's.
+        """
+        x = np.asarray(x, dtype=float)
+        n_means, n_cv = len(self._means), len(self._cv)
+        self.mean[:, self._means] = 10 ** x[:n_means]
+        self._cv_values[self._cv] = x[n_means:n_means + n_cv]
+        i, j = self._correlations.T
+        self._correlation[i, j] = self._correlation[j, i] = x[n_means + n_cv:self.size]
+        sd = self.mean[:, self.noisy] * self._cv_values
+        np.multiply(sd[:, :, np.newaxis] * sd[:, np.newaxis, :], self._correlation, out=self.covariance)
+        return self.size
+
+    def sample(self):
+        """Draw ``sample_size`` cells per condition into :attr:`samples` and return it
+
+        Noisy parameters are multivariate log-normal with the condition's
+        mean and covariance: the normal in log space has covariance
+        ``log(1 + cov / (mean mean^T))`` and mean ``log(mean) - diag / 2``.
+        """
+        self.samples.reshape(self.n_conditions, self.sample_size, -1)[:] = self.mean[:, np.newaxis]
+        if not len(self.noisy):
+            return self.samples
+        mean = self.mean[:, self.noisy]
+        log_covariance = np.log1p(self.covariance / (mean[:, :, np.newaxis] * mean[:, np.newaxis, :]))
+        log_mean = np.log(mean) - np.diagonal(log_covariance, axis1=1, axis2=2) / 2
+        try:
+            factor = np.linalg.cholesky(log_covariance)
+        except np.linalg.LinAlgError:
+            # singular, e.g. a zero coefficient of variation or a correlation of +-1
+            values, vectors = np.linalg.eigh(log_covariance)
+            factor = vectors * np.sqrt(np.clip(values, 0, None))[:, np.newaxis, :]
+        if self.sampling == 'random':
+            self._draw_normal()
+        cells = np.exp(log_mean[:, np.newaxis] + np.matmul(self._normal, factor.swapaxes(1, 2)))
+        self.samples.reshape(self.n_conditions, self.sample_size, -1)[:, :, self.noisy] = cells
+        return self.samples
+
+    def _draw_normal(self):
+        """Standard normal draws behind the cells, in :attr:`_normal`"""
+        n = self.sample_size // 2 if self.antithetic else self.sample_size
+        shape = (self.n_conditions, n, len(self.noisy))
+        if self.sampling == 'sobol':
+            # Sobol points are balanced in blocks of powers of two; other sizes take the first n of the next block
+            m = max(int(np.ceil(np.log2(max(n, 1)))), 0)
+            points = np.array([qmc.Sobol(len(self.noisy), scramble=True, seed=self._rng).random_base2(m)[:n]
+                               for _ in range(self.n_conditions)]) if len(self.noisy) else np.empty(shape)
+            normal = scipy.special.ndtri(points.reshape(shape))
+        else:
+            normal = self._rng.standard_normal(shape)
+        if self.antithetic:
+            normal = np.concatenate([normal, -normal], axis=1)
+        self._normal[:] = normal
@@ -0,0 +1,197 @@
+"""Surrogate-assisted particle screening for PSO calibration.
+
+Every particle of every generation normally costs a simulation. A
+:class:`SurrogateScreen` keeps the (position, cost) pairs simulated so far
+and fits a Gaussian-process emulator to the most recent of them before each
+generation. Particles whose predicted cost is confidently worse than the cost
+they have to beat (their personal best) are not simulated; the rest, being
+either promising or too uncertain to judge, are passed to the real cost
+function. The screen is a ``bounded_cost_function`` for
+:class:`parallel_pso.ParallelPSO`, which counts the skipped particles in
+``n_aborted``.
+
+The emulator lives in the process that runs the swarm. Use it with the swarm
+evaluated in-process, e.g. one restart per worker through campaign, rather
+than with an executor that would scatter particles to copies of it.
+"""
+import numpy as np
+import scipy.linalg
+
+
+class GaussianProcess(object):
+    """Gaussian-process regression with a squared-exponential kernel
+
+    The signal variance is that of the training costs and the length scale
+    the one of ``length_scales`` (multiples of the median distance between
+    training points) with the highest marginal likelihood, so there is
+    nothing to tune per model.
+
+    Parameters
+    ----------
+    nugget : float
+        Noise added to the kernel diagonal, relative to the signal variance
+    length_scales : sequence of float
+        Candidate length scales, relative to the median distance
+    """
+
+    def __init__(self, nugget=1e-6, length_scales=(0.02, 0.05, 0.1, 0.2, 0.5, 1.0)):
+        self.nugget = nugget
+        self.length_scales = length_scales
+        self.x = None
+
+    def fit(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.mean = y.mean()
+        self.variance = max(y.var(), 1e-12)
+        square_distances = _square_distances(self.x, self.x)
+        median = np.sqrt(np.median(square_distances[np.triu_indices(len(self.x), 1)])) if len(self.x) > 1 else 1.0
+        best = -np.inf
+        for scale in self.length_scales:
+            length_scale = scale * (median or 1.0)
+            kernel = self.variance * np.exp(-0.5 * square_distances / length_scale ** 2)
+            kernel[np.diag_indices_from(kernel)] += self.nugget * self.variance
+            try:
+                factor = scipy.linalg.cho_factor(kernel, lower=True)
+            except np.linalg.LinAlgError:
+                # repeated positions (e.g. clipped to a bound) at a long length scale
+                continue
+            alpha = scipy.linalg.cho_solve(factor, y - self.mean)
+            # log marginal likelihood, up to a constant
+            likelihood = -0.5 * (y - self.mean).dot(alpha) - np.sum(np.log(np.diag(factor[0])))
+            if likelihood > best:
+                best = likelihood
+                self.length_scale, self._factor, self._alpha = length_scale, factor, alpha
+        if best == -np.inf:
+            raise np.linalg.LinAlgError('Kernel is singular at every length scale')
+        return self
+
+    def _kernel(self, x):
+        return self.variance * np.exp(-0.5 * _square_distances(x, self.x) / self.length_scale ** 2)
+
+    def predict(self, x):
+        """Mean and standard deviation of the cost at each row of ``x``"""
+        k = self._kernel(np.asarray(x, dtype=float))
+        mean = self.mean + k.dot(self._alpha)
+        v = scipy.linalg.cho_solve(self._factor, k.T)
+        variance = np.maximum(self.variance - np.sum(k.T * v, axis=0), 0.0)
+        return mean, np.sqrt(variance)
+
+
+def _square_distances(a, b):
+    return np.maximum(np.sum(a ** 2, 1)[:, None] + np.sum(b ** 2, 1)[None, :] - 2 * a.dot(b.T), 0.0)
+
+
+class SurrogateScreen(object):
+    """Simulate only the particles the emulator cannot rule out
+
+    Parameters
+    ----------
+    cost_function : callable
+        Batched cost function, (n_particles, n_dims) positions to costs. If
+        ``bounded`` it is a bounded cost function instead and receives the
+        bounds of the particles passed on to it.
+    bounded : bool
+        Whether ``cost_function`` takes bounds and returns (costs, completed)
+    kappa : float
+        A particle is skipped if its predicted cost minus ``kappa`` standard
+        deviations is still above its bound
+    min_points : int
+        Simulations collected before any particle is skipped
+    max_points : int
+        The emulator is fitted to the most recent simulations only
+
+    Attributes
+    ----------
+    n_real, n_skipped : int
+        Particles simulated and particles skipped
+    """
+
+    def __init__(self, cost_function, bounded=False, kappa=2.0, min_points=50, max_points=400,
+                 surrogate=None):
+        self.cost_function = cost_function
+        self.bounded = bounded
+        self.kappa = kappa
+        self.min_points = min_points
+        self.max_points = max_points
+        self.surrogate = surrogate or GaussianProcess()
+        self.x = []
+        self.y = []
+        self.n_real = 0
+        self.n_skipped = 0
+
+    def __call__(self, positions, bounds):
+        positions = np.asarray(positions, dtype=float)
+        bounds = np.asarray(bounds, dtype=float)
+        simulate = np.ones(len(positions), dtype=bool)
+        if len(self.y) >= self.min_points:
+            try:
+                self.surrogate.fit(np.array(self.x[-self.max_points:]), np.array(self.y[-self.max_points:]))
+            except np.linalg.LinAlgError:
+                pass
+            else:
+                mean, std = self.surrogate.predict(positions)
+                simulate = mean - self.kappa * std <= bounds
+
+        costs = np.full(len(positions), np.inf)
+        completed = np.zeros(len(positions), dtype=bool)
+        if simulate.any():
+            if self.bounded:
+                costs[simulate], completed[simulate] = self.cost_function(positions[simulate], bounds[simulate])
+            else:
+                costs[simulate] = self.cost_function(positions[simulate])
+                completed[simulate] = True
+        # only complete, finite costs are worth learning from
+        learn = completed & np.isfinite(costs)
+        self.x.extend(positions[learn])
+        self.y.extend(costs[learn])
+        del self.x[:-self.max_points], self.y[:-self.max_points]
+        self.n_real += int(simulate.sum())
+        self.n_skipped += int((~simulate).sum())
+        return costs, completed
+
+
+def compare_with_plain(make_optimizer, cost_function, seeds, num_particles, num_iterations, **screen_kwargs):
+    """Run each seed with and without a :class:`SurrogateScreen`
+
+    ``make_optimizer(seed)`` returns a configured ParallelPSO whose cost
+    function is then replaced by ``cost_function`` (batched), plain or
+    screened.
+
+    Returns
+    -------
+    dict
+        'plain' and 'screened' best costs per seed, 'solves' (real
+        simulations) of each, and 'saved', the simulations the screen skipped
+    """
+    report = {'plain': [], 'screened': [], 'solves_plain': 0, 'solves_screened': 0, 'saved': 0}
+    for seed in seeds:
+        optimizer = make_optimizer(seed)
+        optimizer.cost_function = optimizer.bounded_cost_function = None
+        optimizer.batch_cost_function = cost_function
+        optimizer.run(num_particles, num_iterations)
+        report['plain'].append(optimizer.best_fitness)
+        report['solves_plain'] += optimizer.n_evaluations
+
+        screen = SurrogateScreen(cost_function, **screen_kwargs)
+        optimizer = make_optimizer(seed)
+        optimizer.cost_function = optimizer.batch_cost_function = None
+        optimizer.bounded_cost_function = screen
+        optimizer.run(num_particles, num_iterations)
+        report['screened'].append(optimizer.best_fitness)
+        report['solves_screened'] += screen.n_real
+        report['saved'] += screen.n_skipped
+    return report
+
+
+if __name__ == '__main__':
+    import pso_necroptosis
+
+    report = compare_with_plain(pso_necroptosis.make_optimizer, pso_necroptosis.obj_function_batch,
+                                seeds=range(5), num_particles=25, num_iterations=100)
+    print('seed\tplain\tscreened')
+    for seed, (plain, screened) in enumerate(zip(report['plain'], report['screened'])):
+        print('%d\t%.4f\t%.4f' % (seed, plain, screened))
+    print('real solves: %d plain, %d screened (%d saved, %.0f%%)'
+          % (report['solves_plain'], report['solves_screened'], report['saved'],
+             100. * report['saved'] / report['solves_plain']))
@@ -0,0 +1,270 @@
+"""Chunked on-disk store of simulated trajectories.
+
+Analyses of a calibrated ensemble otherwise re-simulate every parameter set
+each time they run. A :class:`TrajectoryStore` keeps the trajectories in a
+directory instead::
+
+    necro_trajectories/
+        store.json                  observables, species count, dtype, fingerprint
+        tspan.npy
+        chunk-<time>-<pid>-<id>/    one per append
+            chunk.json              rows, variables, compression
+            index.npy               parameter set index of each row
+            param_values.npy
+            obs_MLKLp_obs.npy       (rows, n_times), one file per observable
+            species.npy             (rows, n_times, n_species), optional
+
+Every observable of a chunk is its own file, so reading one observable for
+some parameter sets touches only that observable's rows: uncompressed chunks
+are memory-mapped, compressed ones (``.npz``) decompress that one variable.
+Each append writes a new chunk to a hidden directory and renames it into
+place, so several processes can append to one store at the same time without
+locks and readers never see a partial chunk. A parameter set stored twice is
+read from the chunk appended last.
+
+A store only records parameter set indices, so trajectories of another
+parameter file, output times or model would be read back as if they were
+the current ones. :func:`fingerprint` hashes all three; a store created
+with one refuses to open with another.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+_MANIFEST = 'store.json'
+_FORMAT = 1
+
+
+def fingerprint(model, tspan, param_values):
+    """Hex digest identifying a model's reactions and observables, output times and parameter sets"""
+    digest = hashlib.sha256()
+    for r in model.reactions:
+        digest.update(repr((r['reactants'], r['products'], str(r['rate']))).encode())
+    for obs in model.observables:
+        digest.update(repr((obs.name, list(obs.species), list(obs.coefficients))).encode())
+    for array in (tspan, param_values):
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class TrajectoryStore(object):
+    """Directory of trajectory chunks, keyed by parameter set index
+
+    Opens the store at ``path``, creating it if ``observables`` and
+    ``tspan`` are given and it does not exist yet. Opening an existing store
+    with different observables, output times or fingerprint raises
+    ``ValueError``.
+
+    Parameters
+    ----------
+    path : str
+        Store directory
+    observables : list of str, optional
+        Observable names, needed to create the store
+    tspan : np.ndarray, optional
+        Output times, needed to create the store
+    n_species : int, optional
+        Species per trajectory; species trajectories are only stored if given
+    dtype : np.dtype
+        Storage type of the trajectories
+    compress : bool
+        Write chunks compressed (``.npz``) instead of memory-mappable ``.npy``
+    fingerprint : str, optional
+        :func:`fingerprint` of what the trajectories are simulated from,
+        recorded when the store is created and checked when it is opened
+
+    Examples
+    --------
+    >>> store = TrajectoryStore('necro_trajectories', observables=result.observable_names, tspan=tspan)
+    >>> store.append(np.arange(len(all_pars)), result)
+    >>> mlklp = store.observable('MLKLp_obs', [3, 17, 4000])
+    """
+
+    def __init__(self, path, observables=None, tspan=None, n_species=None, dtype=np.float64, compress=False,
+                 fingerprint=None):
+        self.path = path
+        self.compress = compress
+        manifest = os.path.join(path, _MANIFEST)
+        if not os.path.exists(manifest):
+            if observables is None or tspan is None:
+                raise ValueError('No trajectory store at %s; give observables and tspan to create one' % path)
+            self._create(list(observables), np.asarray(tspan, dtype=float), n_species, np.dtype(dtype),
+                         fingerprint)
+        with open(manifest) as f:
+            info = json.load(f)
+        self.observables = info['observables']
+        self.n_species = info['n_species']
+        self.dtype = np.dtype(info['dtype'])
+        self.fingerprint = info.get('fingerprint')
+        self.tspan = np.load(os.path.join(path, 'tspan.npy'))
+        if observables is not None and list(observables) != self.observables:
+            raise ValueError('Store %s holds observables %s' % (path, self.observables))
+        if tspan is not None and not np.array_equal(np.asarray(tspan, dtype=float), self.tspan):
+            raise ValueError('Store %s holds trajectories at different output times' % path)
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            raise ValueError('Store %s holds trajectories of another model or parameter sets' % path)
+        self._chunks = {}
+        self._rows = {}
+        self.refresh()
+
+    def _create(self, observables, tspan, n_species, dtype, fingerprint):
+        os.makedirs(self.path, exist_ok=True)
+        np.save(os.path.join(self.path, 'tspan.npy'), tspan)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'format': _FORMAT, 'observables': observables, 'n_species': n_species,
+                       'dtype': dtype.str, 'fingerprint': fingerprint}, f, indent=1)
+        # the first of several processes creating the store at once wins
+        try:
+            os.link(tmp, os.path.join(self.path, _MANIFEST))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+
+    def __getstate__(self):
+        # chunks, and their memory maps, are found again by the unpickled copy
+        state = self.__dict__.copy()
+        state['_chunks'], state['_rows'] = {}, {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.refresh()
+
+    def refresh(self):
+        """Pick up chunks appended since the store was opened or last refreshed"""
+        names = sorted(name for name in os.listdir(self.path) if name.startswith('chunk-'))
+        for name in names:
+            if name not in self._chunks:
+                with open(os.path.join(self.path, name, 'chunk.json')) as f:
+                    self._chunks[name] = json.load(f)
+                index = np.load(os.path.join(self.path, name, 'index.npy'))
+                self._chunks[name]['index'] = index
+        # later chunks take precedence
+        self._rows = {}
+        for name in names:
+            for row, i in enumerate(self._chunks[name]['index']):
+                self._rows[int(i)] = (name, row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, index):
+        return int(index) in self._rows
+
+    @property
+    def indices(self):
+        """Sorted indices of the stored parameter sets"""
+        return np.array(sorted(self._rows), dtype=int)
+
+    def append(self, indices, observables, species=None, param_values=None):
+        """Store the trajectories of the parameter sets ``indices``
+
+        Parameters
+        ----------
+        indices : array of int
+            Parameter set index of each trajectory
+        observables : mapping
+            (len(indices), n_times) trajectories by observable name, e.g.
+            an :class:`ensemble_result.EnsembleResult`'s ``observables``;
+            an EnsembleResult itself also gives its species and parameter
+            values
+        species : np.ndarray, optional
+            (len(indices), n_times, n_species) species trajectories
+        param_values : np.ndarray, optional
+            (len(indices), n_parameters) parameter values
+        """
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        if hasattr(observables, 'observable_view'):
+            result = observables
+            if species is None and self.n_species is not None:
+                species = result.species_array
+            if param_values is None:
+                param_values = result.param_values
+            observables = {name: result.observable_view(name) for name in self.observables}
+        variables = {}
+        for name in self.observables:
+            variables['obs_' + name] = self._check(observables[name], (len(indices), len(self.tspan)), name)
+        if self.n_species is not None:
+            if species is None:
+                raise ValueError('Store %s keeps species trajectories; species are required' % self.path)
+            variables['species'] = self._check(species, (len(indices), len(self.tspan), self.n_species), 'species')
+        if param_values is not None:
+            variables['param_values'] = np.asarray(param_values, dtype=float).reshape(len(indices), -1)
+
+        name = 'chunk-%016d-%d-%s' % (time.time() * 1e6, os.getpid(), uuid.uuid4().hex[:8])
+        tmp = tempfile.mkdtemp(dir=self.path, prefix='.' + name)
+        np.save(os.path.join(tmp, 'index.npy'), indices)
+        if self.compress:
+            np.savez_compressed(os.path.join(tmp, 'data.npz'), **variables)
+        else:
+            for key, value in variables.items():
+                np.save(os.path.join(tmp, key + '.npy'), value)
+        with open(os.path.join(tmp, 'chunk.json'), 'w') as f:
+            json.dump({'rows': len(indices), 'variables': sorted(variables), 'compressed': self.compress}, f)
+        os.rename(tmp, os.path.join(self.path, name))
+        self.refresh()
+        return name
+
+    def _check(self, values, shape, name):
+        values = np.asarray(values, dtype=self.dtype)
+        if values.shape != shape:
+            raise ValueError('%s has shape %s, expected %s' % (name, values.shape, shape))
+        return values
+
+    def _variable(self, chunk, key):
+        info = self._chunks[chunk]
+        if key not in info['variables']:
+            raise KeyError('%s was not stored in %s' % (key, chunk))
+        if info['compressed']:
+            with np.load(os.path.join(self.path, chunk, 'data.npz')) as data:
+                return data[key]
+        # kept open: reading rows of a memory map only reads those rows
+        cache = info.setdefault('maps', {})
+        if key not in cache:
+            cache[key] = np.load(os.path.join(self.path, chunk, key + '.npy'), mmap_mode='r')
+        return cache[key]
+
+    def _read(self, key, indices, shape):
+        indices = self.indices if indices is None else np.asarray(indices, dtype=int).reshape(-1)
+        missing = [i for i in indices if int(i) not in self._rows]
+        if missing:
+            raise KeyError('Parameter sets not in the store: %s' % missing[:10])
+        locations = [self._rows[int(i)] for i in indices]
+        chunks = np.array([chunk for chunk, _ in locations])
+        rows = np.array([row for _, row in locations], dtype=int)
+        out = None
+        for chunk in np.unique(chunks):
+            positions = np.flatnonzero(chunks == chunk)
+            values = self._variable(chunk, key)
+            if out is None:
+                out = np.empty((len(indices),) + values.shape[1:], dtype=values.dtype)
+            out[positions] = values[rows[positions]]
+        if out is None:
+            out = np.empty((0,) + shape, dtype=self.dtype)
+        return out
+
+    def observable(self, name, indices=None):
+        """(len(indices), n_times) trajectories of one observable, every stored set by default"""
+        if name not in self.observables:
+            raise KeyError(name)
+        return self._read('obs_' + name, indices, (len(self.tspan),))
+
+    def __getitem__(self, name):
+        return self.observable(name)
+
+    def species(self, indices=None):
+        """(len(indices), n_times, n_species) species trajectories"""
+        return self._read('species', indices, (len(self.tspan), self.n_species or 0))
+
+    def param_values(self, indices=None):
+        """(len(indices), n_parameters) parameter values the trajectories were simulated with"""
+        return self._read('param_values', indices, (0,))
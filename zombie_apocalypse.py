@@ -1,9 +1,6 @@
 # zombie apocalypse modeling
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.integrate import odeint
-plt.ion()
-plt.rcParams['figure.figsize'] = 10, 8
 
 P = 0      # birth rate
 d = 0.0001  # natural death percent (per day)
@@ -34,55 +31,60 @@ R0 = 0                 # initial death population
 y0 = [S0, Z0, R0]     # initial condition vector
 t  = np.linspace(0, 5., 1000)         # time grid
 
-# solve the DEs
-soln = odeint(f, y0, t)
-S = soln[:, 0]
-Z = soln[:, 1]
-R = soln[:, 2]
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    plt.ion()
+    plt.rcParams['figure.figsize'] = 10, 8
 
-# plot results
-plt.figure()
-plt.plot(t, S, label='Living')
-plt.plot(t, Z, label='Zombies')
-plt.xlabel('Days from outbreak')
-plt.ylabel('Population')
-plt.title('Zombie Apocalypse - No Init. Dead Pop.; No New Births.')
-plt.legend(loc=0)
+    # solve the DEs
+    soln = odeint(f, y0, t)
+    S = soln[:, 0]
+    Z = soln[:, 1]
+    R = soln[:, 2]
 
-# change the initial conditions
-R0 = 0.01*S0   # 1% of initial pop is dead
-y0 = [S0, Z0, R0]
+    # plot results
+    plt.figure()
+    plt.plot(t, S, label='Living')
+    plt.plot(t, Z, label='Zombies')
+    plt.xlabel('Days from outbreak')
+    plt.ylabel('Population')
+    plt.title('Zombie Apocalypse - No Init. Dead Pop.; No New Births.')
+    plt.legend(loc=0)
 
-# solve the DEs
-soln = odeint(f, y0, t)
-S = soln[:, 0]
-Z = soln[:, 1]
-R = soln[:, 2]
+    # change the initial conditions
+    R0 = 0.01*S0   # 1% of initial pop is dead
+    y0 = [S0, Z0, R0]
 
-plt.figure()
-plt.plot(t, S, label='Living')
-plt.plot(t, Z, label='Zombies')
-plt.xlabel('Days from outbreak')
-plt.ylabel('Population')
-plt.title('Zombie Apocalypse - 1% Init. Pop. is Dead; No New Births.')
-plt.legend(loc=0)
+    # solve the DEs
+    soln = odeint(f, y0, t)
+    S = soln[:, 0]
+    Z = soln[:, 1]
+    R = soln[:, 2]
 
-# change the initial conditions
-R0 = 0.01*S0   # 1% of initial pop is dead
-P  = 10        # 10 new births daily
-y0 = [S0, Z0, R0]
+    plt.figure()
+    plt.plot(t, S, label='Living')
+    plt.plot(t, Z, label='Zombies')
+    plt.xlabel('Days from outbreak')
+    plt.ylabel('Population')
+    plt.title('Zombie Apocalypse - 1% Init. Pop. is Dead; No New Births.')
+    plt.legend(loc=0)
 
-# solve the DEs
-soln = odeint(f, y0, t)
-S = soln[:, 0]
-Z = soln[:, 1]
-R = soln[:, 2]
+    # change the initial conditions
+    R0 = 0.01*S0   # 1% of initial pop is dead
+    P  = 10        # 10 new births daily
+    y0 = [S0, Z0, R0]
 
-plt.figure()
-plt.plot(t, S, label='Living')
-plt.plot(t, Z, label='Zombies')
-plt.xlabel('Days from outbreak')
-plt.ylabel('Population')
-plt.title('Zombie Apocalypse - 1% Init. Pop. is Dead; 10 Daily Births')
-plt.legend(loc=0)
-plt.show()
\ No newline at end of file
+    # solve the DEs
+    soln = odeint(f, y0, t)
+    S = soln[:, 0]
+    Z = soln[:, 1]
+    R = soln[:, 2]
+
+    plt.figure()
+    plt.plot(t, S, label='Living')
+    plt.plot(t, Z, label='Zombies')
+    plt.xlabel('Days from outbreak')
+    plt.ylabel('Population')
+    plt.title('Zombie Apocalypse - 1% Init. Pop. is Dead; 10 Daily Births')
+    plt.legend(loc=0)
+    plt.show()